@@ -1,11 +1,15 @@
 import pandas as pd
 import numpy as np
-import sqlite3
-from borsdata_api.constants import DB_FILE_MONTHLY
+from helpers.queries import load_prices, load_reports
+from helpers.storage import get_storage
 
-# Connect to the SQLite database for monthly data
-def connect_db():
-    return sqlite3.connect(DB_FILE_MONTHLY)
+# Report columns used by the factors
+REPORT_FACTOR_COLUMNS = ['ins_id', 'report_start_date', 'revenues', 'gross_income', 'operating_income',
+                         'earnings_per_share', 'number_of_shares']
+
+# Monthly data from the SQLite database or Parquet datasets, depending on BORSDATA_STORAGE
+def connect_db(read_only=False):
+    return get_storage('monthly', read_only=read_only)
 
 def calculate_rolling_factors(report_df):
     # Ensure 'report_start_date' is in datetime format
@@ -47,18 +51,17 @@ def rank_factors(df):
     return df
 
 def save_rankings_to_db(df):
-    conn = connect_db()
+    storage = connect_db()
     ranking_df = df[['ins_id', 'date', 'size_rank', 'value_rank', 'profitability_rank', 'momentum_rank', 'volatility_rank']]
-    ranking_df.to_sql('factor_rankings', conn, if_exists='replace', index=False)
-    conn.close()
-    print("Factor rankings saved to database.")
+    storage.write('factor_rankings', ranking_df)
+    print("Factor rankings saved.")
 
 def main():
-    conn = connect_db()
+    storage = connect_db(read_only=True)
     
-    # Read monthly price and report data from the database
-    price_df = pd.read_sql_query("SELECT * FROM monthly_price_data", conn)
-    report_df = pd.read_sql_query("SELECT * FROM monthly_report_data", conn)
+    # Read the monthly price and report columns used by the factors
+    price_df = load_prices(columns=['close'], period='month', storage=storage)
+    report_df = load_reports(columns=REPORT_FACTOR_COLUMNS, database='monthly', storage=storage)
     
     # Calculate rolling factors and rank them
     rolling_report_df = calculate_rolling_factors(report_df)
@@ -68,7 +71,5 @@ def main():
     # Save the ranked factors to the database
     save_rankings_to_db(ranked_df)
 
-    conn.close()
-
 if __name__ == "__main__":
     main()
@@ -9,21 +9,23 @@ import pandas as pd
 from datetime import datetime
 import openpyxl
 from openpyxl.drawing.image import Image
-from helpers.db_utils import connect_db
+from helpers.queries import load_prices, load_rankings, memory_mb
+from helpers.storage import get_storage
 from calculate_returns import calculate_portfolio_returns
 from calculate_metrics import calculate_performance_metrics
 from save_results import save_results_to_excel
 
 def main():
-    conn = connect_db()
+    storage = get_storage('monthly', read_only=True)
 
-    factor_df = pd.read_sql_query("SELECT * FROM factor_rankings", conn)
-    price_df = pd.read_sql_query("SELECT ins_id, date, close FROM monthly_price_data", conn)
+    factor_df = load_rankings(storage=storage)
+    price_df = load_prices(columns=['close'], period='month', storage=storage)
 
     factor_df['date'] = pd.to_datetime(factor_df['date'])
     price_df['date'] = pd.to_datetime(price_df['date'])
 
     df = pd.merge(factor_df, price_df, on=['ins_id', 'date'])
+    print(f"Backtest frame: {len(df)} rows, {memory_mb(df):.1f} MB")
 
     output_dir = 'output'
     os.makedirs(output_dir, exist_ok=True)
@@ -63,7 +65,6 @@ def main():
 
     writer.book.save(output_file)
     writer.close()
-    conn.close()
 
 if __name__ == "__main__":
     main()
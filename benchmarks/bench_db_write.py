@@ -0,0 +1,133 @@
+"""
+Benchmark of writing price and report rows to SQLite.
+Compares the former row-by-row writer (a connection per instrument, one
+INSERT per df.iterrows() row) with BulkWriter (executemany over one
+connection and one transaction) on a synthetic universe, 20 years x 2000
+instruments by default. The row-by-row writer is timed on a subset and
+reported as rows/s.
+
+    python benchmarks/bench_db_write.py --instruments 2000 --years 20 --legacy-instruments 20
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from create_db import create_tables
+from helpers.db_writer import BulkWriter, REPORT_COLUMNS
+
+
+def price_frame(years, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end="2024-06-28", periods=years * 261)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+    return pd.DataFrame({
+        'date': dates.strftime('%Y-%m-%d'), 'open': close * 0.99, 'high': close * 1.01, 'low': close * 0.98,
+        'close': close, 'volume': rng.integers(1000, 2000000, len(dates)).astype(float),
+    })
+
+
+def report_frame(years, seed=0):
+    # camelCase columns, as returned by get_instrument_reports
+    rng = np.random.default_rng(seed)
+    periods = [(year, period) for year in range(2024 - years, 2024) for period in (1, 2, 3, 4)]
+    columns = [re.sub(r'_([a-z])', lambda m: m.group(1).upper(), col) for col in REPORT_COLUMNS]
+    df = pd.DataFrame(rng.uniform(0, 1000, (len(periods), len(columns))), columns=columns)
+    df['year'] = [year for year, _ in periods]
+    df['period'] = [period for _, period in periods]
+    end = pd.to_datetime([f"{year}-{3 * period:02d}-28" for year, period in periods])
+    df['reportStartDate'] = (end - pd.DateOffset(months=3)).strftime('%Y-%m-%d')
+    df['reportEndDate'] = end.strftime('%Y-%m-%d')
+    df['reportDate'] = (end + pd.Timedelta(days=45)).strftime('%Y-%m-%d')
+    df['brokenFiscalYear'] = False
+    df['currency'] = 'SEK'
+    return df
+
+
+def legacy_save_price_data_to_db(db_file, df, ins_id):
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    for index, row in df.iterrows():
+        cursor.execute('''
+            INSERT OR REPLACE INTO price_data (ins_id, date, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (ins_id, row['date'], row['open'], row['high'], row['low'], row['close'], row['volume']))
+    conn.commit()
+    conn.close()
+
+
+def legacy_save_report_data_to_db(db_file, df, ins_id):
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    columns = [re.sub(r'_([a-z])', lambda m: m.group(1).upper(), col) for col in REPORT_COLUMNS]
+    for index, row in df.iterrows():
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO report_data (ins_id, {", ".join(REPORT_COLUMNS)})
+            VALUES ({", ".join(["?"] * (len(REPORT_COLUMNS) + 1))})
+        ''', (ins_id, *[row.get(col, None) for col in columns]))
+    conn.commit()
+    conn.close()
+
+
+def new_db(directory, name):
+    db_file = os.path.join(directory, name)
+    conn = sqlite3.connect(db_file)
+    create_tables(conn)
+    conn.close()
+    return db_file
+
+
+def run_legacy(db_file, prices, reports, instruments):
+    for ins_id in range(1, instruments + 1):
+        legacy_save_price_data_to_db(db_file, prices, ins_id)
+        legacy_save_report_data_to_db(db_file, reports, ins_id)
+
+
+def run_bulk(db_file, prices, reports, instruments, commit_every):
+    with BulkWriter(db_file) as writer:
+        for ins_id in range(1, instruments + 1):
+            writer.write_prices(prices, ins_id)
+            writer.write_reports(reports, ins_id)
+            if ins_id % commit_every == 0:
+                writer.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--instruments", type=int, default=2000)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--legacy-instruments", type=int, default=20,
+                        help="Instruments written with the row-by-row writer, 0 to skip it")
+    parser.add_argument("--commit-every", type=int, default=50,
+                        help="Instruments per BulkWriter transaction, like one instList batch in main.py")
+    args = parser.parse_args()
+
+    prices = price_frame(args.years)
+    reports = report_frame(args.years)
+    rows_per_instrument = len(prices) + len(reports)
+    runs = [("bulk", "bulk.db", args.instruments,
+             lambda db_file: run_bulk(db_file, prices, reports, args.instruments, args.commit_every))]
+    if args.legacy_instruments:
+        runs.insert(0, ("iterrows", "legacy.db", args.legacy_instruments,
+                        lambda db_file: run_legacy(db_file, prices, reports, args.legacy_instruments)))
+    with tempfile.TemporaryDirectory() as directory:
+        for name, db_name, instruments, run in runs:
+            db_file = new_db(directory, db_name)
+            start = time.perf_counter()
+            run(db_file)
+            seconds = time.perf_counter() - start
+            rows = rows_per_instrument * instruments
+            print(f"{name:>8}: {instruments:5d} instruments, {rows:9d} rows in {seconds:7.2f}s, "
+                  f"{rows / seconds:10.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
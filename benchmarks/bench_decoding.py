@@ -0,0 +1,83 @@
+"""
+Benchmark of BorsdataAPI price decoding: pd.json_normalize vs fast_decode=True.
+Runs offline against a synthetic instruments/stockprices payload.
+
+    python benchmarks/bench_decoding.py --instruments 50 --days 5000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from borsdata_api.borsdata_api import BorsdataAPI
+
+
+class PayloadTransport:
+    """
+    Stand-in for BorsdataTransport that always returns the same payload
+    """
+    class Response:
+        def __init__(self, url, content):
+            self.url = url
+            self.content = content
+
+    def __init__(self, content):
+        self._content = content
+
+    def get(self, url, params=None):
+        return self.Response(url, self._content)
+
+
+def make_payload(instruments, days, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2000-01-03", periods=days).strftime("%Y-%m-%d").tolist()
+    array_list = []
+    for ins_id in range(1, instruments + 1):
+        close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.01, days))), 2)
+        volume = rng.integers(1000, 1000000, days)
+        array_list.append({
+            "instrument": ins_id,
+            "stockPricesList": [
+                {"d": d, "h": c * 1.01, "l": c * 0.99, "c": c, "o": c, "v": int(v)}
+                for d, c, v in zip(dates, close.tolist(), volume.tolist())
+            ],
+        })
+    return json.dumps({"stockPricesArrayList": array_list}).encode()
+
+
+def bench(api, instruments, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = api.get_instrument_stock_prices_list(list(range(1, instruments + 1)), fill_na=False)
+        best = min(best, time.perf_counter() - start)
+    return df, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--instruments", type=int, default=50)
+    parser.add_argument("--days", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = make_payload(args.instruments, args.days)
+    print(f"Payload: {len(content) / 1e6:.1f} MB, {args.instruments * args.days} rows")
+    results = {}
+    for name, fast_decode in [("json_normalize", False), ("fast_decode", True)]:
+        api = BorsdataAPI("bench", transport=PayloadTransport(content), fast_decode=fast_decode)
+        df, seconds = bench(api, args.instruments, args.repeat)
+        results[name] = df
+        print(f"{name:>15}: {seconds:.3f}s, {len(df) / seconds:,.0f} rows/s")
+    pd.testing.assert_frame_equal(results["json_normalize"][results["fast_decode"].columns],
+                                  results["fast_decode"], check_dtype=False)
+
+
+if __name__ == "__main__":
+    main()
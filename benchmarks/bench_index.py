@@ -0,0 +1,135 @@
+"""
+Benchmark of the chain-linked indices: a full build with IndexBuilder vs
+update_indices appending one date at a time, on a synthetic universe with
+no-trade gaps and delistings in a temporary database. Checks that a
+constituent's move over a gap counts when it trades again, and that the
+updates give the same levels as the full build.
+
+    python benchmarks/bench_index.py --instruments 300 --years 5 --updates 60
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+os.environ["BORSDATA_QUERY_CACHE"] = "0"
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from create_db import create_tables
+from helpers import price_panel
+from helpers.db_utils import get_connection
+from helpers.db_writer import BulkWriter
+from helpers.index_builder import IndexBuilder, update_indices
+from helpers.storage import SQLiteStorage
+
+
+def write_prices(db_file, close, dates):
+    # close: (dates x instruments) with NaN where an instrument does not trade, ins_id = column + 1
+    with BulkWriter(db_file) as writer:
+        for column in range(close.shape[1]):
+            traded = ~np.isnan(close[:, column])
+            if traded.any():
+                price = close[traded, column]
+                writer.write_prices(pd.DataFrame({
+                    "date": dates[traded].strftime("%Y-%m-%d"), "open": price, "high": price, "low": price,
+                    "close": price, "volume": 1000.0,
+                }), ins_id=column + 1)
+
+
+def write_shares(db_file, instruments):
+    with BulkWriter(db_file) as writer:
+        writer.write_reports(pd.DataFrame({
+            "ins_id": np.arange(1, instruments + 1), "year": 2000, "period": 4, "number_of_shares": 1e6,
+            "report_start_date": "2000-01-01", "report_end_date": "2000-12-31",
+        }))
+
+
+def storage_with(directory, name, close, dates):
+    db_file = os.path.join(directory, f"{name}.db")
+    create_tables(get_connection(db_file))
+    write_prices(db_file, close, dates)
+    write_shares(db_file, close.shape[1])
+    return db_file, SQLiteStorage(db_file)
+
+
+def universe(instruments, years, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end="2024-06-28", periods=years * 261)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (len(dates), instruments)), axis=0))
+    # no-trade days, late listings and delistings
+    close[rng.random(close.shape) < 0.03] = np.nan
+    listed = rng.integers(0, len(dates) // 2, instruments)
+    delisted = np.where(rng.random(instruments) < 0.3, rng.integers(len(dates) // 2, len(dates), instruments),
+                        len(dates))
+    rows = np.arange(len(dates))[:, None]
+    close[(rows < listed) | (rows >= delisted)] = np.nan
+    return close, dates
+
+
+def check_gap(directory):
+    # 0.5 / 0.5 book rebalanced at the end of January: B does not trade on Feb 5 and gains 50% on Feb 6
+    dates = pd.bdate_range("2024-01-02", "2024-02-29")
+    close = np.full((len(dates), 2), 10.0)
+    close[dates.get_loc(pd.Timestamp("2024-02-05")), 1] = np.nan
+    close[dates >= pd.Timestamp("2024-02-06"), 1] = 15.0
+    db_file, storage = storage_with(directory, "gap", close, dates)
+    full = IndexBuilder(storage, lookback_period=5).build().set_index("date")["equal_weighted_index"]
+    assert np.isclose(full[pd.Timestamp("2024-02-06")], 125), full[pd.Timestamp("2024-02-06")]
+
+    # the same dates appended one at a time
+    cut = dates <= pd.Timestamp("2024-02-01")
+    db_file, storage = storage_with(directory, "gap_update", np.where(cut[:, None], close, np.nan), dates)
+    update_indices(storage, "price_data", "daily", "index_data", 5)
+    for row in np.flatnonzero(~cut):
+        write_prices(db_file, close[row:row + 1], dates[row:row + 1])
+        update_indices(storage, "price_data", "daily", "index_data", 5)
+    updated = storage.read("index_data")
+    updated = updated.set_index(pd.to_datetime(updated["date"]))["equal_weighted_index"]
+    assert np.allclose(updated.to_numpy(), full.to_numpy(), equal_nan=True), (updated, full)
+    print("Gap: B's move over its no-trade day counts in the full build and in the updates (125.0)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--instruments", type=int, default=300)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--updates", type=int, default=60, help="Number of dates appended one at a time")
+    parser.add_argument("--rebalance", default="month")
+    parser.add_argument("--cap", type=float, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        price_panel.PANEL_PATH = os.path.join(directory, "panel")
+        check_gap(directory)
+
+        close, dates = universe(args.instruments, args.years)
+        db_file, storage = storage_with(directory, "full", close, dates)
+        start = time.time()
+        full = IndexBuilder(storage, lookback_period=252, frequency=args.rebalance, cap=args.cap).build(erc=True)
+        full_seconds = time.time() - start
+
+        cut = len(dates) - args.updates
+        db_file, storage = storage_with(directory, "update", close[:cut], dates[:cut])
+        update_indices(storage, "price_data", "daily", "index_data", 252, erc=True, frequency=args.rebalance,
+                       cap=args.cap)
+        start = time.time()
+        for row in range(cut, len(dates)):
+            write_prices(db_file, close[row:row + 1], dates[row:row + 1])
+            update_indices(storage, "price_data", "daily", "index_data", 252, erc=True, frequency=args.rebalance,
+                           cap=args.cap)
+        update_seconds = (time.time() - start) / args.updates
+
+        updated = storage.read("index_data")
+        updated["date"] = pd.to_datetime(updated["date"])
+        for column in full.columns[1:]:
+            assert np.allclose(updated[column].astype(float), full[column], rtol=1e-9, equal_nan=True), column
+        print(f"{args.instruments} instruments x {len(dates)} dates: full build {full_seconds:.2f}s, "
+              f"update {update_seconds * 1000:.0f}ms per date, same levels")
+
+
+if __name__ == "__main__":
+    main()
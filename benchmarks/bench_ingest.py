@@ -0,0 +1,71 @@
+"""
+Benchmark of API ingest throughput against the offline stub server.
+Compares serial, async and batched fetching of prices and reports.
+
+    python benchmarks/bench_ingest.py --instruments 100 --latency 0.05 --rate 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from borsdata_api.async_api import AsyncBorsdataAPI
+from borsdata_api.borsdata_api import BorsdataAPI
+from borsdata_api.rate_limiter import TokenBucket
+from borsdata_api.stub_server import start_server_thread
+
+
+def run_serial(url_root, ins_ids, rate):
+    api = BorsdataAPI("bench", url_root=url_root, rate_limiter=TokenBucket(rate, rate), fast_decode=True)
+    for ins_id in ins_ids:
+        api.get_instrument_stock_prices(ins_id)
+        api.get_instrument_reports(ins_id)
+
+
+def run_async(url_root, ins_ids, rate, max_in_flight):
+    async def fetch():
+        async with AsyncBorsdataAPI("bench", max_in_flight=max_in_flight, url_root=url_root,
+                                    rate_limiter=TokenBucket(rate, rate), fast_decode=True) as api:
+            await api.get_instruments_stock_prices(ins_ids)
+            await api.get_instruments_reports(ins_ids)
+    asyncio.run(fetch())
+
+
+def run_batched(url_root, ins_ids, rate):
+    api = BorsdataAPI("bench", url_root=url_root, rate_limiter=TokenBucket(rate, rate), fast_decode=True)
+    api.get_instrument_stock_prices_list(ins_ids)
+    api.get_instrument_report_list(ins_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--instruments", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="Server latency per request in seconds")
+    parser.add_argument("--rate", type=float, default=10, help="Client rate limit in requests per second")
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    args = parser.parse_args()
+
+    server, url_root = start_server_thread(port=0, instruments=args.instruments, latency=args.latency)
+    ins_ids = list(range(1, args.instruments + 1))
+    runs = [
+        ("serial", lambda: run_serial(url_root, ins_ids, args.rate)),
+        ("async", lambda: run_async(url_root, ins_ids, args.rate, args.max_in_flight)),
+        ("batched", lambda: run_batched(url_root, ins_ids, args.rate)),
+    ]
+    results = []
+    for name, run in runs:
+        requests_before = server.stub_state.requests
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        results.append((name, seconds, server.stub_state.requests - requests_before))
+    server.shutdown()
+    for name, seconds, requests in results:
+        print(f"{name:>8}: {seconds:7.2f}s, {requests:5d} requests, {args.instruments / seconds:8.1f} instruments/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,17 @@
+from .borsdata_api import BorsdataAPI
+from .async_api import AsyncBorsdataAPI
+from .cache import ResponseCache
+from .metrics import ApiMetrics
+from .rate_limiter import TokenBucket, FileTokenBucket
+from .transport import BorsdataAPIError, BorsdataTransport
 
+__all__ = [
+    'BorsdataAPI',
+    'AsyncBorsdataAPI',
+    'ResponseCache',
+    'ApiMetrics',
+    'TokenBucket',
+    'FileTokenBucket',
+    'BorsdataAPIError',
+    'BorsdataTransport',
+]
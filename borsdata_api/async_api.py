@@ -0,0 +1,126 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from .borsdata_api import BorsdataAPI
+from .constants import API_KEY, API_URL_ROOT, API_CALLS_PER_SECOND, API_BURST, RATE_LIMIT_FILE
+from .rate_limiter import FileTokenBucket
+from .transport import BorsdataTransport
+
+
+class AsyncBorsdataAPI:
+    """
+    asyncio counterpart of BorsdataAPI.
+    Every get_* method of BorsdataAPI is available as a coroutine returning the
+    same pd.DataFrame(s). Calls run on a pooled session in a bounded thread
+    pool: at most `max_in_flight` requests are outstanding, and all of them
+    draw from one rate limiter so concurrency never exceeds the API quota.
+    """
+    def __init__(self, _api_key=API_KEY, max_in_flight=8, timeout=(5, 60), max_retries=5, rate_limiter=None,
+                 cache=None, fast_decode=False, url_root=API_URL_ROOT, metrics=None):
+        """
+        :param _api_key: Borsdata API key
+        :param max_in_flight: Max. number of concurrent requests
+        :param timeout: (connect, read) timeout in seconds
+        :param max_retries: Max. number of retries for 429/5xx responses and connection errors
+        :param rate_limiter: Optional limiter shared with other clients, defaults to a FileTokenBucket on
+                             RATE_LIMIT_FILE shared by all scripts on this host
+        :param cache: Optional ResponseCache
+        :param fast_decode: True to use the column-wise decoder (see decoding.py)
+        :param url_root: API root URL
+        :param metrics: Optional ApiMetrics, e.g. shared with a BorsdataAPI; available as self.metrics
+        """
+        if rate_limiter is None:
+            rate_limiter = FileTokenBucket(RATE_LIMIT_FILE, API_CALLS_PER_SECOND, API_BURST)
+        self.max_in_flight = max_in_flight
+        self._transport = BorsdataTransport(timeout=timeout, max_retries=max_retries, pool_maxsize=max_in_flight,
+                                            rate_limiter=rate_limiter)
+        self._api = BorsdataAPI(_api_key, transport=self._transport, cache=cache, fast_decode=fast_decode,
+                                url_root=url_root, metrics=metrics)
+        self.metrics = self._api.metrics
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="borsdata")
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._transport.close()
+
+    async def _run(self, func, *args, **kwargs):
+        """
+        Run a blocking BorsdataAPI call in the executor, bounded by max_in_flight
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def gather(self, method, ins_ids, *args, return_exceptions=False, **kwargs):
+        """
+        Call a per-instrument method for every ins_id concurrently
+        :param method: Name of the method, e.g. 'get_instrument_stock_prices'
+        :param ins_ids: List of instrument IDs, passed as first argument
+        :param return_exceptions: True to return exceptions as values instead of raising the first one
+        :return: dict {ins_id: result}
+        """
+        func = getattr(self._api, method)
+        results = await asyncio.gather(*[self._run(func, ins_id, *args, **kwargs) for ins_id in ins_ids],
+                                       return_exceptions=return_exceptions)
+        return dict(zip(ins_ids, results))
+
+    async def get_instruments_stock_prices(self, ins_ids, from_date=None, to_date=None, return_exceptions=False):
+        """
+        Get stock prices for a list of instruments
+        :param ins_ids: Instrument ID list
+        :param from_date: Start date in string format, e.g. '2000-01-01'
+        :param to_date: Stop date in string format, e.g. '2000-01-01'
+        :param return_exceptions: True to return exceptions as values instead of raising the first one
+        :return: dict {ins_id: pd.DataFrame}, same shape as get_instrument_stock_prices
+        """
+        return await self.gather("get_instrument_stock_prices", ins_ids, from_date=from_date, to_date=to_date,
+                                 return_exceptions=return_exceptions)
+
+    async def get_instruments_reports(self, ins_ids, return_exceptions=False):
+        """
+        Get all report data for a list of instruments
+        :param ins_ids: Instrument ID list
+        :param return_exceptions: True to return exceptions as values instead of raising the first one
+        :return: dict {ins_id: [pd.DataFrame quarter, pd.DataFrame year, pd.DataFrame r12]}
+        """
+        return await self.gather("get_instrument_reports", ins_ids, return_exceptions=return_exceptions)
+
+    async def get_kpi_histories(self, ins_ids, kpi_id, report_type, price_type, max_count=None,
+                                return_exceptions=False):
+        """
+        Get KPI history for a list of instruments
+        :param ins_ids: Instrument ID list
+        :param kpi_id: KPI ID
+        :param report_type: ['quarter', 'year', 'r12']
+        :param price_type: ['mean', 'high', 'low']
+        :param max_count: Max. number of history (quarters/years) to get
+        :param return_exceptions: True to return exceptions as values instead of raising the first one
+        :return: dict {ins_id: pd.DataFrame}
+        """
+        return await self.gather("get_kpi_history", ins_ids, kpi_id, report_type, price_type, max_count=max_count,
+                                 return_exceptions=return_exceptions)
+
+
+def _make_async_method(name):
+    func = getattr(BorsdataAPI, name)
+
+    @functools.wraps(func)
+    async def method(self, *args, **kwargs):
+        return await self._run(getattr(self._api, name), *args, **kwargs)
+    return method
+
+
+# mirror every public get_* method of BorsdataAPI as a coroutine
+for _name in dir(BorsdataAPI):
+    if _name.startswith("get_") and not hasattr(AsyncBorsdataAPI, _name):
+        setattr(AsyncBorsdataAPI, _name, _make_async_method(_name))
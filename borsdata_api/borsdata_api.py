@@ -1,19 +1,52 @@
-import requests
-import pandas as pd
+import functools
+import json
+import threading
 import time
-from .constants import API_KEY  # Corrected import
+import pandas as pd
+from . import decoding
+from .constants import (API_KEY, API_URL_ROOT, API_CALLS_PER_SECOND, API_BURST, MAX_INST_LIST,  # Corrected import
+                        RATE_LIMIT_FILE)
+from .metrics import ApiMetrics, endpoint_template
+from .rate_limiter import FileTokenBucket
+from .transport import BorsdataTransport
 
 # pandas options for string representation of data frames (print)
 pd.set_option("display.max_columns", None)
 pd.set_option("display.max_rows", None)
 
 class BorsdataAPI:
-    def __init__(self, _api_key=API_KEY):
+    def __init__(self, _api_key=API_KEY, timeout=(5, 60), max_retries=5, transport=None, rate_limiter=None,
+                 cache=None, fast_decode=False, url_root=API_URL_ROOT, metrics=None):
+        """
+        :param _api_key: Borsdata API key
+        :param timeout: (connect, read) timeout in seconds
+        :param max_retries: Max. number of retries for 429/5xx responses and connection errors
+        :param transport: Optional BorsdataTransport, e.g. to share one connection pool between instances
+        :param rate_limiter: Optional limiter with an acquire() method, e.g. a TokenBucket shared between
+                             threads or a FileTokenBucket shared between processes.
+                             Defaults to a FileTokenBucket on RATE_LIMIT_FILE at API_CALLS_PER_SECOND, so
+                             all scripts on this host share the quota of the API key.
+        :param cache: Optional ResponseCache, responses are served from disk while still fresh
+        :param fast_decode: True to decode price and report payloads column-wise with NumPy (see decoding.py)
+                            instead of pd.json_normalize
+        :param url_root: API root URL, e.g. pointing at the offline stub_server
+        :param metrics: Optional ApiMetrics to share between clients, available as self.metrics
+        """
         self._api_key = _api_key
-        self._url_root = "https://apiservice.borsdata.se/v1/"
-        self._last_api_call = 0
-        self._api_calls_per_second = 10
+        self._url_root = url_root
         self._params = {'authKey': self._api_key, 'maxYearCount': 20, 'maxR12QCount': 40, 'maxCount': 20}
+        if transport is None:
+            if rate_limiter is None:
+                rate_limiter = FileTokenBucket(RATE_LIMIT_FILE, API_CALLS_PER_SECOND, API_BURST)
+            transport = BorsdataTransport(timeout=timeout, max_retries=max_retries, rate_limiter=rate_limiter)
+        self.metrics = metrics if metrics is not None else ApiMetrics()
+        if getattr(transport, 'metrics', False) is None:
+            transport.metrics = self.metrics
+        self._transport = transport
+        self._cache = cache
+        self._fast_decode = fast_decode
+        # per-thread endpoint and time spent in _call_api, to split parse time from request time
+        self._local = threading.local()
 
     def _call_api(self, url, **kwargs):
         """
@@ -21,18 +54,38 @@ class BorsdataAPI:
         :param url: URL add to URL root
         :params: Additional URL parameters
         :return: JSON-encoded content, if any
-        """
-        current_time = time.time()
-        time_delta = current_time - self._last_api_call
-        if time_delta < 1 / self._api_calls_per_second:
-            time.sleep(1 / self._api_calls_per_second - time_delta)
-        response = requests.get(self._url_root + url, self._get_params(**kwargs))
-        print(response.url)
-        self._last_api_call = time.time()
-        if response.status_code != 200:
-            print(f"API-Error, status code: {response.status_code}")
-            return response
-        return response.json()
+        :raises BorsdataAPIError: if the API still fails after all retries
+        """
+        full_url = self._url_root + url
+        params = self._get_params(**kwargs)
+        endpoint = endpoint_template(url)
+        self._local.endpoint = endpoint
+        start = time.perf_counter()
+        content = None
+        if self._cache is not None:
+            content = self._cache.get(full_url, params)
+            if content is not None:
+                self.metrics.record_cache_hit(endpoint)
+        if content is None:
+            content = self._transport.get(full_url, params).content
+            if self._cache is not None:
+                self._cache.set(full_url, params, content)
+        self._local.request_seconds = getattr(self._local, 'request_seconds', 0.0) + time.perf_counter() - start
+        return self._loads(content)
+
+    def _loads(self, content):
+        if self._fast_decode:
+            return decoding.loads(content)
+        return json.loads(content)
+
+    def cache_stats(self):
+        """
+        Hit/miss counters of the response cache
+        :return: dict, empty if no cache is used
+        """
+        if self._cache is None:
+            return {}
+        return self._cache.stats()
 
     def _get_params(self, **kwargs):
         params = self._params.copy()
@@ -49,6 +102,18 @@ class BorsdataAPI:
                     print(f"BorsdataAPI >> Unknown param: {key}={value}")
         return params
 
+    @staticmethod
+    def _chunks(stock_id_list, size=MAX_INST_LIST):
+        """
+        Split an instrument ID list into batches accepted by the instList endpoints
+        :param stock_id_list: Instrument ID list
+        :param size: Max. number of instruments per batch
+        :return: generator of lists
+        """
+        stock_id_list = list(stock_id_list)
+        for i in range(0, len(stock_id_list), size):
+            yield stock_id_list[i:i + size]
+
     @staticmethod
     def _set_index(df, index, ascending=True):
         """
@@ -68,6 +133,48 @@ class BorsdataAPI:
         df.set_index(index, inplace=True)
         df.sort_index(inplace=True, ascending=ascending)
 
+    def _prices_frame(self, records):
+        """
+        Price bars to pd.DataFrame with readable column names and parsed dates
+        :param records: stockPricesList
+        :return: pd.DataFrame
+        """
+        if self._fast_decode:
+            return decoding.prices_to_frame(records)
+        df = pd.json_normalize(records)
+        df.rename(
+            columns={
+                "d": "date",
+                "i": "insId",
+                "c": "close",
+                "h": "high",
+                "l": "low",
+                "o": "open",
+                "v": "volume",
+            },
+            inplace=True,
+        )
+        self._parse_date(df, "date")
+        return df
+
+    def _reports_frame(self, records):
+        """
+        Report dicts to pd.DataFrame with camelCase column names and parsed dates
+        :param records: list of reports
+        :return: pd.DataFrame
+        """
+        if self._fast_decode:
+            df = decoding.reports_to_frame(records)
+            df.columns = [x.replace("_", "") for x in df.columns]
+            decoding.parse_report_dates(df)
+            return df
+        df = pd.json_normalize(records)
+        df.columns = [x.replace("_", "") for x in df.columns]
+        self._parse_date(df, "reportStartDate")
+        self._parse_date(df, "reportEndDate")
+        self._parse_date(df, "reportDate")
+        return df
+
     @staticmethod
     def _parse_date(df, key):
         """
@@ -303,11 +410,7 @@ class BorsdataAPI:
             params["maxCount"] = max_count
         json_data = self._call_api(url)
 
-        df = pd.json_normalize(json_data["reports"])
-        df.columns = [x.replace("_", "") for x in df.columns]
-        self._parse_date(df, "reportStartDate")
-        self._parse_date(df, "reportEndDate")
-        self._parse_date(df, "reportDate")
+        df = self._reports_frame(json_data["reports"])
         self._set_index(df, ["year", "period"], ascending=False)
         return df
 
@@ -322,35 +425,38 @@ class BorsdataAPI:
         json_data = self._call_api(url)
         dfs = []
         for report_type in ["reportsQuarter", "reportsYear", "reportsR12"]:
-            df = pd.json_normalize(json_data[report_type])
-            df.columns = [x.replace("_", "") for x in df.columns]
-            self._parse_date(df, "reportStartDate")
-            self._parse_date(df, "reportEndDate")
-            self._parse_date(df, "reportDate")
+            df = self._reports_frame(json_data[report_type])
             self._set_index(df, ["year", "period"], ascending=False)
             dfs.append(df)
         return dfs
 
-    def get_instrument_report_list(self, stock_id_list):
+    def get_instrument_report_list(self, stock_id_list, fill_na=True):
         """
-        Get all report data for Stocks in stock_id_list
+        Get all report data for Stocks in stock_id_list.
+        Lists longer than the API limit are fetched in batches of MAX_INST_LIST instruments and merged.
         :param stock_id_list: Instrument ID list
+        :param fill_na: True to replace missing values with 0
         :return: [pd.DataFrame quarter, pd.DataFrame year, pd.DataFrame r12]
         """
         url = f"instruments/reports"
-        json_data = self._call_api(url, instList=stock_id_list)
-        r12 = pd.json_normalize(json_data['reportList'], record_path="reportsR12", meta=["instrument"])
-        r12 = r12.rename(columns=str.lower)
-        r12 = r12.rename(columns={'instrument': 'stock_id'})
-        r12.fillna(0, inplace=True)
-        quarter = pd.json_normalize(json_data['reportList'], record_path="reportsQuarter", meta=["instrument"])
-        quarter = quarter.rename(columns=str.lower)
-        quarter = quarter.rename(columns={'instrument': 'stock_id'})
-        quarter.fillna(0, inplace=True)
-        year = pd.json_normalize(json_data['reportList'], record_path="reportsYear", meta=["instrument"])
-        year = year.rename(columns=str.lower)
-        year = year.rename(columns={'instrument': 'stock_id'})
-        year.fillna(0, inplace=True)
+        report_list = []
+        for batch in self._chunks(stock_id_list):
+            json_data = self._call_api(url, instList=batch)
+            report_list.extend(json_data['reportList'])
+        dfs = []
+        for report_type in ["reportsQuarter", "reportsYear", "reportsR12"]:
+            if self._fast_decode:
+                df = pd.concat([decoding.reports_to_frame(report[report_type], report["instrument"])
+                                for report in report_list if report.get(report_type)] or [pd.DataFrame(columns=['instrument'])],
+                               ignore_index=True)
+            else:
+                df = pd.json_normalize(report_list, record_path=report_type, meta=["instrument"])
+            df = df.rename(columns=str.lower)
+            df = df.rename(columns={'instrument': 'stock_id'})
+            if fill_na:
+                df.fillna(0, inplace=True)
+            dfs.append(df)
+        quarter, year, r12 = dfs
         return quarter, year, r12
 
     def get_reports_metadata(self):
@@ -385,36 +491,34 @@ class BorsdataAPI:
         """
         url = f"instruments/{ins_id}/stockprices"
         json_data = self._call_api(url, from_date=from_date, to=to_date)
-        df = pd.json_normalize(json_data["stockPricesList"])
-        df.rename(
-            columns={
-                "d": "date",
-                "c": "close",
-                "h": "high",
-                "l": "low",
-                "o": "open",
-                "v": "volume",
-            },
-            inplace=True,
-        )
-        self._parse_date(df, "date")
+        df = self._prices_frame(json_data["stockPricesList"])
         self._set_index(df, "date", ascending=False)
         return df
 
-    def get_instrument_stock_prices_list(self, stock_id_list, from_date=None, to_date=None):
+    def get_instrument_stock_prices_list(self, stock_id_list, from_date=None, to_date=None, fill_na=True):
         """
-        Get stock prices for instrument ID
+        Get stock prices for instrument ID.
+        Lists longer than the API limit are fetched in batches of MAX_INST_LIST instruments and merged.
         :param stock_id_list: Instrument ID list
         :param from_date: Start date in string format, e.g. '2000-01-01'
         :param to_date: Stop date in string format, e.g. '2000-01-01'
-        :return: pd.DataFrame
+        :param fill_na: True to replace missing values with 0
+        :return: pd.DataFrame, with 'date' parsed as pd.datetime
         """
         url = 'instruments/stockprices'
-        json_data = self._call_api(url, from_date=from_date, to=to_date, instList=stock_id_list)
-        stock_prices = pd.json_normalize(json_data['stockPricesArrayList'], "stockPricesList", ['instrument'])
-        stock_prices.rename(columns={'d': 'date', 'c': 'close', 'h': 'high', 'l': 'low',
-                                     'o': 'open', 'v': 'volume', 'instrument': 'stock_id'}, inplace=True)
-        stock_prices.fillna(0, inplace=True)
+        stock_prices_list = []
+        for batch in self._chunks(stock_id_list):
+            json_data = self._call_api(url, from_date=from_date, to=to_date, instList=batch)
+            stock_prices_list.extend(json_data['stockPricesArrayList'])
+        if self._fast_decode:
+            stock_prices = decoding.price_arrays_to_frame(stock_prices_list)
+        else:
+            stock_prices = pd.json_normalize(stock_prices_list, "stockPricesList", ['instrument'])
+            stock_prices.rename(columns={'d': 'date', 'c': 'close', 'h': 'high', 'l': 'low',
+                                         'o': 'open', 'v': 'volume', 'instrument': 'stock_id'}, inplace=True)
+            self._parse_date(stock_prices, "date")
+        if fill_na:
+            stock_prices.fillna(0, inplace=True)
         return stock_prices
 
     def get_instruments_stock_prices_last(self):
@@ -424,20 +528,7 @@ class BorsdataAPI:
         """
         url = "instruments/stockprices/last"
         json_data = self._call_api(url)
-        df = pd.json_normalize(json_data["stockPricesList"])
-        df.rename(
-            columns={
-                "d": "date",
-                "i": "insId",
-                "c": "close",
-                "h": "high",
-                "l": "low",
-                "o": "open",
-                "v": "volume",
-            },
-            inplace=True,
-        )
-        self._parse_date(df, "date")
+        df = self._prices_frame(json_data["stockPricesList"])
         self._set_index(df, "date", ascending=False)
         return df
 
@@ -450,20 +541,7 @@ class BorsdataAPI:
         url = "instruments/stockprices/date"
 
         json_data = self._call_api(url, date=date)
-        df = pd.json_normalize(json_data["stockPricesList"])
-        df.rename(
-            columns={
-                "d": "date",
-                "i": "insId",
-                "c": "close",
-                "h": "high",
-                "l": "low",
-                "o": "open",
-                "v": "volume",
-            },
-            inplace=True,
-        )
-        self._parse_date(df, "date")
+        df = self._prices_frame(json_data["stockPricesList"])
         self._set_index(df, "insId")
         return df
 
@@ -488,6 +566,29 @@ class BorsdataAPI:
         return df
 
 
+def _instrumented(func):
+    """
+    Record the time a get_* method spends outside _call_api (JSON decoding and
+    DataFrame conversion) as parse time of its endpoint
+    """
+    @functools.wraps(func)
+    def method(self, *args, **kwargs):
+        self._local.endpoint = None
+        self._local.request_seconds = 0.0
+        start = time.perf_counter()
+        result = func(self, *args, **kwargs)
+        if self._local.endpoint is not None:
+            self.metrics.record_parse(self._local.endpoint,
+                                      time.perf_counter() - start - self._local.request_seconds)
+        return result
+    return method
+
+
+for _name in dir(BorsdataAPI):
+    if _name.startswith("get_"):
+        setattr(BorsdataAPI, _name, _instrumented(getattr(BorsdataAPI, _name)))
+
+
 if __name__ == "__main__":
     # Main, call functions here.
     api = BorsdataAPI(API_KEY)
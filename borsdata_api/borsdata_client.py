@@ -17,8 +17,13 @@ pd.set_option('display.max_rows', None)
 
 
 class BorsdataClient:
-    def __init__(self):
-        self._borsdata_api = BorsdataAPI(constants.API_KEY)
+    def __init__(self, cache=None):
+        """
+        :param cache: Optional ResponseCache, e.g. ResponseCache(constants.CACHE_FILE), to avoid
+                      refetching unchanged history on every run
+        """
+        self._cache = cache
+        self._borsdata_api = BorsdataAPI(constants.API_KEY, cache=cache)
         self._instruments_with_meta_data = pd.DataFrame()
 
     def instruments_with_meta_data(self):
@@ -30,7 +35,7 @@ class BorsdataClient:
         if len(self._instruments_with_meta_data) > 0:
             return self._instruments_with_meta_data
         else:
-            self._borsdata_api = BorsdataAPI(constants.API_KEY)
+            self._borsdata_api = BorsdataAPI(constants.API_KEY, cache=self._cache)
             # fetching data from api
             countries = self._borsdata_api.get_countries()
             branches = self._borsdata_api.get_branches()
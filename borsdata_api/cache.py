@@ -0,0 +1,167 @@
+import datetime as dt
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlencode
+
+# (url pattern, ttl in seconds), first match wins
+DEFAULT_TTLS = [
+    (r"instruments/stockprices/last$", 5 * 60),
+    (r"instruments/updated$", 5 * 60),
+    (r"instruments/kpis/updated$", 5 * 60),
+    (r"instruments/stockprices/date$", 60 * 60),
+    (r"stockprices$", 12 * 60 * 60),
+    (r"reports(/\w+)?$", 24 * 60 * 60),
+    (r"kpis/", 24 * 60 * 60),
+]
+DEFAULT_TTL = 7 * 24 * 60 * 60
+# stock prices requested with a 'to' date in the past never change
+HISTORY_TTL = 365 * 24 * 60 * 60
+
+
+class ResponseCache:
+    """
+    Persistent cache of raw API responses.
+    Entries are zlib-compressed and stored in a small SQLite file, keyed on the
+    URL and the sorted request parameters (authKey excluded, so the cache can be
+    shared between keys). Every entry expires after a per-endpoint TTL, and the
+    least recently used entries are evicted once the cache exceeds max_bytes.
+    """
+    def __init__(self, path, max_bytes=2 * 1024 ** 3, ttls=None, default_ttl=DEFAULT_TTL):
+        """
+        :param path: Path of the cache database, created if it does not exist
+        :param max_bytes: Max. total size of the compressed responses
+        :param ttls: List of (url regex, ttl in seconds), defaults to DEFAULT_TTLS
+        :param default_ttl: TTL in seconds for URLs not matching any pattern
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._ttls = [(re.compile(pattern), ttl) for pattern, ttl in (ttls if ttls is not None else DEFAULT_TTLS)]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                content BLOB,
+                size INTEGER,
+                expires REAL,
+                last_access REAL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)')
+        self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def make_key(url, params):
+        """
+        Cache key for an API call
+        :param url: Full URL
+        :param params: URL parameters, 'authKey' is ignored
+        :return: str
+        """
+        items = sorted((k, str(v)) for k, v in (params or {}).items() if k != 'authKey' and v is not None)
+        return hashlib.sha1(f"{url}?{urlencode(items)}".encode()).hexdigest()
+
+    def ttl_for(self, url, params=None):
+        """
+        Time to live for an API call
+        :param url: Full URL
+        :param params: URL parameters
+        :return: TTL in seconds
+        """
+        to_date = (params or {}).get('to')
+        if to_date is not None and "stockprices" in url and str(to_date) < dt.date.today().isoformat():
+            return HISTORY_TTL
+        for pattern, ttl in self._ttls:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def get(self, url, params=None):
+        """
+        Look up a cached response
+        :return: Response content as bytes, or None on a miss
+        """
+        key = self.make_key(url, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT content, expires FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return zlib.decompress(row[0])
+
+    def set(self, url, params, content):
+        """
+        Store a response and evict least recently used entries above max_bytes
+        :param url: Full URL
+        :param params: URL parameters
+        :param content: Response content as bytes
+        """
+        key = self.make_key(url, params)
+        data = zlib.compress(content, 6)
+        now = time.time()
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                               (key, url, data, len(data), now + self.ttl_for(url, params), now))
+            # running total is an upper bound (replaced entries and other processes), _evict recounts
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        self._conn.execute('DELETE FROM responses WHERE expires < ?', (time.time(),))
+        rows = self._conn.execute('SELECT key, size FROM responses ORDER BY last_access').fetchall()
+        total = sum(size for _, size in rows)
+        evict = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evict.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', evict)
+        self.evictions += len(evict)
+        self._size = total
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.execute('VACUUM')
+            self._size = 0
+
+    def stats(self):
+        """
+        Cache statistics
+        :return: dict with hits, misses, hit_rate, evictions, entries and bytes
+        """
+        with self._lock:
+            entries, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': entries,
+            'bytes': size,
+        }
+
+    def close(self):
+        self._conn.close()
@@ -5,4 +5,32 @@ EXPORT_PATH = r'C:\Users\ander\Documents\Borsdata\Python_Strategi\Exportdata'
 DB_FILE = os.path.join(EXPORT_PATH, 'borsdata.db')
 DB_FILE_MONTHLY = os.path.join(EXPORT_PATH, 'borsdata_monthly.db')
 
-API_KEY = "9c5536f969dc44ce980aee4acbf798b3"  # Replace with your actual API key
+API_KEY = os.environ.get('BORSDATA_API_KEY', "9c5536f969dc44ce980aee4acbf798b3")  # Replace with your actual API key
+# Set BORSDATA_API_URL to e.g. http://127.0.0.1:8080/v1/ to run against borsdata_api/stub_server.py
+API_URL_ROOT = os.environ.get('BORSDATA_API_URL', "https://apiservice.borsdata.se/v1/")
+
+# API rate limit (Borsdata allows 100 calls per 10 seconds)
+API_CALLS_PER_SECOND = 10
+API_BURST = 10
+# State file for FileTokenBucket, shared by all scripts on this host
+RATE_LIMIT_FILE = os.path.join(EXPORT_PATH, 'borsdata_rate_limit.lock')
+
+# Max. number of instruments per call to the instList endpoints
+MAX_INST_LIST = 50
+
+# Opt-in on-disk cache of API responses (see cache.py)
+CACHE_FILE = os.path.join(EXPORT_PATH, 'borsdata_api_cache.db')
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Storage backend of the analytics scripts (see helpers/storage.py): 'sqlite' or 'parquet'
+STORAGE_BACKEND = os.environ.get('BORSDATA_STORAGE', 'sqlite')
+# Root of the Parquet datasets, written by export_parquet.py
+PARQUET_PATH = os.path.join(EXPORT_PATH, 'parquet')
+# Memory-mapped dense price panels (see helpers/price_panel.py), rebuilt when the source table changes
+PANEL_PATH = os.path.join(EXPORT_PATH, 'panel')
+# Cache of typed query results (see helpers/query_cache.py), set BORSDATA_QUERY_CACHE=0 to disable
+QUERY_CACHE = os.environ.get('BORSDATA_QUERY_CACHE', '1') != '0'
+QUERY_CACHE_PATH = os.path.join(EXPORT_PATH, 'query_cache')
+QUERY_CACHE_MAX_BYTES = 1024 ** 3
+# Load with float32/int32/category columns (helpers/queries.py), set BORSDATA_LEAN_LOADS=1 for large universes
+LEAN_LOADS = os.environ.get('BORSDATA_LEAN_LOADS', '0') == '1'
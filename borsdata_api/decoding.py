@@ -0,0 +1,125 @@
+"""
+Fast decoding of Borsdata JSON payloads into pd.DataFrames.
+Used by BorsdataAPI(fast_decode=True). Instead of pd.json_normalize on lists
+of dicts, every field is pulled into one typed NumPy column, dates are parsed
+with one vectorized call, and the per-instrument records of the multi-instrument
+price payload are released as soon as they are converted, so peak memory stays
+close to the size of the final frame.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the standard library
+    orjson = None
+
+PRICE_COLUMNS = {"d": "date", "i": "insId", "o": "open", "h": "high", "l": "low", "c": "close", "v": "volume"}
+REPORT_DATE_COLUMNS = ["reportStartDate", "reportEndDate", "reportDate"]
+
+
+def loads(content):
+    """
+    Parse JSON bytes, with orjson if it is installed
+    :param content: bytes or str
+    :return: parsed JSON
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _to_array(values):
+    """
+    One typed column from a list of JSON values; None becomes NaN for numbers
+    """
+    arr = np.array(values)
+    if arr.dtype == object:
+        try:
+            arr = np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            pass
+    return arr
+
+
+def _parse_dates(values):
+    return pd.to_datetime(np.asarray(values, dtype=object), format="ISO8601")
+
+
+def _columns(records):
+    """
+    Column arrays for a list of flat dicts, in the key order of the first record
+    :param records: list of dicts
+    :return: dict {key: list of values}
+    """
+    if not records:
+        return {}
+    keys = list(records[0])
+    key_set = set(keys)
+    for record in records:
+        if record.keys() != key_set:
+            new_keys = [key for key in record if key not in key_set]
+            keys.extend(new_keys)
+            key_set.update(new_keys)
+    return {key: [record.get(key) for record in records] for key in keys}
+
+
+def prices_to_frame(records):
+    """
+    Price bars ('d', 'o', 'h', 'l', 'c', 'v' and optionally 'i') to a frame
+    :param records: stockPricesList
+    :return: pd.DataFrame with columns date, open, high, low, close, volume (and insId)
+    """
+    data = {}
+    for key, values in _columns(records).items():
+        column = PRICE_COLUMNS.get(key, key)
+        data[column] = _parse_dates(values) if column == "date" else _to_array(values)
+    return pd.DataFrame(data)
+
+
+def price_arrays_to_frame(array_list):
+    """
+    Multi-instrument price payload to one long frame.
+    Each instrument's records are dropped from array_list once converted.
+    :param array_list: stockPricesArrayList
+    :return: pd.DataFrame with columns date, open, high, low, close, volume, stock_id
+    """
+    frames = []
+    for entry in array_list:
+        records = entry.get("stockPricesList") or []
+        entry["stockPricesList"] = None
+        if not records:
+            continue
+        df = prices_to_frame(records)
+        df["stock_id"] = np.full(len(df), entry["instrument"], dtype=np.int64)
+        frames.append(df)
+        del records
+    if not frames:
+        return pd.DataFrame(columns=["date", "open", "high", "low", "close", "volume", "stock_id"])
+    return pd.concat(frames, ignore_index=True, copy=False)
+
+
+def reports_to_frame(records, instrument=None):
+    """
+    Flat report dicts to a frame with API column names (e.g. gross_Income)
+    :param records: list of report dicts
+    :param instrument: Optional instrument ID added as column 'instrument'
+    :return: pd.DataFrame
+    """
+    data = {key: _to_array(values) for key, values in _columns(records).items()}
+    df = pd.DataFrame(data)
+    if instrument is not None:
+        df["instrument"] = np.full(len(df), instrument, dtype=np.int64)
+    return df
+
+
+def parse_report_dates(df):
+    """
+    Vectorized parse of the report date columns, in place
+    :param df: pd.DataFrame with camelCase report columns
+    """
+    for key in REPORT_DATE_COLUMNS:
+        if key in df:
+            df[key] = _parse_dates(df[key].to_numpy())
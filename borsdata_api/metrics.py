@@ -0,0 +1,211 @@
+import json
+import re
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+# upper bounds in seconds of the request latency histogram
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def endpoint_template(url):
+    """
+    Endpoint template of an API URL, e.g. 'instruments/{id}/stockprices'
+    :param url: Full or relative URL
+    :return: str
+    """
+    path = urlparse(url).path
+    if "/v1/" in path:
+        path = path.split("/v1/", 1)[1]
+    return re.sub(r"(^|/)\d+(?=/|$)", r"\1{id}", path.strip("/"))
+
+
+class EndpointStats:
+    """
+    Counters for one endpoint template
+    """
+    def __init__(self):
+        self.requests = 0
+        self.status_codes = Counter()
+        self.latency_seconds = 0.0
+        self.latency_max = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.response_bytes = 0
+        self.throttle_seconds = 0.0
+        self.retries = 0
+        self.parse_seconds = 0.0
+        self.parses = 0
+        self.cache_hits = 0
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': sum(count for status, count in self.status_codes.items() if status != '200'),
+            'status_codes': dict(self.status_codes),
+            'retries': self.retries,
+            'cache_hits': self.cache_hits,
+            'latency_seconds': round(self.latency_seconds, 6),
+            'latency_mean': round(self.latency_seconds / self.requests, 6) if self.requests else 0.0,
+            'latency_max': round(self.latency_max, 6),
+            'latency_histogram': dict(zip([str(b) for b in LATENCY_BUCKETS], self.latency_buckets)),
+            'response_bytes': self.response_bytes,
+            'throttle_seconds': round(self.throttle_seconds, 6),
+            'parse_seconds': round(self.parse_seconds, 6),
+            'parses': self.parses,
+        }
+
+
+class ApiMetrics:
+    """
+    Thread-safe per-endpoint instrumentation of API calls.
+    BorsdataTransport records requests, status codes, latency, response size,
+    retries and time spent waiting in the rate limiter; BorsdataAPI records
+    cache hits and the time spent decoding responses into pd.DataFrames.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def _stats(self, endpoint):
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = EndpointStats()
+        return stats
+
+    def record_request(self, endpoint, status, seconds, response_bytes=0):
+        """
+        :param endpoint: Endpoint template
+        :param status: HTTP status code, or an exception name for connection errors
+        :param seconds: Request latency
+        :param response_bytes: Size of the response body as sent (compressed when gzipped)
+        """
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats.requests += 1
+            stats.status_codes[str(status)] += 1
+            stats.latency_seconds += seconds
+            stats.latency_max = max(stats.latency_max, seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.latency_buckets[i] += 1
+                    break
+            stats.response_bytes += response_bytes
+
+    def record_throttle(self, endpoint, seconds):
+        with self._lock:
+            self._stats(endpoint).throttle_seconds += seconds
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self._stats(endpoint).retries += 1
+
+    def record_parse(self, endpoint, seconds):
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats.parse_seconds += seconds
+            stats.parses += 1
+
+    def record_cache_hit(self, endpoint):
+        with self._lock:
+            self._stats(endpoint).cache_hits += 1
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+    def summary(self):
+        """
+        Per-endpoint statistics and totals
+        :return: dict {'endpoints': {template: {...}}, 'total': {...}}
+        """
+        with self._lock:
+            endpoints = {endpoint: stats.to_dict() for endpoint, stats in sorted(self._endpoints.items())}
+        total = {}
+        for key in ['requests', 'errors', 'retries', 'cache_hits', 'latency_seconds', 'response_bytes',
+                    'throttle_seconds', 'parse_seconds']:
+            total[key] = sum(stats[key] for stats in endpoints.values())
+        return {'endpoints': endpoints, 'total': total}
+
+    def to_json(self, path=None):
+        """
+        :param path: Optional file to write to
+        :return: JSON string
+        """
+        text = json.dumps(self.summary(), indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_prometheus(self, path=None):
+        """
+        Prometheus text exposition format
+        :param path: Optional file to write to, e.g. for the node_exporter textfile collector
+        :return: str
+        """
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP borsdata_api_{name} {help_text}")
+            lines.append(f"# TYPE borsdata_api_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"borsdata_api_{name}{{{label_text}}} {value}")
+
+        metric("requests_total", "counter", "HTTP requests by endpoint and status code.",
+               [({'endpoint': e, 'status': status}, count)
+                for e, stats in endpoints for status, count in sorted(stats.status_codes.items())])
+        histogram = []
+        for e, stats in endpoints:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats.latency_buckets):
+                cumulative += count
+                histogram.append(({'endpoint': e, 'le': str(bound)}, cumulative))
+            histogram.append(({'endpoint': e, 'le': '+Inf'}, stats.requests))
+        lines.append("# HELP borsdata_api_request_duration_seconds Request latency.")
+        lines.append("# TYPE borsdata_api_request_duration_seconds histogram")
+        for labels, value in histogram:
+            lines.append(f'borsdata_api_request_duration_seconds_bucket{{endpoint="{labels["endpoint"]}",'
+                         f'le="{labels["le"]}"}} {value}')
+        for e, stats in endpoints:
+            lines.append(f'borsdata_api_request_duration_seconds_sum{{endpoint="{e}"}} {stats.latency_seconds}')
+            lines.append(f'borsdata_api_request_duration_seconds_count{{endpoint="{e}"}} {stats.requests}')
+        metric("response_bytes_total", "counter", "Response body bytes.",
+               [({'endpoint': e}, stats.response_bytes) for e, stats in endpoints])
+        metric("throttle_seconds_total", "counter", "Time spent waiting in the rate limiter.",
+               [({'endpoint': e}, stats.throttle_seconds) for e, stats in endpoints])
+        metric("retries_total", "counter", "Retried requests.",
+               [({'endpoint': e}, stats.retries) for e, stats in endpoints])
+        metric("parse_seconds_total", "counter", "Time spent decoding responses into DataFrames.",
+               [({'endpoint': e}, stats.parse_seconds) for e, stats in endpoints])
+        metric("cache_hits_total", "counter", "Responses served from the response cache.",
+               [({'endpoint': e}, stats.cache_hits) for e, stats in endpoints])
+        text = "\n".join(lines) + "\n"
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def dump(self, path):
+        """
+        Write the metrics to path, in Prometheus format for *.prom files and JSON otherwise
+        """
+        if path.endswith('.prom'):
+            self.to_prometheus(path)
+        else:
+            self.to_json(path)
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"{'endpoint':<50} {'requests':>8} {'errors':>6} {'retries':>7} {'latency s':>10} "
+              f"{'MB':>8} {'throttle s':>10} {'parse s':>8}")
+        for endpoint, stats in summary['endpoints'].items():
+            print(f"{endpoint:<50} {stats['requests']:>8} {stats['errors']:>6} {stats['retries']:>7} "
+                  f"{stats['latency_seconds']:>10.2f} {stats['response_bytes'] / 1e6:>8.2f} "
+                  f"{stats['throttle_seconds']:>10.2f} {stats['parse_seconds']:>8.2f}")
+        total = summary['total']
+        print(f"{'total':<50} {total['requests']:>8} {total['errors']:>6} {total['retries']:>7} "
+              f"{total['latency_seconds']:>10.2f} {total['response_bytes'] / 1e6:>8.2f} "
+              f"{total['throttle_seconds']:>10.2f} {total['parse_seconds']:>8.2f}")
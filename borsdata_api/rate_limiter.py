@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    Tokens refill continuously at `rate` per second up to `burst`. A caller that
+    finds the bucket empty reserves its token in advance and sleeps outside the
+    lock, so concurrent threads are served in order at exactly `rate` calls/s.
+    """
+    # Clock of the bucket state, time.monotonic within a process
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, rate=10, burst=10):
+        """
+        :param rate: Allowed calls per second
+        :param burst: Max. number of calls that can be made back-to-back
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = self.clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens from the bucket, sleeping until they are available
+        :param tokens: Number of tokens (API calls) to take
+        :return: Time in seconds spent waiting
+        """
+        with self._state() as now:
+            wait = self._reserve(tokens, now)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens only if they are available right now
+        :param tokens: Number of tokens (API calls) to take
+        :return: 0.0 if the tokens were taken, otherwise the time in seconds until they would be available
+        """
+        with self._state() as now:
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    @contextmanager
+    def _state(self):
+        # Exclusive access to the bucket state, yields the current time of clock
+        with self._lock:
+            yield self.clock()
+
+    def _refill(self, now):
+        # a clock stepping back (wall clock of FileTokenBucket) adds nothing rather than draining the bucket
+        self._tokens = min(self.burst, self._tokens + max(0.0, now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, tokens, now):
+        """
+        Refill the bucket and take tokens, allowing the balance to go negative
+        :return: Time in seconds until the reserved tokens are covered
+        """
+        self._refill(now)
+        self._tokens -= tokens
+        return max(0.0, -self._tokens / self.rate)
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    Token bucket shared between processes on the same host.
+    The bucket state is kept in a small file that is locked while it is
+    updated, so every script using the same `path` (and API key) draws from
+    one common quota.
+    """
+    # Wall clock, the state file is shared by processes with unrelated monotonic clocks
+    clock = staticmethod(time.time)
+
+    def __init__(self, path, rate=10, burst=10):
+        """
+        :param path: Path of the state file, created if it does not exist
+        :param rate: Allowed calls per second
+        :param burst: Max. number of calls that can be made back-to-back
+        """
+        super().__init__(rate, burst)
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    @contextmanager
+    def _state(self):
+        # The state of the file, locked against other processes and written back on exit
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                self._lock_file(fd)
+                try:
+                    now = self.clock()
+                    self._read_state(fd, now)
+                    yield now
+                    self._write_state(fd)
+                finally:
+                    self._unlock_file(fd)
+            finally:
+                os.close(fd)
+
+    def _read_state(self, fd, now):
+        os.lseek(fd, 0, os.SEEK_SET)
+        data = os.read(fd, 64).split()
+        try:
+            self._tokens, self._updated = float(data[0]), float(data[1])
+        except (IndexError, ValueError):
+            self._tokens, self._updated = self.burst, now
+
+    def _write_state(self, fd):
+        data = f"{self._tokens:.6f} {self._updated:.6f}".ljust(64).encode()
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, data)
+
+    @staticmethod
+    def _lock_file(fd):
+        if os.name == "nt":
+            # LK_LOCK gives up after about 10 s, wait as long as other processes hold the lock
+            while True:
+                os.lseek(fd, 0, os.SEEK_SET)
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    return
+                except OSError:
+                    time.sleep(0.01)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+    @staticmethod
+    def _unlock_file(fd):
+        if os.name == "nt":
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_UN)
@@ -0,0 +1,386 @@
+"""
+Offline stand-in for the Borsdata API.
+Serves the endpoints used by BorsdataAPI from recorded fixtures or from
+deterministic synthetic data, with configurable latency, error rate and
+rate limiting, so ingest throughput can be benchmarked without the real
+service or a real key.
+
+    python -m borsdata_api.stub_server --port 8080 --instruments 2000 --latency 0.05 --rate 10
+    BORSDATA_API_URL=http://127.0.0.1:8080/v1/ python main.py --mode batched --limit 0
+
+Recorded fixtures are JSON files laid out like the URL path, e.g.
+<fixtures>/instruments/3/stockprices.json, and take precedence over synthetic
+data (query parameters are ignored for them). record_fixtures() writes such a
+directory from the real API.
+"""
+import argparse
+import functools
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from .constants import MAX_INST_LIST
+from .rate_limiter import TokenBucket
+
+REPORT_FIELDS = [
+    "revenues", "gross_Income", "operating_Income", "profit_Before_Tax", "profit_To_Equity_Holders",
+    "earnings_Per_Share", "number_Of_Shares", "dividend", "intangible_Assets", "tangible_Assets",
+    "financial_Assets", "non_Current_Assets", "cash_And_Equivalents", "current_Assets", "total_Assets",
+    "total_Equity", "non_Current_Liabilities", "current_Liabilities", "total_Liabilities_And_Equity", "net_Debt",
+    "cash_Flow_From_Operating_Activities", "cash_Flow_From_Investing_Activities",
+    "cash_Flow_From_Financing_Activities", "cash_Flow_For_The_Year", "free_Cash_Flow", "stock_Price_Average",
+    "stock_Price_High", "stock_Price_Low", "currency_Ratio", "net_Sales",
+]
+
+
+class SyntheticData:
+    """
+    Deterministic synthetic universe: instruments, daily bars and quarterly/yearly reports
+    """
+    def __init__(self, instruments=200, start_date="2000-01-03", end_date="2024-07-01", seed=0):
+        self.ins_ids = list(range(1, instruments + 1))
+        self.seed = seed
+        self.dates = pd.bdate_range(start_date, end_date).strftime("%Y-%m-%d").tolist()
+        self._date_pos = {date: i for i, date in enumerate(self.dates)}
+
+    def instruments(self):
+        return [{
+            "insId": ins_id, "name": f"Synthetic {ins_id}", "urlName": f"synthetic-{ins_id}",
+            "instrument": 0, "isin": f"SE{ins_id:010d}", "ticker": f"SYN{ins_id}", "yahoo": f"SYN{ins_id}.ST",
+            "sectorId": ins_id % 10 + 1, "marketId": ins_id % 4 + 1, "branchId": ins_id % 40 + 1,
+            "countryId": 1, "listingDate": self.dates[self._first_day(ins_id)] + "T00:00:00",
+            "stockPriceCurrency": "SEK", "reportCurrency": "SEK",
+        } for ins_id in self.ins_ids]
+
+    def _first_day(self, ins_id):
+        # a third of the universe lists during the period
+        rng = np.random.default_rng(self.seed + ins_id)
+        return 0 if ins_id % 3 else int(rng.integers(0, len(self.dates) - 250))
+
+    @functools.lru_cache(maxsize=4096)
+    def _bars(self, ins_id):
+        rng = np.random.default_rng(self.seed + ins_id)
+        first = self._first_day(ins_id)
+        n = len(self.dates) - first
+        close = np.round(rng.uniform(10, 500) * np.exp(np.cumsum(rng.normal(0.0002, 0.02, n))), 2)
+        spread = np.abs(rng.normal(0, 0.01, n))
+        open_ = np.round(close * (1 + rng.normal(0, 0.005, n)), 2)
+        high = np.round(np.maximum(open_, close) * (1 + spread), 2)
+        low = np.round(np.minimum(open_, close) * (1 - spread), 2)
+        volume = rng.integers(1000, 2000000, n)
+        return first, open_.tolist(), high.tolist(), low.tolist(), close.tolist(), volume.tolist()
+
+    def stock_prices(self, ins_id, from_date=None, to_date=None):
+        if ins_id not in self.ins_ids:
+            return []
+        first, open_, high, low, close, volume = self._bars(ins_id)
+        start = max(first, self._position(from_date, 0))
+        stop = self._position(to_date, len(self.dates) - 1, right=True)
+        return [{"d": self.dates[i], "h": high[i - first], "l": low[i - first], "c": close[i - first],
+                 "o": open_[i - first], "v": volume[i - first]} for i in range(stop, start - 1, -1)]
+
+    def _position(self, date, default, right=False):
+        if not date:
+            return default
+        pos = int(np.searchsorted(self.dates, date[:10], side="right" if right else "left"))
+        return pos - 1 if right else pos
+
+    def prices_on(self, date):
+        i = self._date_pos.get(date[:10])
+        if i is None:
+            return []
+        rows = []
+        for ins_id in self.ins_ids:
+            first, open_, high, low, close, volume = self._bars(ins_id)
+            if i >= first:
+                rows.append({"i": ins_id, "d": self.dates[i], "h": high[i - first], "l": low[i - first],
+                             "c": close[i - first], "o": open_[i - first], "v": volume[i - first]})
+        return rows
+
+    @functools.lru_cache(maxsize=4096)
+    def reports(self, ins_id, report_type):
+        rng = np.random.default_rng(self.seed + 100000 + ins_id)
+        first_year = int(self.dates[self._first_day(ins_id)][:4])
+        last_year = int(self.dates[-1][:4])
+        periods = [(y, p) for y in range(last_year, first_year - 1, -1) for p in (4, 3, 2, 1)]
+        if report_type == "year":
+            periods = [(y, 5) for y in range(last_year - 1, first_year - 1, -1)]
+        base = rng.uniform(100, 10000)
+        reports = []
+        for year, period in periods:
+            quarter_end = pd.Timestamp(year=year, month=3 * min(period, 4), day=1) + pd.offsets.MonthEnd(0)
+            start = quarter_end - pd.DateOffset(months=12 if period == 5 else 3) + pd.Timedelta(days=1)
+            report = {"year": year, "period": period}
+            for field in REPORT_FIELDS:
+                report[field] = round(float(base * rng.uniform(0.1, 2.0)), 2)
+            report["number_Of_Shares"] = round(base / 10, 0)
+            report.update({
+                "report_Start_Date": start.strftime("%Y-%m-%dT00:00:00"),
+                "report_End_Date": quarter_end.strftime("%Y-%m-%dT00:00:00"),
+                "report_Date": (quarter_end + pd.Timedelta(days=45)).strftime("%Y-%m-%dT00:00:00"),
+                "broken_Fiscal_Year": False, "currency": "SEK",
+            })
+            reports.append(report)
+        return reports
+
+
+class StubState:
+    """
+    Server configuration shared by all request handlers
+    """
+    def __init__(self, data, fixtures_dir=None, latency=0.0, jitter=0.0, error_rate=0.0, rate=None, burst=None,
+                 seed=0):
+        self.data = data
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._buckets = {}
+        self._rate = rate
+        self._burst = burst if burst is not None else rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+    def bucket(self, api_key):
+        if self._rate is None:
+            return None
+        with self._lock:
+            if api_key not in self._buckets:
+                self._buckets[api_key] = TokenBucket(self._rate, self._burst)
+            return self._buckets[api_key]
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        state = self.state
+        with state._lock:
+            state.requests += 1
+        parsed = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        path = parsed.path
+        if path.startswith("/v1/"):
+            path = path[len("/v1/"):]
+
+        delay = state.latency + (state.random() * state.jitter if state.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if "authKey" not in params:
+            return self._send(401, {"message": "authKey is missing"})
+        bucket = state.bucket(params["authKey"])
+        if bucket is not None:
+            wait = bucket.try_acquire()
+            if wait > 0:
+                with state._lock:
+                    state.throttled += 1
+                return self._send(429, {"message": "Too many requests"}, {"Retry-After": f"{max(1, round(wait))}"})
+        if state.error_rate and state.random() < state.error_rate:
+            with state._lock:
+                state.errors += 1
+            return self._send(503, {"message": "Synthetic error"})
+
+        body = self._fixture(path)
+        if body is None:
+            try:
+                body = route(state.data, path, params)
+            except ValueError as e:
+                return self._send(400, {"message": str(e)})
+        if body is None:
+            return self._send(404, {"message": f"Unknown endpoint {path}"})
+        self._send(200, body)
+
+    def _fixture(self, path):
+        if self.state.fixtures_dir is None:
+            return None
+        file = os.path.join(self.state.fixtures_dir, *path.strip("/").split("/")) + ".json"
+        if not os.path.exists(file):
+            return None
+        with open(file, "rb") as f:
+            return f.read()
+
+    def _send(self, status, body, headers=None):
+        content = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        if "gzip" in self.headers.get("Accept-Encoding", "") and len(content) > 1024:
+            content = gzip.compress(content, 5)
+            self.send_header("Content-Encoding", "gzip")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def _inst_list(params):
+    ins_ids = [int(x) for x in params.get("instList", "").split(",") if x]
+    if len(ins_ids) > MAX_INST_LIST:
+        raise ValueError(f"instList is limited to {MAX_INST_LIST} instruments")
+    return ins_ids
+
+
+def route(data, path, params):
+    """
+    Build the JSON body for an endpoint path
+    :return: dict, or None for unknown endpoints
+    """
+    from_date, to_date = params.get("from"), params.get("to")
+    max_count = int(params["maxCount"]) if "maxCount" in params else None
+    if path == "instruments":
+        return {"instruments": data.instruments()}
+    if path == "instruments/updated":
+        updated = pd.Timestamp(data.dates[-1]).strftime("%Y-%m-%dT18:00:00Z")
+        return {"instruments": [{"insId": ins_id, "updatedAt": updated} for ins_id in data.ins_ids]}
+    if path in ("branches", "countries", "markets", "sectors"):
+        count = {"branches": 40, "countries": 4, "markets": 4, "sectors": 10}[path]
+        return {path: [{"id": i, "name": f"{path[:-1].capitalize()} {i}"} for i in range(1, count + 1)]}
+    if path == "translationmetadata":
+        return {"translationMetadatas": []}
+    if path == "instruments/stockprices":
+        return {"stockPricesArrayList": [
+            {"instrument": ins_id, "stockPricesList": data.stock_prices(ins_id, from_date, to_date)}
+            for ins_id in _inst_list(params)]}
+    if path == "instruments/stockprices/last":
+        return {"stockPricesList": data.prices_on(data.dates[-1])}
+    if path == "instruments/stockprices/date":
+        return {"stockPricesList": data.prices_on(params.get("date", ""))}
+    if path == "instruments/stocksplits":
+        return {"stockSplitList": []}
+    if path == "instruments/reports":
+        return {"reportList": [
+            {"instrument": ins_id, "reportsQuarter": data.reports(ins_id, "quarter"),
+             "reportsYear": data.reports(ins_id, "year"), "reportsR12": []}
+            for ins_id in _inst_list(params)]}
+    if path == "instruments/reports/metadata":
+        return {"reportMetadatas": [{"reportPropery": field, "nameSv": field, "nameEn": field}
+                                    for field in REPORT_FIELDS]}
+    if path == "instruments/kpis/updated":
+        return {"kpisCalcUpdated": pd.Timestamp(data.dates[-1]).strftime("%Y-%m-%dT20:00:00Z")}
+    if path == "instruments/kpis/metadata":
+        return {"kpiHistoryMetadatas": []}
+
+    match = re.fullmatch(r"instruments/(\d+)/stockprices", path)
+    if match:
+        # BorsdataAPI always sends maxCount (meant for reports/KPIs), so it is not applied to prices
+        return {"instrument": int(match.group(1)),
+                "stockPricesList": data.stock_prices(int(match.group(1)), from_date, to_date)}
+    match = re.fullmatch(r"instruments/(\d+)/reports", path)
+    if match:
+        ins_id = int(match.group(1))
+        return {"instrument": ins_id, "reportsQuarter": data.reports(ins_id, "quarter"),
+                "reportsYear": data.reports(ins_id, "year"), "reportsR12": []}
+    match = re.fullmatch(r"instruments/(\d+)/reports/(quarter|year|r12)", path)
+    if match:
+        ins_id, report_type = int(match.group(1)), match.group(2)
+        reports = data.reports(ins_id, report_type) if report_type != "r12" else []
+        return {"instrument": ins_id, "reports": reports[:max_count] if max_count else reports}
+    match = re.fullmatch(r"instruments/(\d+)/kpis/(\d+)/(quarter|year|r12)/(\w+)/history", path)
+    if match:
+        ins_id = int(match.group(1))
+        values = [{"y": r["year"], "p": r["period"], "v": r["earnings_Per_Share"]}
+                  for r in data.reports(ins_id, "year" if match.group(3) == "year" else "quarter")]
+        return {"kpiId": int(match.group(2)), "values": values}
+    return None
+
+
+def make_server(host="127.0.0.1", port=8080, instruments=200, start_date="2000-01-03", end_date="2024-07-01",
+                fixtures_dir=None, latency=0.0, jitter=0.0, error_rate=0.0, rate=None, burst=None, seed=0):
+    """
+    Create the stand-in server (call serve_forever() or start_server_thread())
+    :param port: TCP port, 0 picks a free port (see server.server_address)
+    :param instruments: Number of synthetic instruments
+    :param fixtures_dir: Optional directory of recorded JSON fixtures
+    :param latency: Seconds added to every response
+    :param jitter: Max. random seconds added on top of latency
+    :param error_rate: Probability of answering 503
+    :param rate: Allowed requests per second and authKey, None for unlimited (429 with Retry-After above it)
+    :param burst: Token bucket burst, defaults to rate
+    :param seed: Seed for synthetic data and errors
+    :return: ThreadingHTTPServer with a `stub_state` attribute holding request counters
+    """
+    state = StubState(SyntheticData(instruments, start_date, end_date, seed), fixtures_dir, latency, jitter,
+                      error_rate, rate, burst, seed)
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.stub_state = state
+    return server
+
+
+def start_server_thread(**kwargs):
+    """
+    Start the stand-in server in a daemon thread
+    :return: (server, url_root), stop with server.shutdown()
+    """
+    server = make_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1/"
+
+
+def record_fixtures(api, paths, fixtures_dir):
+    """
+    Save real API responses as fixtures for the stand-in server
+    :param api: BorsdataAPI against the real service
+    :param paths: Endpoint paths, e.g. ['instruments', 'instruments/3/stockprices']
+    :param fixtures_dir: Output directory
+    """
+    for path in paths:
+        file = os.path.join(fixtures_dir, *path.strip("/").split("/")) + ".json"
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(file, "w") as f:
+            json.dump(api._call_api(path), f)
+        print(f"Fixture saved: {file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Borsdata API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--instruments", type=int, default=200)
+    parser.add_argument("--start-date", default="2000-01-03")
+    parser.add_argument("--end-date", default="2024-07-01")
+    parser.add_argument("--fixtures", default=None, help="Directory of recorded JSON fixtures")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Max. random seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 503 response")
+    parser.add_argument("--rate", type=float, default=None, help="Requests per second per authKey (429 above)")
+    parser.add_argument("--burst", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, args.instruments, args.start_date, args.end_date, args.fixtures,
+                         args.latency, args.jitter, args.error_rate, args.rate, args.burst, args.seed)
+    print(f"Borsdata stub serving on http://{args.host}:{server.server_address[1]}/v1/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state = server.stub_state
+        print(f"requests: {state.requests}, throttled: {state.throttled}, errors: {state.errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import endpoint_template
+
+
+class BorsdataAPIError(Exception):
+    """
+    Raised when the Borsdata API returns a non-200 response after all retries
+    """
+    def __init__(self, url, status_code, message=""):
+        # the API key is passed as a query parameter, keep it out of logs and stored error messages
+        self.url = re.sub(r"authKey=[^&]*", "authKey=***", url)
+        self.status_code = status_code
+        super().__init__(f"API-Error, status code: {status_code} ({self.url}) {message}".rstrip())
+
+
+class BorsdataTransport:
+    """
+    Session-based HTTP transport for the Borsdata API.
+    Keeps connections alive in a pool, negotiates gzip and retries 429/5xx
+    responses and connection errors with exponential backoff, honouring the
+    Retry-After header sent by the API when throttling.
+    """
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, timeout=(5, 60), max_retries=5, backoff_factor=0.5, max_backoff=60,
+                 pool_connections=4, pool_maxsize=16, rate_limiter=None, metrics=None):
+        """
+        :param timeout: (connect, read) timeout in seconds, or a single number for both
+        :param max_retries: Max. number of retries per request (0 disables retries)
+        :param backoff_factor: Base delay in seconds, doubled for every retry
+        :param max_backoff: Upper limit in seconds for a single retry delay
+        :param pool_connections: Number of connection pools to cache
+        :param pool_maxsize: Max. number of keep-alive connections per pool
+        :param rate_limiter: Optional limiter (see rate_limiter.py) acquired before every attempt
+        :param metrics: Optional ApiMetrics recording latency, bytes, status codes, retries and throttle time
+        """
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self._session = requests.Session()
+        self._session.headers.update({"Accept-Encoding": "gzip, deflate", "Accept": "application/json"})
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def get(self, url, params=None):
+        """
+        GET url, retrying transient failures
+        :param url: Full URL
+        :param params: URL parameters
+        :return: requests.Response with status code 200
+        """
+        endpoint = endpoint_template(url)
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                wait = self.rate_limiter.acquire()
+                if self.metrics is not None and wait:
+                    self.metrics.record_throttle(endpoint, wait)
+            start = time.perf_counter()
+            try:
+                response = self._session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self.metrics is not None:
+                    self.metrics.record_request(endpoint, type(e).__name__, time.perf_counter() - start)
+                if attempt >= self.max_retries:
+                    raise BorsdataAPIError(url, None, str(e)) from e
+                delay = self._backoff(attempt)
+                print(f"BorsdataTransport >> {type(e).__name__}, retrying in {delay:.1f}s")
+            else:
+                if self.metrics is not None:
+                    size = int(response.headers.get("Content-Length", len(response.content)))
+                    self.metrics.record_request(endpoint, response.status_code, time.perf_counter() - start, size)
+                if response.status_code == 200:
+                    return response
+                if response.status_code not in self.RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    raise BorsdataAPIError(response.url, response.status_code, response.text[:200])
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                print(f"BorsdataTransport >> status code {response.status_code}, retrying in {delay:.1f}s")
+            if self.metrics is not None:
+                self.metrics.record_retry(endpoint)
+            attempt += 1
+            time.sleep(delay)
+
+    def close(self):
+        self._session.close()
+
+    def _backoff(self, attempt):
+        """
+        Exponential backoff with jitter
+        :param attempt: Zero-based retry number
+        :return: Delay in seconds
+        """
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    def _retry_after(self, response):
+        """
+        Parse the Retry-After header (seconds or HTTP date)
+        :param response: requests.Response
+        :return: Delay in seconds, or None if not present
+        """
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(self.max_backoff, max(0.0, delay))
@@ -0,0 +1,23 @@
+import argparse
+import time
+from helpers.price_panel import PANEL_FIELDS, load_panel
+from helpers.storage import get_storage
+
+# Price tables per database
+TABLES = {
+    'daily': ['price_data'],
+    'monthly': ['monthly_price_data', 'weekly_price_data'],
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the memory-mapped price panels of the analytics scripts.")
+    parser.add_argument('--database', choices=['daily', 'monthly', 'all'], default='all')
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild even if the panels are up to date")
+    args = parser.parse_args()
+    for database in (['daily', 'monthly'] if args.database == 'all' else [args.database]):
+        storage = get_storage(database, read_only=True)
+        for table in TABLES[database]:
+            start = time.time()
+            panel = load_panel(storage, table, PANEL_FIELDS, rebuild=args.rebuild)
+            print(f"{table}: {len(panel.dates)} dates x {len(panel.ins_ids)} instruments "
+                  f"in {panel.path} ({time.time() - start:.1f}s)")
@@ -1,38 +1,28 @@
-import sqlite3
-import os
-import shutil
+import argparse
 from borsdata_api.constants import DB_FILE
+from helpers.checkpoint_utils import create_checkpoint_table
+from helpers.compact_schema import compact_price_table_sql
+from helpers.db_utils import backup_and_remove_existing_db, open_connection
 
-def backup_and_remove_existing_db(db_file):
-    if os.path.exists(db_file):
-        version = 1
-        backup_file = f"{db_file}_v{version}"
-        while os.path.exists(backup_file):
-            version += 1
-            backup_file = f"{db_file}_v{version}"
-        shutil.copy2(db_file, backup_file)
-        print(f"Existing database backed up as {backup_file}")
-        os.remove(db_file)
-        print(f"Existing database {db_file} removed.")
-
-def create_db():
-    backup_and_remove_existing_db(DB_FILE)
-    conn = sqlite3.connect(DB_FILE)
+def create_tables(conn, compact=False):
     cursor = conn.cursor()
     
-    # Create table for price data
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS price_data (
-            ins_id INTEGER,
-            date TEXT,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            volume REAL,
-            PRIMARY KEY (ins_id, date)
-        )
-    ''')
+    # Create table for price data, in the compact layout of helpers/compact_schema.py if compact
+    if compact:
+        cursor.execute(compact_price_table_sql('price_data'))
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS price_data (
+                ins_id INTEGER,
+                date TEXT,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                volume REAL,
+                PRIMARY KEY (ins_id, date)
+            )
+        ''')
     
     # Create table for report data
     cursor.execute('''
@@ -78,10 +68,41 @@ def create_db():
             PRIMARY KEY (ins_id, year, period)
         )
     ''')
-    
+
+    # Secondary indexes for date-range and cross-sectional queries (helpers/queries.py);
+    # the primary keys already cover lookups by instrument
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_data_date ON price_data (date, ins_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_report_data_report_end_date ON report_data (report_end_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_report_data_report_date ON report_data (report_date)')
+
+    # Create table for incremental sync state (main.py --mode sync)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TEXT
+        )
+    ''')
+
+    # Create table for ingest progress (main.py --resume)
+    create_checkpoint_table(conn)
+
     conn.commit()
+
+def create_db(reset=False, compact=False):
+    # Existing data is kept unless reset, which backs the database up and starts empty
+    if reset:
+        backup_and_remove_existing_db(DB_FILE)
+    conn = open_connection(DB_FILE)
+    create_tables(conn, compact)
     conn.close()
 
 if __name__ == "__main__":
-    create_db()
+    parser = argparse.ArgumentParser(description="Create the tables of the daily database.")
+    parser.add_argument('--reset', action='store_true',
+                        help="Back up and remove the existing database first instead of keeping its data")
+    parser.add_argument('--compact', action='store_true',
+                        help="Create price_data in the compact layout (existing tables are kept, see migrate_compact.py)")
+    args = parser.parse_args()
+    create_db(args.reset, args.compact)
     print("Database created and tables are set up.")
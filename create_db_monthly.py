@@ -1,27 +1,14 @@
-import sqlite3
-import os
-import shutil
+import argparse
 from borsdata_api.constants import DB_FILE_MONTHLY
+from helpers.compact_schema import compact_price_table_sql
+from helpers.db_utils import backup_and_remove_existing_db, open_connection
 
-def backup_and_remove_existing_db(db_file):
-    if os.path.exists(db_file):
-        version = 1
-        backup_file = f"{db_file}_v{version}"
-        while os.path.exists(backup_file):
-            version += 1
-            backup_file = f"{db_file}_v{version}"
-        shutil.copy2(db_file, backup_file)
-        print(f"Existing database backed up as {backup_file}")
-        os.remove(db_file)
-        print(f"Existing database {db_file} removed.")
-
-def create_tables():
-    conn = sqlite3.connect(DB_FILE_MONTHLY)
-    cursor = conn.cursor()
-
-    # Create table for monthly price data
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS monthly_price_data (
+def price_table_sql(table, compact):
+    # Monthly and weekly price tables, in the compact layout of helpers/compact_schema.py if compact
+    if compact:
+        return compact_price_table_sql(table)
+    return f'''
+        CREATE TABLE IF NOT EXISTS {table} (
             ins_id INTEGER,
             date TEXT,
             open REAL,
@@ -31,7 +18,14 @@ def create_tables():
             volume INTEGER,
             PRIMARY KEY (ins_id, date)
         )
-    ''')
+    '''
+
+def create_tables(compact=False):
+    conn = open_connection(DB_FILE_MONTHLY)
+    cursor = conn.cursor()
+
+    # Create table for monthly price data
+    cursor.execute(price_table_sql('monthly_price_data', compact))
     
     # Create table for monthly report data
     cursor.execute('''
@@ -78,10 +72,29 @@ def create_tables():
         )
     ''')
 
+    # Create table for weekly price data (main_month.py --mode derive --weekly)
+    cursor.execute(price_table_sql('weekly_price_data', compact))
+
+    # Secondary indexes for date-range and cross-sectional queries (helpers/queries.py);
+    # the primary keys already cover lookups by instrument
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_monthly_price_data_date ON monthly_price_data (date, ins_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_monthly_report_data_report_end_date '
+                   'ON monthly_report_data (report_end_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_monthly_report_data_report_date ON monthly_report_data (report_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_weekly_price_data_date ON weekly_price_data (date, ins_id)')
+
     conn.commit()
     conn.close()
     print("Tables created successfully in the monthly database.")
 
 if __name__ == "__main__":
-    backup_and_remove_existing_db(DB_FILE_MONTHLY)
-    create_tables()
+    parser = argparse.ArgumentParser(description="Create the tables of the monthly database.")
+    parser.add_argument('--reset', action='store_true',
+                        help="Back up and remove the existing database first instead of keeping its data")
+    parser.add_argument('--compact', action='store_true',
+                        help="Create the price tables in the compact layout (existing tables are kept, "
+                             "see migrate_compact.py)")
+    args = parser.parse_args()
+    if args.reset:
+        backup_and_remove_existing_db(DB_FILE_MONTHLY)
+    create_tables(args.compact)
@@ -1,86 +1,32 @@
-import pandas as pd
-import numpy as np
-import sqlite3
-from borsdata_api.constants import DB_FILE_MONTHLY
+import argparse
+from helpers.index_builder import IndexBuilder, update_indices
+from helpers.index_utils import REBALANCE_FREQUENCIES
+from helpers.storage import get_storage
 
-# Connect to the SQLite database
+# SQLite database or Parquet datasets, depending on BORSDATA_STORAGE
 def connect_db():
-    return sqlite3.connect(DB_FILE_MONTHLY)
-
-def create_price_weighted_index(conn):
-    price_df = pd.read_sql_query("SELECT * FROM monthly_price_data", conn)
-    price_df['date'] = pd.to_datetime(price_df['date'])
-    grouped_df = price_df.groupby('date').agg({'close': 'sum', 'ins_id': 'count'}).reset_index()
-    grouped_df['price_weighted_index'] = grouped_df['close'] / grouped_df['ins_id']
-    return grouped_df[['date', 'price_weighted_index']]
-
-def create_market_cap_weighted_index(conn):
-    price_df = pd.read_sql_query("SELECT * FROM monthly_price_data", conn)
-    report_df = pd.read_sql_query("SELECT ins_id, report_start_date, number_of_shares FROM monthly_report_data", conn)
-    
-    price_df['date'] = pd.to_datetime(price_df['date'])
-    report_df['report_start_date'] = pd.to_datetime(report_df['report_start_date'])
-    
-    report_df = report_df.drop_duplicates(subset=['ins_id', 'report_start_date']).sort_values(by='report_start_date')
-    combined_df = pd.merge_asof(price_df.sort_values('date'), report_df.sort_values('report_start_date'), by='ins_id', left_on='date', right_on='report_start_date')
-    
-    combined_df = combined_df.groupby('ins_id', group_keys=False).apply(lambda x: x.set_index('date').ffill().bfill().reset_index())
-    
-    combined_df['market_cap'] = combined_df['close'] * combined_df['number_of_shares']
-    combined_df['weighted_close'] = combined_df['close'] * combined_df['market_cap']
-    
-    grouped_df = combined_df.groupby('date').agg({'weighted_close': 'sum', 'market_cap': 'sum'}).reset_index()
-    grouped_df['market_cap_weighted_index'] = grouped_df['weighted_close'] / grouped_df['market_cap']
-    
-    return grouped_df[['date', 'market_cap_weighted_index']]
-
-def create_equal_weighted_index(conn):
-    price_df = pd.read_sql_query("SELECT * FROM monthly_price_data", conn)
-    price_df['date'] = pd.to_datetime(price_df['date'])
-    grouped_df = price_df.groupby('date').agg({'close': 'mean'}).reset_index()
-    grouped_df.rename(columns={'close': 'equal_weighted_index'}, inplace=True)
-    return grouped_df[['date', 'equal_weighted_index']]
-
-def calculate_risk_parity_weights(cov_matrix):
-    inv_vol = 1 / np.sqrt(np.diag(cov_matrix))
-    inv_vol /= inv_vol.sum()
-    return inv_vol
-
-def create_risk_parity_index(conn, lookback_period=12):
-    price_df = pd.read_sql_query("SELECT * FROM monthly_price_data", conn)
-    price_df['date'] = pd.to_datetime(price_df['date'])
-    price_pivot = price_df.pivot(index='date', columns='ins_id', values='close')
-    
-    rolling_cov_matrices = price_pivot.pct_change().rolling(window=lookback_period).cov(pairwise=True)
-    
-    risk_parity_indices = []
-    
-    for date in rolling_cov_matrices.index.levels[0]:
-        cov_matrix = rolling_cov_matrices.loc[date]
-        if not cov_matrix.empty:
-            weights = calculate_risk_parity_weights(cov_matrix)
-            returns = price_pivot.pct_change().loc[date]
-            risk_parity_index = np.dot(weights, returns)
-            risk_parity_indices.append({'date': date, 'risk_parity_index': risk_parity_index})
-    
-    risk_parity_df = pd.DataFrame(risk_parity_indices)
-    return risk_parity_df
-
-def save_indices_to_db(conn):
-    price_weighted_df = create_price_weighted_index(conn)
-    market_cap_weighted_df = create_market_cap_weighted_index(conn)
-    equal_weighted_df = create_equal_weighted_index(conn)
-    risk_parity_df = create_risk_parity_index(conn)
-    
-    merged_df = price_weighted_df.merge(market_cap_weighted_df, on='date', how='outer')
-    merged_df = merged_df.merge(equal_weighted_df, on='date', how='outer')
-    merged_df = merged_df.merge(risk_parity_df, on='date', how='outer')
-    
-    merged_df.to_sql('monthly_index_data', conn, if_exists='replace', index=False)
-    print("All index data saved to database.")
+    return get_storage('monthly')
+
+def save_indices_to_db(storage, erc=False, frequency='month', cap=None, update=False):
+    # All indices from one load of the prices, or only the new dates, see helpers/index_builder.py
+    if update:
+        update_indices(storage, 'monthly_price_data', 'monthly', 'monthly_index_data', 12, erc=erc,
+                       frequency=frequency, cap=cap)
+    else:
+        builder = IndexBuilder(storage, 'monthly_price_data', database='monthly', lookback_period=12,
+                               frequency=frequency, cap=cap)
+        builder.save('monthly_index_data', erc=erc)
+    print("All index data saved.")
 
 if __name__ == "__main__":
-    conn = connect_db()
-    save_indices_to_db(conn)
-    conn.close()
+    parser = argparse.ArgumentParser(description="Create the indices of the monthly prices.")
+    parser.add_argument('--erc', action='store_true', help="Also create the equal risk contribution index")
+    parser.add_argument('--rebalance', choices=list(REBALANCE_FREQUENCIES), default='month',
+                        help="Rebalance calendar of the indices")
+    parser.add_argument('--cap', type=float, default=None, help="Max. weight of an instrument at a rebalance")
+    parser.add_argument('--update', action='store_true',
+                        help="Only append the dates after the last indexed one, from the stored index state")
+    args = parser.parse_args()
+    storage = connect_db()
+    save_indices_to_db(storage, erc=args.erc, frequency=args.rebalance, cap=args.cap, update=args.update)
     print("All index creation completed.")
@@ -0,0 +1,36 @@
+import argparse
+import time
+from helpers.storage import SQLiteStorage, export_table, get_storage
+from borsdata_api.constants import DB_FILE, DB_FILE_MONTHLY
+
+# Tables exported per database, tables missing from the database are skipped
+TABLES = {
+    'daily': ['price_data', 'report_data', 'index_data'],
+    'monthly': ['monthly_price_data', 'monthly_report_data', 'weekly_price_data', 'monthly_index_data',
+                'factor_rankings'],
+}
+
+def export_database(database, chunk_size=500):
+    """
+    Copy the tables of the daily or monthly SQLite database to Parquet datasets under PARQUET_PATH
+    :param database: 'daily' or 'monthly'
+    :param chunk_size: Instruments copied per write
+    """
+    source = SQLiteStorage(DB_FILE if database == 'daily' else DB_FILE_MONTHLY, read_only=True)
+    target = get_storage(database, backend='parquet')
+    existing = {row[0] for row in source.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table in TABLES[database]:
+        if table not in existing:
+            print(f"Skipping {table}, not in the {database} database")
+            continue
+        start = time.time()
+        rows = export_table(source, target, table, chunk_size)
+        print(f"Exported {rows} rows of {table} in {time.time() - start:.1f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the SQLite databases to partitioned Parquet datasets.")
+    parser.add_argument('--database', choices=['daily', 'monthly', 'all'], default='all')
+    parser.add_argument('--chunk-size', type=int, default=500, help="Instruments copied per write")
+    args = parser.parse_args()
+    for database in (['daily', 'monthly'] if args.database == 'all' else [args.database]):
+        export_database(database, args.chunk_size)
@@ -1,21 +1,27 @@
 import sys
 import os
-import pandas as pd 
 
 # Lägg till projektets rotkatalog till Pythons sökväg
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from helpers.db_utils import connect_db
+from helpers.queries import load_prices, load_reports, memory_mb
+from helpers.storage import get_storage
 from calculate_factors import calculate_rolling_factors, calculate_factors
 from rank_factors import rank_factors
 from save_rankings import save_rankings
 
+# Report columns used by calculate_rolling_factors and calculate_factors
+REPORT_FACTOR_COLUMNS = ['ins_id', 'report_start_date', 'revenues', 'gross_income', 'operating_income',
+                         'earnings_per_share', 'number_of_shares']
+
 def main():
-    conn = connect_db()
+    storage = get_storage('monthly', read_only=True)
     print("Reading monthly_price_data...")
-    price_df = pd.read_sql_query("SELECT * FROM monthly_price_data", conn)
+    price_df = load_prices(columns=['close'], period='month', storage=storage)
     print("Reading monthly_report_data...")
-    report_df = pd.read_sql_query("SELECT * FROM monthly_report_data", conn)
+    report_df = load_reports(columns=REPORT_FACTOR_COLUMNS, database='monthly', storage=storage)
+    print(f"Loaded {len(price_df)} prices ({memory_mb(price_df):.1f} MB) and {len(report_df)} reports "
+          f"({memory_mb(report_df):.1f} MB).")
     
     print("Calculating rolling factors...")
     rolling_report_df = calculate_rolling_factors(report_df)
@@ -26,7 +32,6 @@ def main():
     
     print("Saving rankings to database...")
     save_rankings(ranked_df)
-    conn.close()
     print("Done.")
 
 if __name__ == "__main__":
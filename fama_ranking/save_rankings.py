@@ -1,12 +1,10 @@
-import sqlite3
-from helpers.db_utils import connect_db
+from helpers.storage import get_storage
 
 def save_rankings_to_db(df):
-    conn = connect_db()
-    print("Saving to SQL...")
-    df.to_sql('factor_rankings', conn, if_exists='replace', index=False)
-    print("Data saved to SQL.")
-    conn.close()
+    storage = get_storage('monthly')
+    print("Saving factor_rankings...")
+    storage.write('factor_rankings', df)
+    print("Data saved.")
 
 def save_rankings(df):
     # Justera för att inkludera 'value_factor_rank' istället för 'value_rank'
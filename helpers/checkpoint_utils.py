@@ -0,0 +1,59 @@
+import datetime as dt
+
+# Ingest progress per (ins_id, dataset). Rows are written in the same transaction
+# as the data they describe, so a checkpoint never claims data that was not committed.
+
+def create_checkpoint_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_checkpoint (
+            ins_id INTEGER,
+            dataset TEXT,
+            status TEXT,
+            attempts INTEGER,
+            error TEXT,
+            updated_at TEXT,
+            PRIMARY KEY (ins_id, dataset)
+        )
+    ''')
+
+def clear_checkpoints(conn, datasets):
+    create_checkpoint_table(conn)
+    conn.executemany('DELETE FROM ingest_checkpoint WHERE dataset = ?', [(dataset,) for dataset in datasets])
+    conn.commit()
+
+def mark_done(conn, ins_ids, dataset):
+    # Does not commit, commit together with the data
+    create_checkpoint_table(conn)
+    now = dt.datetime.now().isoformat(timespec='seconds')
+    conn.executemany('''
+        INSERT INTO ingest_checkpoint (ins_id, dataset, status, attempts, error, updated_at)
+        VALUES (?, ?, 'done', 1, NULL, ?)
+        ON CONFLICT (ins_id, dataset) DO UPDATE SET
+            status = 'done', attempts = attempts + 1, error = NULL, updated_at = excluded.updated_at
+    ''', [(int(ins_id), dataset, now) for ins_id in ins_ids])
+
+def mark_failed(conn, ins_ids, dataset, error):
+    create_checkpoint_table(conn)
+    now = dt.datetime.now().isoformat(timespec='seconds')
+    conn.executemany('''
+        INSERT INTO ingest_checkpoint (ins_id, dataset, status, attempts, error, updated_at)
+        VALUES (?, ?, 'failed', 1, ?, ?)
+        ON CONFLICT (ins_id, dataset) DO UPDATE SET
+            status = 'failed', attempts = attempts + 1, error = excluded.error, updated_at = excluded.updated_at
+    ''', [(int(ins_id), dataset, str(error), now) for ins_id in ins_ids])
+    conn.commit()
+
+def pending_instruments(conn, ins_ids, dataset, max_attempts=3):
+    # ins_ids without a 'done' checkpoint that have failed fewer than max_attempts times, in input order
+    create_checkpoint_table(conn)
+    rows = conn.execute('SELECT ins_id, status, attempts FROM ingest_checkpoint WHERE dataset = ?',
+                        (dataset,)).fetchall()
+    skip = {ins_id for ins_id, status, attempts in rows if status == 'done' or attempts >= max_attempts}
+    return [ins_id for ins_id in ins_ids if ins_id not in skip]
+
+def get_failures(conn):
+    create_checkpoint_table(conn)
+    return conn.execute('''
+        SELECT ins_id, dataset, attempts, error FROM ingest_checkpoint
+        WHERE status = 'failed' ORDER BY dataset, ins_id
+    ''').fetchall()
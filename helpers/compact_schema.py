@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+# Compact layout of the price tables (create_db.py --compact, migrate_compact.py):
+# dates are day numbers since 1970-01-01, open/high/low/close are integers in
+# units of 1 / PRICE_SCALE and volume is an integer, in a WITHOUT ROWID table
+# clustered on (ins_id, date). SQLite stores such integers in 1-4 bytes instead
+# of 8 bytes per REAL and 10 bytes per date string, and day numbers convert to
+# datetime64 without parsing. The layout is detected from the table itself, so
+# readers and writers handle both.
+
+PRICE_SCALE = 10000
+SCALED_COLUMNS = ('open', 'high', 'low', 'close')
+
+def compact_price_table_sql(table):
+    return f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            ins_id INTEGER NOT NULL,
+            date INTEGER NOT NULL,
+            open INTEGER,
+            high INTEGER,
+            low INTEGER,
+            close INTEGER,
+            volume INTEGER,
+            PRIMARY KEY (ins_id, date)
+        ) WITHOUT ROWID
+    '''
+
+def is_compact(conn, table):
+    # Compact tables have an INTEGER date column, the original layout a TEXT one
+    for _, name, decl_type, *_ in conn.execute(f'PRAGMA table_info({table})'):
+        if name == 'date':
+            return decl_type.upper() == 'INTEGER'
+    return False
+
+def to_day(value):
+    # Day number of a date, e.g. '2024-01-02' -> 19724
+    return int((pd.Timestamp(value).normalize() - pd.Timestamp('1970-01-01')).days)
+
+def from_day(day):
+    # 'YYYY-MM-DD' of a day number
+    return (pd.Timestamp('1970-01-01') + pd.Timedelta(days=int(day))).strftime('%Y-%m-%d')
+
+def encode_prices(df):
+    """
+    :param df: pd.DataFrame with a 'date' string or datetime column and open, high, low, close, volume
+    :return: Copy of df in the compact layout, missing values as None
+    """
+    df = df.copy()
+    if 'date' in df.columns:
+        dates = pd.to_datetime(df['date'], format='ISO8601').to_numpy().astype('datetime64[D]')
+        df['date'] = dates.astype(np.int64)
+    for col in ('volume', *SCALED_COLUMNS):
+        if col in df.columns:
+            values = (df[col].astype('float64') * (PRICE_SCALE if col in SCALED_COLUMNS else 1)).round()
+            if values.hasnans:
+                df[col] = values.astype('Int64').astype(object).where(values.notna(), None)
+            else:
+                df[col] = values.astype(np.int64)
+    return df
+
+def decode_prices(df):
+    """
+    :param df: pd.DataFrame read from a compact table
+    :return: df with date as datetime64 and float64 prices and volume
+    """
+    if 'date' in df.columns:
+        df['date'] = df['date'].to_numpy(dtype=np.int64).astype('datetime64[D]').astype('datetime64[ns]')
+    for col in SCALED_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('float64') / PRICE_SCALE
+    if 'volume' in df.columns:
+        df['volume'] = df['volume'].astype('float64')
+    return df
+
+def _compact_frame(values, names):
+    df = pd.DataFrame(values, columns=names)
+    if 'ins_id' in df.columns:
+        df['ins_id'] = df['ins_id'].astype(np.int64)
+    return decode_prices(df)
+
+def read_compact(conn, query, params=(), chunk_rows=100000):
+    """
+    Run a query on a compact table and decode the result. All columns are numeric, so rows go
+    straight into float64 arrays (NULL -> NaN) instead of through pd.read_sql_query.
+    :return: pd.DataFrame as decode_prices
+    """
+    cursor = conn.execute(query, params)
+    names = [description[0] for description in cursor.description]
+    chunks = []
+    while rows := cursor.fetchmany(chunk_rows):
+        chunks.append(np.array(rows, dtype=np.float64))
+    return _compact_frame(np.concatenate(chunks) if chunks else np.empty((0, len(names))), names)
+
+def read_compact_chunks(conn, query, params=(), chunk_rows=100000):
+    # As read_compact, one decoded frame per chunk_rows rows
+    cursor = conn.execute(query, params)
+    names = [description[0] for description in cursor.description]
+    while rows := cursor.fetchmany(chunk_rows):
+        yield _compact_frame(np.array(rows, dtype=np.float64), names)
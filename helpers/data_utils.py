@@ -1,4 +1,5 @@
 import pandas as pd
+import re
 
 def fetch_and_save_monthly_price_data(api, ins_id, start_date=None, end_date=None):
     df = api.get_instrument_stock_prices(ins_id, from_date=start_date, to_date=end_date)
@@ -29,3 +30,8 @@ def fetch_and_save_report_data(api, ins_id):
 def fetch_instrument_list(api):
     df = api.get_instruments()
     return df.index.tolist()
+
+def report_columns_to_camel_case(df):
+    # get_instrument_report_list returns snake_case columns (e.g. gross_income),
+    # the single-instrument endpoints camelCase (e.g. grossIncome)
+    return df.rename(columns=lambda col: re.sub(r'_([a-z])', lambda m: m.group(1).upper(), col))
@@ -1,19 +1,84 @@
+import os
+import shutil
 import sqlite3
+import threading
+from urllib.parse import quote
 from borsdata_api.constants import DB_FILE_MONTHLY
 
-def connect_db():
-    return sqlite3.connect(DB_FILE_MONTHLY)
+# Applied to every connection. In WAL mode synchronous=NORMAL only fsyncs at
+# checkpoints and is still safe against application crashes.
+PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,  # KiB, i.e. 64 MB page cache
+    'mmap_size': 268435456,  # 256 MB of the file memory-mapped for reads
+    'temp_store': 'MEMORY',
+}
+BUSY_TIMEOUT = 30  # seconds to wait for a lock held by another writer
+
+_connections = {}
+_lock = threading.Lock()
+
+def open_connection(db_file, read_only=False):
+    """
+    New connection with WAL and the tuned PRAGMAS.
+    WAL lets readers (backtests, index creation) run while ingest writes.
+    :param read_only: Open with mode=ro; fails if db_file does not exist instead of creating it
+    """
+    if read_only:
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(db_file))}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+    else:
+        conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT)
+        conn.execute('PRAGMA journal_mode=WAL')
+    for name, value in PRAGMAS.items():
+        conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+def get_connection(db_file=DB_FILE_MONTHLY, read_only=False):
+    """
+    Connection shared by all callers in this process and thread, opened on first use.
+    Closing it is harmless, the next call opens a new one.
+    """
+    key = (os.getpid(), threading.get_ident(), os.path.abspath(db_file), read_only)
+    with _lock:
+        conn = _connections.get(key)
+        if conn is not None:
+            try:
+                conn.total_changes
+                return conn
+            except sqlite3.ProgrammingError:  # closed by a caller
+                pass
+        conn = _connections[key] = open_connection(db_file, read_only)
+        return conn
+
+def close_connections():
+    # Connections of the calling thread; sqlite3 connections cannot be closed from other threads
+    with _lock:
+        for key in [key for key in _connections if key[:2] == (os.getpid(), threading.get_ident())]:
+            _connections.pop(key).close()
+
+def connect_db(db_file=DB_FILE_MONTHLY, read_only=False):
+    return get_connection(db_file, read_only)
+
+def backup_db(db_file):
+    # Copy db_file to the next free db_file_v<n>, returns the backup file
+    # fold the WAL into the main file so the copy is complete
+    conn = sqlite3.connect(db_file)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    version = 1
+    backup_file = f"{db_file}_v{version}"
+    while os.path.exists(backup_file):
+        version += 1
+        backup_file = f"{db_file}_v{version}"
+    shutil.copy2(db_file, backup_file)
+    print(f"Existing database backed up as {backup_file}")
+    return backup_file
 
 def backup_and_remove_existing_db(db_file):
-    import os
-    import shutil
     if os.path.exists(db_file):
-        version = 1
-        backup_file = f"{db_file}_v{version}"
-        while os.path.exists(backup_file):
-            version += 1
-            backup_file = f"{db_file}_v{version}"
-        shutil.copy2(db_file, backup_file)
-        print(f"Existing database backed up as {backup_file}")
+        backup_db(db_file)
         os.remove(db_file)
+        for suffix in ['-wal', '-shm']:
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
         print(f"Existing database {db_file} removed.")
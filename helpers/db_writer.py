@@ -0,0 +1,114 @@
+import functools
+import re
+from helpers.compact_schema import encode_prices, is_compact
+from helpers.db_utils import get_connection
+from helpers.sync_utils import bump_table_version
+
+PRICE_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+# report_data columns after ins_id, in schema order
+REPORT_COLUMNS = [
+    'year', 'period', 'revenues', 'gross_income', 'operating_income', 'profit_before_tax', 'profit_to_equity_holders',
+    'earnings_per_share', 'number_of_shares', 'dividend', 'intangible_assets', 'tangible_assets', 'financial_assets',
+    'non_current_assets', 'cash_and_equivalents', 'current_assets', 'total_assets', 'total_equity',
+    'non_current_liabilities', 'current_liabilities', 'total_liabilities_and_equity', 'net_debt',
+    'cash_flow_from_operating_activities', 'cash_flow_from_investing_activities',
+    'cash_flow_from_financing_activities', 'cash_flow_for_the_year', 'free_cash_flow', 'stock_price_average',
+    'stock_price_high', 'stock_price_low', 'report_start_date', 'report_end_date', 'broken_fiscal_year', 'currency',
+    'currency_ratio', 'net_sales', 'report_date',
+]
+
+@functools.lru_cache(maxsize=None)
+def to_snake_case(col):
+    # 'grossIncome' (single-instrument endpoints) and 'gross_income' (instList endpoints) -> 'gross_income'
+    return re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', col).lower()
+
+def _column_values(series):
+    # Python scalars for sqlite3; NaN floats are stored as NULL by SQLite itself
+    if series.dtype.kind in 'biuf':
+        return series.tolist()
+    if series.dtype.kind == 'M':
+        series = series.dt.strftime('%Y-%m-%d')
+    if not series.hasnans:
+        return series.tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+def frame_to_rows(df, columns, ins_id=None):
+    """
+    Convert a DataFrame to (ins_id, *columns) tuples for executemany, one column at a time.
+    Columns missing from df are written as NULL.
+    :param ins_id: Instrument ID of every row, None to take it from df['ins_id']
+    """
+    n = len(df)
+    ids = df['ins_id'].tolist() if ins_id is None else [int(ins_id)] * n
+    values = [_column_values(df[col]) if col in df.columns else [None] * n for col in columns]
+    return list(zip(ids, *values))
+
+class BulkWriter:
+    """
+    Writes price and report frames to SQLite with executemany over the shared
+    connection of helpers.db_utils.get_connection. All writes go into one
+    transaction that is committed by commit() or close(), instead of one
+    connection, one statement per row and one commit per instrument.
+    """
+    def __init__(self, db_file, price_table='price_data', report_table='report_data'):
+        """
+        :param db_file: SQLite database file
+        :param price_table: Table with the price_data schema
+        :param report_table: Table with the report_data schema
+        """
+        self.db_file = db_file
+        self.price_table = price_table
+        self.report_table = report_table
+        self.rows_written = 0
+        self._compact = None
+
+    @property
+    def conn(self):
+        # per thread, so a pipeline writer thread gets its own connection
+        return get_connection(self.db_file)
+
+    def write_prices(self, df, ins_id=None):
+        """
+        :param df: pd.DataFrame with a 'date' string column and open, high, low, close, volume
+        :param ins_id: Instrument ID of all rows, None to take it from df['ins_id']
+        :return: Number of rows written
+        """
+        if self._compact is None:
+            self._compact = is_compact(self.conn, self.price_table)
+        if self._compact:
+            df = encode_prices(df)
+        return self._write(self.price_table, PRICE_COLUMNS, df, ins_id)
+
+    def write_reports(self, df, ins_id=None):
+        """
+        :param df: pd.DataFrame with camelCase or snake_case report columns; columns not in the schema are ignored
+        :param ins_id: Instrument ID of all rows, None to take it from df['ins_id']
+        :return: Number of rows written
+        """
+        return self._write(self.report_table, REPORT_COLUMNS, df.rename(columns=to_snake_case), ins_id)
+
+    def _write(self, table, columns, df, ins_id):
+        rows = frame_to_rows(df, columns, ins_id)
+        placeholders = ', '.join(['?'] * (len(columns) + 1))
+        self.conn.executemany(f'INSERT OR REPLACE INTO {table} (ins_id, {", ".join(columns)}) '
+                              f'VALUES ({placeholders})', rows)
+        bump_table_version(self.conn, table)
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        conn = self.conn
+        conn.commit()
+        conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.conn.rollback()
+        self.close()
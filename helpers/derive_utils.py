@@ -0,0 +1,96 @@
+import pandas as pd
+from helpers.compact_schema import is_compact, read_compact, to_day
+from helpers.sync_utils import get_high_water_marks
+
+# Derive monthly (or weekly) tables from the daily database instead of downloading
+# the daily history a second time. All instruments of a chunk are resampled in one
+# groupby, and only periods from the last stored one onwards are rebuilt.
+
+def period_start(dates, period='month'):
+    # First day of the month, or Monday of the week, of every date
+    if period == 'month':
+        return dates.dt.to_period('M').dt.start_time
+    if period == 'week':
+        return dates.dt.normalize() - pd.to_timedelta(dates.dt.weekday, unit='D')
+    raise ValueError(f"Unknown period {period!r}, expected 'month' or 'week'")
+
+def resample_prices(df, period='month'):
+    """
+    Aggregate daily bars of many instruments at once, like resample('MS') per instrument
+    but without the empty periods
+    :param df: pd.DataFrame with ins_id, date (datetime), open, high, low, close, volume
+    :return: pd.DataFrame with ins_id, date (period start), open, high, low, close, volume
+    """
+    df = df.sort_values(['ins_id', 'date'])
+    df = df.assign(date=period_start(df['date'], period))
+    return df.groupby(['ins_id', 'date']).agg(
+        open=('open', 'first'),
+        high=('high', 'max'),
+        low=('low', 'min'),
+        close=('close', 'last'),
+        volume=('volume', 'sum'),
+    ).reset_index()
+
+def _chunks(ins_ids, size):
+    for i in range(0, len(ins_ids), size):
+        yield ins_ids[i:i + size]
+
+def _read_chunk(daily_conn, query, ins_ids, min_since, compact=False):
+    # Rows of ins_ids from min_since, the earliest since-date of the chunk
+    placeholders = ', '.join(['?'] * len(ins_ids))
+    if compact:
+        return read_compact(daily_conn, query.format(placeholders=placeholders), [*ins_ids, min_since])
+    return pd.read_sql_query(query.format(placeholders=placeholders), daily_conn, params=[*ins_ids, min_since])
+
+def derive_prices(daily_conn, writer, period='month', price_table='price_data', chunk_size=200):
+    """
+    Build writer.price_table from the daily prices, incrementally from the last stored period of every instrument
+    :param daily_conn: Connection to the daily database (read-only is enough)
+    :param writer: BulkWriter of the target database, e.g. with price_table='monthly_price_data'
+    :param period: 'month' or 'week'
+    :param chunk_size: Instruments resampled per query
+    :return: Number of rows written
+    """
+    # the last stored period may have been incomplete, so it is rebuilt as well
+    since = get_high_water_marks(writer.conn, writer.price_table)
+    compact = is_compact(daily_conn, price_table)
+    ins_ids = [row[0] for row in daily_conn.execute(f'SELECT DISTINCT ins_id FROM {price_table}')]
+    query = (f'SELECT ins_id, date, open, high, low, close, volume FROM {price_table} '
+             'WHERE ins_id IN ({placeholders}) AND date >= ?')
+    rows = 0
+    for chunk in _chunks(ins_ids, chunk_size):
+        min_since = min(since.get(ins_id, '') for ins_id in chunk)
+        if compact:
+            df = _read_chunk(daily_conn, query, chunk, to_day(min_since or '1900-01-01'), compact)
+        else:
+            df = _read_chunk(daily_conn, query, chunk, min_since)
+            df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+        df = df[df['date'] >= pd.to_datetime(df['ins_id'].map(since), format='%Y-%m-%d').fillna(pd.Timestamp.min)]
+        if not len(df):
+            continue
+        rows += writer.write_prices(resample_prices(df, period))
+        writer.commit()
+    return rows
+
+def derive_reports(daily_conn, writer, report_table='report_data', chunk_size=200):
+    """
+    Copy reports from the daily database to writer.report_table, for every instrument from its
+    last stored report period onwards
+    :param daily_conn: Connection to the daily database (read-only is enough)
+    :param writer: BulkWriter of the target database, e.g. with report_table='monthly_report_data'
+    :param chunk_size: Instruments copied per query
+    :return: Number of rows written
+    """
+    since = {ins_id: last for ins_id, last in
+             writer.conn.execute(f'SELECT ins_id, MAX(report_end_date) FROM {writer.report_table} GROUP BY ins_id')}
+    ins_ids = [row[0] for row in daily_conn.execute(f'SELECT DISTINCT ins_id FROM {report_table}')]
+    query = (f'SELECT * FROM {report_table} '
+             'WHERE ins_id IN ({placeholders}) AND COALESCE(report_end_date, \'\') >= ?')
+    rows = 0
+    for chunk in _chunks(ins_ids, chunk_size):
+        df = _read_chunk(daily_conn, query, chunk, min(since.get(ins_id, '') for ins_id in chunk))
+        df = df[df['report_end_date'].fillna('') >= df['ins_id'].map(since).fillna('')]
+        if len(df):
+            rows += writer.write_reports(df)
+            writer.commit()
+    return rows
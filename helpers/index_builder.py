@@ -0,0 +1,389 @@
+import time
+from contextlib import contextmanager
+from functools import cached_property
+import numpy as np
+import pandas as pd
+from helpers.index_state import VARIANTS, IndexState
+from helpers.index_utils import (BASE_LEVEL, REBALANCE_FREQUENCIES, cap_weights, chain_link, chain_linked_returns,
+                                 erc_rebalance, normalize_weights, rebalance_positions, rolling_variance,
+                                 simple_returns, window_variance)
+from helpers.price_panel import load_panel
+from helpers.queries import PRICE_TABLES, load_prices, load_reports
+from helpers.sync_utils import next_day
+
+# All indices of a price table from one load, chain-linked by helpers/index_utils.py. The
+# close panel is read once, and what the index variants share (rebalance dates and closes,
+# returns panel, share counts, volatilities) is computed once, on first use. A full build
+# also stores the IndexState of its last date, from which update_indices appends the
+# following dates.
+
+PRICE_PERIODS = {table: period for period, (_, table) in PRICE_TABLES.items()}
+
+def shares_panel(reports, dates, ins_ids):
+    """
+    :param reports: Report frame with ins_id, report_start_date and number_of_shares
+    :param dates: Sorted datetime64[D] dates
+    :param ins_ids: Instruments
+    :return: (dates x ins_ids) number of shares of the last report starting on or before each date,
+             NaN before the first one
+    """
+    reports = reports.drop_duplicates(subset=['ins_id', 'report_start_date']).sort_values('report_start_date')
+    reports = reports[reports['number_of_shares'].notna()]
+    columns = pd.Index(ins_ids).get_indexer(reports['ins_id'])
+    rows = np.searchsorted(dates, reports['report_start_date'].to_numpy().astype('datetime64[D]'))
+    placed = pd.DataFrame({'row': rows, 'column': columns, 'shares': reports['number_of_shares'].to_numpy()})
+    placed = placed[(placed['column'] >= 0) & (placed['row'] < len(dates))]
+    placed = placed.drop_duplicates(subset=['row', 'column'], keep='last')
+    shares = np.full((len(dates), len(ins_ids)), np.nan)
+    shares[placed['row'], placed['column']] = placed['shares']
+    return pd.DataFrame(shares).ffill().to_numpy()
+
+def variant_weights(variant, close, shares=None, variance=None):
+    """
+    Uncapped weights of the instruments with a close on the rebalance dates
+    :param variant: 'price_weighted', 'market_cap_weighted', 'equal_weighted' or 'risk_parity'
+    :param close: (rebalances x instruments) closes of the rebalance dates
+    :param shares: Number of shares on the rebalance dates, for market_cap_weighted
+    :param variance: Return variances of the windows ending on the rebalance dates, for risk_parity
+    :return: (rebalances x instruments) weights, rows summing to 1 (or 0 without weights)
+    """
+    held = ~np.isnan(close)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if variant == 'price_weighted':
+            weights = np.where(held, close, 0.0)
+        elif variant == 'equal_weighted':
+            weights = held
+        elif variant == 'market_cap_weighted':
+            weights = np.where(held, close * shares, 0.0)
+        elif variant == 'risk_parity':
+            # inverse volatility
+            weights = np.where(held & (variance > 0), 1 / np.sqrt(variance), 0.0)
+        else:
+            raise ValueError(f"Unknown index variant {variant!r}")
+    return normalize_weights(weights)
+
+
+class IndexBuilder:
+    """
+    Price-weighted, market cap weighted, equal-weighted, risk parity (inverse volatility) and
+    (optionally) equal risk contribution indices of a price table, as one frame with the level
+    of every index. Weights are set on the rebalance dates of frequency, capped at cap; a
+    rebalance with fewer than 1 / cap instruments holds nothing until the next one.
+    Seconds spent per stage are collected in timings.
+    """
+    def __init__(self, storage, table='price_data', database='daily', lookback_period=252, frequency='month',
+                 cap=None):
+        """
+        :param storage: SQLiteStorage or ParquetStorage holding the price and report tables
+        :param table: Price table, e.g. 'monthly_price_data'
+        :param database: 'daily' or 'monthly', the database of the report table with the share counts
+        :param lookback_period: Number of returns in the volatility and covariance windows
+        :param frequency: Rebalance calendar, a key of REBALANCE_FREQUENCIES
+        :param cap: Max. weight of an instrument at a rebalance, None for no cap
+        """
+        self.storage = storage
+        self.table = table
+        self.database = database
+        self.lookback_period = lookback_period
+        self.frequency = frequency
+        self.cap = cap
+        self.timings = {}
+        self.weights = {}
+        self.levels = {}
+        self.erc_weight = None
+        with self._stage('load prices'):
+            self.panel = load_panel(storage, table)
+            self.close = np.asarray(self.panel['close'], dtype=np.float64)
+            self.dates = pd.DatetimeIndex(self.panel.dates.astype('datetime64[ns]'), name='date')
+            self.positions = rebalance_positions(self.panel.dates, frequency)
+
+    @contextmanager
+    def _stage(self, name):
+        start = time.time()
+        yield
+        self.timings[name] = self.timings.get(name, 0) + time.time() - start
+
+    @cached_property
+    def rebalance_close(self):
+        return self.close[self.positions]
+
+    @cached_property
+    def returns(self):
+        with self._stage('returns'):
+            return simple_returns(self.close)
+
+    @cached_property
+    def shares(self):
+        # Number of shares on the rebalance dates
+        with self._stage('load shares'):
+            reports = load_reports(columns=['number_of_shares'], database=self.database, storage=self.storage)
+            return shares_panel(reports, self.panel.dates[self.positions], self.panel.ins_ids)
+
+    @cached_property
+    def variance(self):
+        # Return variances of the windows ending on the rebalance dates
+        returns = self.returns
+        with self._stage('volatility'):
+            return rolling_variance(returns, self.lookback_period, rows=self.positions)
+
+    def _erc_weights(self):
+        # One solve per rebalance date with a full covariance window, warm-started from the last weights
+        weights = np.zeros((len(self.positions), self.close.shape[1]))
+        previous = np.zeros(self.close.shape[1])
+        for i, position in enumerate(self.positions):
+            if position < self.lookback_period:
+                continue
+            weights[i], converged = erc_rebalance(self.close[position - self.lookback_period:position + 1], previous)
+            if not converged:
+                print(f"ERC weights of {self.dates[position].date()} did not converge")
+            if weights[i].any():
+                previous = weights[i]
+        self.erc_weight = previous
+        return weights
+
+    def rebalance_weights(self, variant):
+        """
+        :param variant: One of VARIANTS
+        :return: (rebalances x instruments) capped weights of the variant on the rebalance dates
+        """
+        if variant not in self.weights:
+            shares = self.shares if variant == 'market_cap_weighted' else None
+            variance = self.variance if variant == 'risk_parity' else None
+            with self._stage(f'{variant} weights'):
+                if variant == 'erc':
+                    weights = self._erc_weights()
+                else:
+                    weights = variant_weights(variant, self.rebalance_close, shares, variance)
+                self.weights[variant] = cap_weights(weights, self.cap)
+                skipped = weights.any(axis=1) & ~self.weights[variant].any(axis=1)
+                if skipped.any():
+                    print(f"{variant}: {skipped.sum()} rebalance dates with fewer than 1 / cap instruments "
+                          f"hold nothing")
+        return self.weights[variant]
+
+    def index(self, variant):
+        """
+        :param variant: One of VARIANTS
+        :return: Levels of the variant, BASE_LEVEL on its first rebalance date and NaN before it
+        """
+        weights = self.rebalance_weights(variant)
+        with self._stage(f'{variant} index'):
+            self.levels[variant] = chain_link(chain_linked_returns(self.close, weights, self.positions))
+        return self.levels[variant]
+
+    def build(self, erc=False):
+        """
+        :param erc: Include the equal risk contribution index
+        :return: pd.DataFrame with date and the <variant>_index levels
+        """
+        variants = VARIANTS if erc else VARIANTS[:-1]
+        return pd.DataFrame({'date': self.dates, **{f'{variant}_index': self.index(variant) for variant in variants}})
+
+    def state(self, erc=False):
+        """
+        :return: IndexState of the last date, call after build()
+        """
+        returns = self.returns[-self.lookback_period:]
+        valid = ~np.isnan(returns)
+        x = np.where(valid, returns, 0.0)
+        # last close of every instrument, the price its quantity is valued at until it trades again
+        traded = ~np.isnan(self.close)
+        last_row = len(self.close) - 1 - traded[::-1].argmax(axis=0)
+        last_close = np.where(traded.any(axis=0), self.close[last_row, np.arange(self.close.shape[1])], np.nan)
+        fields = {'close': self.close[-1], 'last_close': last_close, 'count': valid.sum(axis=0),
+                  'total': x.sum(axis=0), 'total_sq': (x * x).sum(axis=0)}
+        rebalance_date, rebalance_levels = None, {}
+        if len(self.positions):
+            rebalance_date = self.dates[self.positions[-1]]
+            rebalance_levels = {variant: levels[self.positions[-1]] for variant, levels in self.levels.items()}
+            with np.errstate(divide='ignore', invalid='ignore'):
+                for variant in self.levels:
+                    weights = self.weights[variant][-1]
+                    fields[f'{variant}_quantity'] = np.where(weights > 0, weights / self.rebalance_close[-1], 0.0)
+        if erc and self.erc_weight is not None:
+            fields['erc_weight'] = self.erc_weight
+        return IndexState(self.dates[-1], self.lookback_period, self.panel.ins_ids, erc=erc, frequency=self.frequency,
+                          cap=self.cap, levels={variant: levels[-1] for variant, levels in self.levels.items()},
+                          rebalance_date=rebalance_date, rebalance_levels=rebalance_levels, **fields)
+
+    def save(self, index_table, erc=False):
+        """
+        Build the indices, replace index_table with them and store the IndexState of the last date
+        :param index_table: e.g. 'index_data' or 'monthly_index_data'
+        """
+        df = self.build(erc)
+        with self._stage('write'):
+            self.storage.write(index_table, df)
+            self.state(erc).write(self.storage, index_table)
+        print(', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in self.timings.items()))
+        return df
+
+
+def _pivot(df, dates, ins_ids):
+    # (dates x ins_ids) closes of a long frame, rounded to float32 as in the price panel so that
+    # updates give the same indices as a full build
+    close = np.full((len(dates), len(ins_ids)), np.nan)
+    rows = pd.DatetimeIndex(dates).get_indexer(df['date'])
+    columns = pd.Index(ins_ids).get_indexer(df['ins_id'])
+    keep = (rows >= 0) & (columns >= 0)
+    close[rows[keep], columns[keep]] = df['close'].to_numpy(dtype=np.float32, na_value=np.nan)[keep]
+    return close
+
+def _segment_levels(storage, period, calendar, start, end, quantity, level, ins_ids):
+    # Levels of rows start + 1 to end of a segment held from rebalance row start to rebalance row end,
+    # from its level on row start, through the engine of a full build
+    close = _pivot(load_prices(start=calendar[start], end=calendar[end], columns=['close'], period=period,
+                               storage=storage, cache=False), calendar[start:end + 1], ins_ids)
+    weights = np.vstack([np.where(quantity > 0, quantity * close[0], 0.0), np.zeros(len(ins_ids))])
+    returns = chain_linked_returns(close, weights, [0, end - start])
+    return level * np.cumprod(1 + np.nan_to_num(returns[1:]))
+
+def update_indices(storage, table, database, index_table, lookback_period, erc=False, frequency='month', cap=None):
+    """
+    Append the indices of the price dates after the last one of index_table, from its IndexState,
+    reading only the new prices, the prices leaving the volatility window and, on rebalance dates,
+    the ERC covariance window and the segment of an instrument that left. Until a rebalance
+    date, a held instrument without a close is valued at its last one; when it has no close on
+    the rebalance date it left the index, and the levels since its last close are revised as in
+    a full build (index_table is then rewritten rather than appended to). Builds all dates with
+    IndexBuilder when there is no state for these settings. Prices added for dates that are
+    already indexed need a full build.
+    :param storage: SQLiteStorage or ParquetStorage holding the price, report and index tables
+    :param table: Price table, e.g. 'monthly_price_data'
+    :param database: 'daily' or 'monthly', the database of the report table with the share counts
+    :param index_table: e.g. 'index_data' or 'monthly_index_data'
+    :return: pd.DataFrame of the rows appended (all rows after a full build)
+    """
+    start_time = time.time()
+    state = IndexState.read(storage, index_table)
+    calendar = None
+    if state is not None and storage.exists(index_table):
+        calendar = pd.DatetimeIndex(pd.to_datetime(storage.read(index_table, columns=['date'])['date'])).sort_values()
+    if state is None or not state.matches(lookback_period, erc, frequency, cap) or calendar is None \
+            or not len(calendar) or calendar[-1] != state.last_date:
+        print(f"No index state of {index_table} for these settings, building all dates")
+        return IndexBuilder(storage, table, database, lookback_period, frequency, cap).save(index_table, erc)
+
+    period = PRICE_PERIODS[table]
+    new = load_prices(start=next_day(state.last_date), columns=['close'], period=period, storage=storage, cache=False)
+    if new.empty:
+        print(f"{index_table} is up to date ({state.last_date.date()})")
+        return new.iloc[:0]
+    new_dates = pd.DatetimeIndex(np.unique(new['date']))
+    state.extend(new['ins_id'].unique())
+    close = _pivot(new, new_dates, state.ins_ids)
+    calendar = calendar.append(new_dates)
+    first, window = len(calendar) - len(new_dates), lookback_period
+
+    # Prices of the returns leaving the volatility window, rows first - window - 1 to last - window
+    low, high = max(first - window - 1, 0), min(len(calendar) - 1 - window, first - 1)
+    leaving = np.empty((0, len(state.ins_ids)))
+    if high >= low:
+        leaving = _pivot(load_prices(start=calendar[low], end=calendar[high], columns=['close'], period=period,
+                                     storage=storage, cache=False), calendar[low:high + 1], state.ins_ids)
+
+    def price(row):
+        return leaving[row - low] if row < first else close[row - first]
+
+    # shares of the possible rebalance dates, the last indexed date and all new dates but the last
+    reports = load_reports(columns=['number_of_shares'], database=database, storage=storage)
+    shares = shares_panel(reports, calendar[first - 1:-1].to_numpy().astype('datetime64[D]'), state.ins_ids)
+    periods = calendar.to_period(REBALANCE_FREQUENCIES[frequency])
+    variants = VARIANTS if erc else VARIANTS[:-1]
+    rows = {'date': new_dates, **{f'{variant}_index': np.full(len(new_dates), np.nan) for variant in variants}}
+    revised = {}  # {(date, column): level} of dates already in index_table
+
+    def set_level(row, variant, level):
+        if row >= first:
+            rows[f'{variant}_index'][row - first] = level
+        else:
+            revised[calendar[row], f'{variant}_index'] = level
+
+    previous_close = state.close
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i, row in enumerate(range(first, len(calendar))):
+            # the date before was the last of its period: rebalance at its close
+            if periods[row] != periods[row - 1]:
+                rebalance = row - 1
+                for variant in variants:
+                    quantity = getattr(state, f'{variant}_quantity')
+                    # held instruments without a close on the rebalance date left in the segment
+                    if state.rebalance_date is not None and ((quantity > 0) & np.isnan(previous_close)).any():
+                        segment = calendar.get_loc(state.rebalance_date)
+                        levels = _segment_levels(storage, period, calendar, segment, rebalance, quantity,
+                                                 state.rebalance_levels[variant], state.ins_ids)
+                        for segment_row, level in enumerate(levels, segment + 1):
+                            set_level(segment_row, variant, level)
+                        state.levels[variant] = levels[-1]
+
+                rebalance_close = previous_close[None, :]
+                variance = window_variance(state.count, state.total, state.total_sq, window)[None, :]
+                for variant in variants:
+                    if variant != 'erc':
+                        weights = variant_weights(variant, rebalance_close, shares[i][None, :], variance)[0]
+                    elif rebalance >= window:
+                        prices = _pivot(load_prices(start=calendar[rebalance - window], end=calendar[rebalance],
+                                                    columns=['close'], period=period, storage=storage, cache=False),
+                                        calendar[rebalance - window:row], state.ins_ids)
+                        weights, converged = erc_rebalance(prices, state.erc_weight)
+                        if not converged:
+                            print(f"ERC weights of {calendar[rebalance].date()} did not converge")
+                        if weights.any():
+                            state.erc_weight = weights
+                    else:
+                        weights = np.zeros(len(state.ins_ids))
+                    if weights.any():
+                        weights = cap_weights(weights[None, :], cap)[0]
+                        if not weights.any():
+                            print(f"{variant}: fewer than 1 / cap instruments on {calendar[rebalance].date()}, "
+                                  f"holds nothing")
+                    setattr(state, f'{variant}_quantity', np.where(weights > 0, weights / previous_close, 0.0))
+                    # the index starts at its first rebalance date with weights
+                    if weights.any() and np.isnan(state.levels[variant]):
+                        state.levels[variant] = BASE_LEVEL
+                        set_level(rebalance, variant, BASE_LEVEL)
+                    state.rebalance_levels[variant] = state.levels[variant]
+                state.rebalance_date = calendar[rebalance]
+
+            # quantities held since the last rebalance, valued at their last close
+            carried = np.where(np.isnan(close[i]), state.last_close, close[i])
+            for variant in variants:
+                quantity = getattr(state, f'{variant}_quantity')
+                held = quantity > 0
+                previous_value = quantity[held] @ state.last_close[held]
+                if previous_value > 0:
+                    state.levels[variant] *= (quantity[held] @ carried[held]) / previous_value
+                rows[f'{variant}_index'][i] = state.levels[variant]
+            state.last_close = carried
+
+            returns = close[i] / previous_close - 1
+            valid = ~np.isnan(returns)
+            x = np.where(valid, returns, 0.0)
+            state.count += valid
+            state.total += x
+            state.total_sq += x * x
+            if row - window >= 1:
+                leaving_returns = price(row - window) / price(row - window - 1) - 1
+                leaving_valid = ~np.isnan(leaving_returns)
+                x_leaving = np.where(leaving_valid, leaving_returns, 0.0)
+                state.count -= leaving_valid
+                state.total -= x_leaving
+                state.total_sq -= x_leaving * x_leaving
+            previous_close = close[i]
+
+    df = pd.DataFrame(rows)
+    if revised:
+        indexed = storage.read(index_table)
+        indexed['date'] = pd.to_datetime(indexed['date'])
+        indexed = indexed.set_index('date')
+        for (date, column), level in revised.items():
+            indexed.loc[date, column] = level
+        storage.write(index_table, pd.concat([indexed.reset_index(), df], ignore_index=True))
+        print(f"Revised {len({date for date, _ in revised})} dates of {index_table} for instruments that left")
+    else:
+        storage.write(index_table, df, if_exists='append')
+    state.last_date = new_dates[-1]
+    state.close = close[-1]
+    state.write(storage, index_table)
+    print(f"Appended {len(df)} dates to {index_table} in {time.time() - start_time:.2f}s")
+    return df
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+# State of the indices of an index table as of its last date, so that new dates can be
+# appended without recomputing the history (helpers/index_builder.py, update_indices).
+# Stored next to the index table through the storage backend: <index_table>_state has a
+# row per instrument, <index_table>_state_meta the last date, the settings and the levels.
+
+# Index variants, in the column order of the index tables (<variant>_index)
+VARIANTS = ('price_weighted', 'market_cap_weighted', 'equal_weighted', 'risk_parity', 'erc')
+INSTRUMENT_FIELDS = ('close', 'last_close', 'count', 'total', 'total_sq', 'erc_weight',
+                     *(f'{variant}_quantity' for variant in VARIANTS))
+
+
+class IndexState:
+    """
+    Per instrument (ins_ids): close on the last date (NaN if none) and last_close, the last one
+    on or before it; count, total and total_sq, the number, sum and sum of squares of the returns
+    in the volatility window; erc_weight, the weight of the last ERC rebalance (the solver's warm
+    start); <variant>_quantity, the quantity held since the last rebalance. Per variant, levels
+    holds the level on the last date and rebalance_levels the one on rebalance_date, the last
+    rebalance date (NaN before the index starts).
+    """
+    def __init__(self, last_date, lookback_period, ins_ids, erc=False, frequency='month', cap=None, levels=None,
+                 rebalance_date=None, rebalance_levels=None, **fields):
+        self.last_date = pd.Timestamp(last_date)
+        self.rebalance_date = None if pd.isna(rebalance_date) else pd.Timestamp(rebalance_date)
+        self.lookback_period = int(lookback_period)
+        self.erc = bool(erc)
+        self.frequency = frequency
+        self.cap = None if cap is None or pd.isna(cap) else float(cap)
+        self.levels = {variant: np.nan for variant in VARIANTS} | (levels or {})
+        self.rebalance_levels = {variant: np.nan for variant in VARIANTS} | (rebalance_levels or {})
+        self.ins_ids = np.asarray(ins_ids, dtype=np.int64)
+        for field in INSTRUMENT_FIELDS:
+            default = np.full(len(self.ins_ids), np.nan if field.endswith('close') else 0.0)
+            setattr(self, field, np.asarray(fields.get(field, default), dtype=np.float64))
+
+    def matches(self, lookback_period, erc, frequency, cap):
+        # Built with these settings
+        return (self.lookback_period, self.erc, self.frequency, self.cap) == (lookback_period, erc, frequency, cap)
+
+    def extend(self, ins_ids):
+        # Add instruments that are not in the state yet
+        new = np.setdiff1d(np.asarray(ins_ids, dtype=np.int64), self.ins_ids)
+        if not len(new):
+            return
+        self.ins_ids = np.concatenate([self.ins_ids, new])
+        for field in INSTRUMENT_FIELDS:
+            default = np.full(len(new), np.nan if field.endswith('close') else 0.0)
+            setattr(self, field, np.concatenate([getattr(self, field), default]))
+
+    @classmethod
+    def read(cls, storage, index_table):
+        """
+        :return: IndexState, or None if the index table has no stored state
+        """
+        if not (storage.exists(f'{index_table}_state') and storage.exists(f'{index_table}_state_meta')):
+            return None
+        meta = storage.read(f'{index_table}_state_meta').iloc[0]
+        if any(f'{variant}_rebalance_level' not in meta for variant in VARIANTS):
+            return None  # written before the indices carried closes over gaps
+
+        def levels(suffix):
+            return {variant: np.nan if pd.isna(meta[f'{variant}_{suffix}']) else float(meta[f'{variant}_{suffix}'])
+                    for variant in VARIANTS}
+
+        df = storage.read(f'{index_table}_state', columns=['ins_id', *INSTRUMENT_FIELDS]).sort_values('ins_id')
+        return cls(meta['last_date'], meta['lookback_period'], df['ins_id'], erc=int(meta['erc']),
+                   frequency=meta['frequency'], cap=meta['cap'], levels=levels('level'),
+                   rebalance_date=meta['rebalance_date'], rebalance_levels=levels('rebalance_level'),
+                   **{field: df[field].to_numpy(dtype=np.float64, na_value=np.nan) for field in INSTRUMENT_FIELDS})
+
+    def write(self, storage, index_table):
+        storage.write(f'{index_table}_state', pd.DataFrame({
+            'ins_id': self.ins_ids, **{field: getattr(self, field) for field in INSTRUMENT_FIELDS},
+        }))
+        storage.write(f'{index_table}_state_meta', pd.DataFrame([{
+            'last_date': self.last_date.strftime('%Y-%m-%d'), 'lookback_period': self.lookback_period,
+            'erc': int(self.erc), 'frequency': self.frequency, 'cap': np.nan if self.cap is None else self.cap,
+            'rebalance_date': None if self.rebalance_date is None else self.rebalance_date.strftime('%Y-%m-%d'),
+            **{f'{variant}_level': level for variant, level in self.levels.items()},
+            **{f'{variant}_rebalance_level': level for variant, level in self.rebalance_levels.items()},
+        }]))
@@ -0,0 +1,284 @@
+import numpy as np
+import pandas as pd
+
+# Index computations over (dates x instruments) price panels, see helpers/price_panel.py.
+# Indices are chain-linked: weights are set on rebalance dates, held as fixed quantities
+# until the next one, and the return of a date only counts the instruments with a price
+# on it and on the date before. This is a divisor index whose divisor is adjusted on every
+# rebalance, entry and exit, so the level does not jump when the constituents change.
+# Dates x instruments arrays are processed in blocks of columns, so memory grows with
+# dates x block. Covariances are only estimated on rebalance dates, and are never built
+# as instruments x instruments matrices.
+
+BLOCK_SIZE = 256
+BASE_LEVEL = 100
+
+def simple_returns(close):
+    """
+    :param close: (dates x instruments) prices, NaN where missing
+    :return: float64 returns of the same shape, NaN on the first date and where either price is missing
+    """
+    close = np.asarray(close, dtype=np.float64)
+    returns = np.full(close.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = close[1:] / close[:-1] - 1
+    return returns
+
+def _window_sums(values, window):
+    # Sums over the last window rows of every column, from one cumulative sum
+    sums = np.cumsum(values, axis=0)
+    sums[window:] = sums[window:] - sums[:-window].copy()
+    return sums
+
+def window_variance(count, total, total_sq, min_periods):
+    """
+    Sample variance from the number, sum and sum of squares of the returns in a window
+    :return: NaN where count < max(min_periods, 2)
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (total_sq - total * total / count) / (count - 1)
+    # rounding can leave tiny negative values for constant prices
+    variance = np.maximum(variance, 0)
+    variance[(count < min_periods) | (count < 2)] = np.nan
+    return variance
+
+def _rolling_variance(returns, window, min_periods):
+    valid = ~np.isnan(returns)
+    x = np.where(valid, returns, 0.0)
+    return window_variance(_window_sums(valid.astype(np.float64), window), _window_sums(x, window),
+                           _window_sums(x * x, window), min_periods)
+
+def rolling_variance(returns, window, min_periods=None, rows=None, block=BLOCK_SIZE):
+    """
+    Rolling sample variance of every column, as DataFrame.rolling(window, min_periods).var(),
+    from running sums of the returns and their squares. Missing returns are skipped, so
+    instruments can enter and leave the panel.
+    :param returns: (dates x instruments) returns, NaN where missing
+    :param window: Number of dates in the window
+    :param min_periods: Min. number of returns in the window, defaults to window
+    :param rows: Only return the variances of these rows, e.g. the rebalance positions
+    :return: float64 array of returns.shape (or len(rows) x instruments), NaN where fewer than
+             min_periods returns
+    """
+    min_periods = window if min_periods is None else min_periods
+    rows = np.arange(np.shape(returns)[0]) if rows is None else np.asarray(rows)
+    variance = np.empty((len(rows), np.shape(returns)[1]))
+    for start in range(0, variance.shape[1], block):
+        block_returns = np.asarray(returns[:, start:start + block], dtype=np.float64)
+        variance[:, start:start + block] = _rolling_variance(block_returns, window, min_periods)[rows]
+    return variance
+
+def normalize_weights(weights):
+    """
+    :param weights: (rebalances x instruments) non-negative raw weights, NaN as 0
+    :return: Rows scaled to sum to 1, rows without weights stay 0
+    """
+    weights = np.nan_to_num(np.asarray(weights, dtype=np.float64), nan=0.0, posinf=0.0)
+    totals = weights.sum(axis=1, keepdims=True)
+    return np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+
+def cap_weights(weights, cap=None):
+    """
+    Cap every weight at cap and spread the excess over the uncapped instruments of the row, in
+    proportion to their weights, until none is above it. Rows with fewer than 1 / cap instruments
+    cannot be capped and get no weights: the index holds nothing from such a rebalance date, so
+    it starts (or keeps its level) until the cap can be met.
+    :param weights: (rebalances x instruments) weights, rows summing to 1 (or 0 without weights)
+    :param cap: Max. weight of an instrument, e.g. 0.1, None for no cap
+    :return: Capped weights
+    """
+    if cap is None:
+        return weights
+    weights = weights.copy()
+    held = weights > 0
+    infeasible = held.sum(axis=1) * cap < 1
+    weights[infeasible] = 0.0
+    held[infeasible] = False
+    # every pass caps at least one more instrument of each row that is still over the cap
+    for _ in range(weights.shape[1]):
+        over = (weights > cap * (1 + 1e-12)) & ~infeasible[:, None]
+        if not over.any():
+            break
+        capped = (weights >= cap * (1 - 1e-12)) & ~infeasible[:, None]
+        excess = np.where(capped, weights - cap, 0.0).sum(axis=1, keepdims=True)
+        free = held & ~capped
+        free_total = np.where(free, weights, 0.0).sum(axis=1, keepdims=True)
+        scale = 1 + np.divide(excess, free_total, out=np.zeros_like(excess), where=free_total > 0)
+        weights = np.where(capped, cap, np.where(free, weights * scale, weights))
+    return weights
+
+def carried_close(close):
+    """
+    :param close: (dates x instruments) prices, NaN where missing
+    :return: The last close on or before every date, NaN before the first one
+    """
+    close = np.asarray(close, dtype=np.float64)
+    rows = np.where(~np.isnan(close), np.arange(len(close))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return np.take_along_axis(close, rows, axis=0)
+
+def chain_linked_returns(close, weights, positions, block=BLOCK_SIZE):
+    """
+    Return of the index on every date, holding the quantities weight / close of a rebalance date
+    from the date after it until the next rebalance date. A held instrument without a close keeps
+    its last one, so the move over a no-trade gap counts when it trades again. One without a close
+    up to and including the next rebalance date has left (delisted): from its first missing date
+    it is out of the index value on both days, which leaves the rest of the index unchanged (the
+    divisor adjustment). After the last rebalance date no later date is known, so missing closes
+    are gaps until the next rebalance. Entries wait for the next rebalance. No per-date loop:
+    every date looks up its rebalance.
+    :param close: (dates x instruments) prices, NaN where missing
+    :param weights: (len(positions) x instruments) weights set at the close of each rebalance date
+    :param positions: Increasing rows of the rebalance dates in close
+    :return: float64 array with one return per date, NaN before the first rebalance and where
+             nothing is held
+    """
+    dates = np.shape(close)[0]
+    positions = np.asarray(positions, dtype=np.int64)
+    # the last rebalance before each date, and the next one at or after it (dates if none)
+    segment = np.searchsorted(positions, np.arange(dates), side='left') - 1
+    rows = np.flatnonzero(segment >= 0)
+    segment_end = np.append(positions, dates)[segment[rows] + 1]
+    value = np.zeros(dates)
+    previous_value = np.zeros(dates)
+    for start in range(0, np.shape(close)[1], block):
+        prices = np.asarray(close[:, start:start + block], dtype=np.float64)
+        block_weights = np.asarray(weights[:, start:start + block], dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            quantities = np.where(block_weights > 0, block_weights / prices[positions], 0.0)[segment[rows]]
+        # first row with a close at or after each date, dates if none
+        next_close = np.where(~np.isnan(prices), np.arange(dates)[:, None], dates)
+        next_close = np.minimum.accumulate(next_close[::-1], axis=0)[::-1]
+        held = (quantities > 0) & (next_close[rows] <= segment_end[:, None])
+        carried = carried_close(prices)
+        value[rows] += np.where(held, quantities * carried[rows], 0.0).sum(axis=1)
+        previous_value[rows] += np.where(held, quantities * carried[rows - 1], 0.0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(previous_value > 0, value / previous_value - 1, np.nan)
+
+def chain_link(returns, base=BASE_LEVEL):
+    """
+    :param returns: Index return per date, NaN where there is none
+    :return: Index levels, base on the date before the first return and NaN before it;
+             dates without a return keep the level
+    """
+    levels = np.full(len(returns), np.nan)
+    valid = np.flatnonzero(~np.isnan(returns))
+    if len(valid):
+        start = valid[0] - 1
+        levels[start] = base
+        levels[start + 1:] = base * np.cumprod(1 + np.nan_to_num(returns[start + 1:]))
+    return levels
+
+# Rebalance calendars, as pandas period frequencies
+REBALANCE_FREQUENCIES = {'day': 'D', 'week': 'W', 'month': 'M', 'quarter': 'Q', 'year': 'Y'}
+
+def rebalance_positions(dates, frequency='month'):
+    """
+    :param dates: Sorted dates of the panel, e.g. PricePanel.dates
+    :param frequency: 'day', 'week', 'month', 'quarter' or 'year'
+    :return: Positions of the last date of every period, but the last (possibly incomplete) one
+    """
+    periods = pd.DatetimeIndex(dates).to_period(REBALANCE_FREQUENCIES[frequency])
+    return np.flatnonzero(periods[1:] != periods[:-1])
+
+class ShrunkCovariance:
+    """
+    Ledoit-Wolf covariance of returns: the sample covariance shrunk towards a multiple of the
+    identity with the intensity that minimizes the expected squared error, so it stays
+    well-conditioned when there are more instruments than returns. It is kept as
+    scale * x'x + ridge * I of the centered returns x, so products and solves cost
+    O(dates x instruments) and O(dates^2 x instruments) and the instruments x instruments
+    matrix is never built.
+    """
+    def __init__(self, returns):
+        """
+        :param returns: (dates x instruments) returns without NaN
+        """
+        self.x = returns - returns.mean(axis=0)
+        dates, instruments = self.x.shape
+        gram = self.x @ self.x.T
+        mu = np.trace(gram) / dates / instruments
+        squared_norm = np.einsum('ij,ij->', gram, gram) / dates ** 2
+        # squared distance of the sample covariance to the target, and its estimation error
+        d2 = squared_norm - mu * mu * instruments
+        b2 = min((np.diag(gram) ** 2).sum() / dates ** 2 - squared_norm / dates, d2)
+        self.shrinkage = b2 / d2 if d2 > 0 else 1.0
+        self.scale = (1 - self.shrinkage) / dates
+        self.ridge = self.shrinkage * mu
+
+    def __matmul__(self, y):
+        return self.scale * (self.x.T @ (self.x @ y)) + self.ridge * y
+
+    def diagonal(self):
+        return self.scale * np.einsum('ij,ij->j', self.x, self.x) + self.ridge
+
+    def solve(self, diagonal, g):
+        """
+        :return: z with (covariance + diag(diagonal)) @ z = g, by the Woodbury identity
+        """
+        d = diagonal + self.ridge
+        if self.scale == 0:
+            return g / d
+        if self.x.shape[0] >= self.x.shape[1]:
+            return np.linalg.solve(self.scale * self.x.T @ self.x + np.diag(d), g)
+        xd = self.x / d
+        inner = np.eye(self.x.shape[0]) / self.scale + xd @ self.x.T
+        return g / d - xd.T @ np.linalg.solve(inner, xd @ g)
+
+def erc_weights(covariance, initial=None, tol=1e-8, max_iter=100):
+    """
+    Equal risk contribution weights, w_i * (covariance @ w)_i equal for every instrument. Minimizes
+    y' covariance y / 2 - sum(log(y)) / n with Newton steps and a backtracking line search; the
+    minimum has y_i * (covariance @ y)_i = 1 / n. Convergence is quadratic near the solution, so a
+    warm start from the previous rebalance's weights takes few steps.
+    :param covariance: ShrunkCovariance
+    :param initial: Starting weights, e.g. the previous rebalance's, inverse volatility by default
+    :param tol: Max. relative deviation of a risk contribution from the mean one
+    :return: (weights summing to 1, number of steps, converged)
+    """
+    n = covariance.x.shape[1]
+    y = 1 / np.sqrt(covariance.diagonal()) if initial is None else np.asarray(initial, dtype=np.float64)
+    y = y / np.sqrt(y @ (covariance @ y))  # the solution has y' covariance y = 1
+    marginal = covariance @ y
+    for step in range(max_iter):
+        contributions = y * marginal
+        if np.abs(contributions * n / contributions.sum() - 1).max() < tol:
+            return y / y.sum(), step, True
+        gradient = marginal - 1 / (n * y)
+        direction = covariance.solve(1 / (n * y * y), gradient)
+        decrement = gradient @ direction
+        objective = y @ marginal / 2 - np.log(y).sum() / n
+        t = 1.0
+        while True:
+            candidate = y - t * direction
+            if (candidate > 0).all():
+                candidate_marginal = covariance @ candidate
+                # once the decrease is below the rounding of the objective, take the full step
+                if decrement < 1e-12 * abs(objective) or \
+                        candidate @ candidate_marginal / 2 - np.log(candidate).sum() / n <= objective - 1e-4 * t * decrement:
+                    break
+            t /= 2
+        y, marginal = candidate, candidate_marginal
+    return y / y.sum(), max_iter, False
+
+def erc_rebalance(prices, previous):
+    """
+    Weights of a rebalance date, solved for the instruments with all window returns and a volatility
+    :param prices: (window + 1 x instruments) prices up to and including the rebalance date
+    :param previous: Weights of the previous rebalance per instrument, 0 where not held
+    :return: (weights per instrument, 0 where not eligible, converged)
+    """
+    returns = prices[1:] / prices[:-1] - 1
+    # a complete window and a volatility, so the covariance is positive definite
+    eligible = np.isfinite(returns).all(axis=0)
+    eligible[eligible] = returns[:, eligible].std(axis=0) > 0
+    weights = np.zeros(prices.shape[1])
+    if not eligible.any():
+        return weights, True
+    covariance = ShrunkCovariance(returns[:, eligible])
+    initial = previous[eligible]
+    inverse_volatility = 1 / np.sqrt(covariance.diagonal())
+    initial = np.where(initial > 0, initial, inverse_volatility / inverse_volatility.sum())
+    weights[eligible], _, converged = erc_weights(covariance, initial)
+    return weights, converged
@@ -0,0 +1,141 @@
+import queue
+import threading
+import time
+
+_DONE = object()
+
+class IngestPipeline:
+    """
+    Pipelined ingest: a pool of fetch workers pulls instrument IDs from a work
+    queue, fetches and transforms their data, and hands the results over a
+    bounded queue to a single writer thread that owns the database connection.
+    Network, pandas conversion and disk writes overlap; when the writer falls
+    behind, the full queue blocks the fetchers (backpressure). Requests are
+    paced by the rate limiter of the API client used in `fetch`.
+    """
+    def __init__(self, fetch, write, commit, close=None, workers=8, queue_size=16, commit_every=50,
+                 progress_seconds=10):
+        """
+        :param fetch: fetch(ins_id) -> result, called concurrently on the worker threads
+        :param write: write(ins_id, result), called on the writer thread only
+        :param commit: commit(), called on the writer thread every commit_every results and at the end
+        :param close: Optional close(), called on the writer thread after the last commit
+        :param workers: Number of fetch workers
+        :param queue_size: Max. number of fetched results waiting for the writer
+        :param commit_every: Results written per transaction
+        :param progress_seconds: Interval between progress lines, None for no progress reporting
+        """
+        self.fetch = fetch
+        self.write = write
+        self.commit = commit
+        self.close = close
+        self.workers = workers
+        self.queue_size = queue_size
+        self.commit_every = commit_every
+        self.progress_seconds = progress_seconds
+        self.written = 0
+        self.failed = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run(self, ins_ids):
+        """
+        Fetch and write all instruments, blocking until done
+        :param ins_ids: Instrument ID list
+        :return: dict {ins_id: exception} of instruments whose fetch or write failed
+        """
+        work = queue.Queue()
+        for ins_id in ins_ids:
+            work.put(ins_id)
+        results = queue.Queue(maxsize=self.queue_size)
+        self.written, self.failed = 0, {}
+        self._stop.clear()
+        writer_error = []
+        self._start = time.monotonic()
+
+        fetchers = [threading.Thread(target=self._fetch_worker, args=(work, results), name=f"fetch-{i}", daemon=True)
+                    for i in range(self.workers)]
+        writer = threading.Thread(target=self._write_worker, args=(results, len(ins_ids), writer_error),
+                                  name="writer", daemon=True)
+        writer.start()
+        for fetcher in fetchers:
+            fetcher.start()
+        try:
+            for fetcher in fetchers:
+                fetcher.join()
+            self._put(results, _DONE)
+            writer.join()
+        except KeyboardInterrupt:
+            self._stop.set()
+            writer.join()
+            raise
+        if writer_error:
+            raise writer_error[0]
+        self._report(len(ins_ids), results, final=True)
+        return self.failed
+
+    def _fetch_worker(self, work, results):
+        while not self._stop.is_set():
+            try:
+                ins_id = work.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = self.fetch(ins_id)
+            except Exception as e:
+                with self._lock:
+                    self.failed[ins_id] = e
+                print(f"Fetching ins_id {ins_id} failed: {e}")
+                continue
+            self._put(results, (ins_id, result))
+
+    def _put(self, results, item):
+        # blocks while the writer is behind, gives up if the pipeline is stopped
+        while not self._stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    def _write_worker(self, results, total, writer_error):
+        pending = 0
+        last_report = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                try:
+                    item = results.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                ins_id, result = item
+                try:
+                    self.write(ins_id, result)
+                except Exception as e:
+                    with self._lock:
+                        self.failed[ins_id] = e
+                    print(f"Writing ins_id {ins_id} failed: {e}")
+                    continue
+                self.written += 1
+                pending += 1
+                if pending >= self.commit_every:
+                    self.commit()
+                    pending = 0
+                if self.progress_seconds is not None and time.monotonic() - last_report >= self.progress_seconds:
+                    self._report(total, results)
+                    last_report = time.monotonic()
+            self.commit()
+            if self.close is not None:
+                self.close()
+        except BaseException as e:
+            # e.g. the database is unusable: stop the fetchers instead of letting them block on a full queue
+            writer_error.append(e)
+            self._stop.set()
+
+    def _report(self, total, results, final=False):
+        seconds = time.monotonic() - self._start
+        with self._lock:
+            failed = len(self.failed)
+        print(f"{'Done' if final else 'Progress'}: {self.written}/{total} instruments written, {failed} failed, "
+              f"{self.written / seconds if seconds else 0.0:.1f} instruments/s, {results.qsize()} waiting to be written.")
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from borsdata_api.constants import PANEL_PATH
+
+# Dense (dates x instruments) float32 arrays of a price table, one memory-mapped
+# .npy file per field. Missing prices are NaN. The panel is rebuilt when the
+# fingerprint of the source table no longer matches the one it was built from,
+# and processes that load the same panel share its pages through the page cache.
+# Every build goes into a new version directory and CURRENT_FILE is switched to it,
+# so readers that still map an old version are never in the way (Windows cannot
+# delete mapped files); old versions are removed once nothing holds them.
+
+PANEL_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+META_FILE = 'meta.json'
+CURRENT_FILE = 'current'
+
+class PricePanel:
+    """
+    Read-only view of a built panel: panel.dates (datetime64[D]), panel.ins_ids (int64)
+    and panel['close'] etc. as (len(dates), len(ins_ids)) float32 memory maps
+    """
+    def __init__(self, path):
+        """
+        :param path: Version directory written by build_panel
+        """
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.fields = tuple(self.meta['fields'])
+        self.dates = np.load(os.path.join(path, 'dates.npy'))
+        self.ins_ids = np.load(os.path.join(path, 'ins_ids.npy'))
+        self.column_of = {int(ins_id): i for i, ins_id in enumerate(self.ins_ids)}
+        self._arrays = {}
+
+    def __getitem__(self, field):
+        if field not in self.fields:
+            raise KeyError(f"Field {field!r} not in panel, available: {', '.join(self.fields)}")
+        if field not in self._arrays:
+            self._arrays[field] = np.load(os.path.join(self.path, f'{field}.npy'), mmap_mode='r')
+        return self._arrays[field]
+
+    def row_of(self, date):
+        # Index of the first panel date >= date
+        return int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date).date(), 'D')))
+
+    def frame(self, field):
+        """
+        :return: pd.DataFrame over the memory map without copying, index date, columns ins_id
+        """
+        return pd.DataFrame(self[field], index=pd.DatetimeIndex(self.dates.astype('datetime64[ns]'), name='date'),
+                            columns=pd.Index(self.ins_ids, name='ins_id'), copy=False)
+
+def panel_path(storage, table):
+    # Directory of the versions of a table's panel, per storage backend and database
+    digest = hashlib.sha1(storage.location.encode()).hexdigest()[:12]
+    return os.path.join(PANEL_PATH, f'{table}-{digest}')
+
+def current_version(path):
+    """
+    :param path: Panel directory of panel_path
+    :return: Directory of the current version, None if there is none
+    """
+    try:
+        with open(os.path.join(path, CURRENT_FILE)) as f:
+            version = os.path.join(path, f.read().strip())
+    except OSError:
+        return None
+    return version if os.path.exists(os.path.join(version, META_FILE)) else None
+
+def _remove_old_versions(path, keep):
+    # Best effort: versions still mapped by other processes on Windows are removed by a later build.
+    # Versions without META_FILE are still being written, unless a build failed more than a day ago.
+    for name in os.listdir(path):
+        version = os.path.join(path, name)
+        if not os.path.isdir(version) or name in keep:
+            continue
+        if os.path.exists(os.path.join(version, META_FILE)) or os.path.getmtime(version) < time.time() - 86400:
+            shutil.rmtree(version, ignore_errors=True)
+
+def build_panel(storage, table='price_data', fields=PANEL_FIELDS, path=None):
+    """
+    Materialize fields of a long (ins_id, date, ...) price table as dense float32 arrays
+    :param storage: SQLiteStorage or ParquetStorage holding the table
+    :param table: Table with ins_id, date and the fields, e.g. 'monthly_price_data'
+    :param path: Panel directory, panel_path(storage, table) by default
+    :return: PricePanel
+    """
+    path = path or panel_path(storage, table)
+    fingerprint = storage.fingerprint(table)
+    df = storage.read(table, columns=['ins_id', 'date', *fields])
+    dates = pd.to_datetime(df['date']).to_numpy().astype('datetime64[D]')
+    ins_id = df['ins_id'].to_numpy(dtype=np.int64)
+    axis_dates, rows = np.unique(dates, return_inverse=True)
+    axis_ins_ids, columns = np.unique(ins_id, return_inverse=True)
+
+    # Write a new version and switch CURRENT_FILE to it, readers keep their mapped files until they reload
+    previous = current_version(path)
+    name = uuid.uuid4().hex
+    version = os.path.join(path, name)
+    os.makedirs(version)
+    np.save(os.path.join(version, 'dates.npy'), axis_dates)
+    np.save(os.path.join(version, 'ins_ids.npy'), axis_ins_ids)
+    for field in fields:
+        array = np.lib.format.open_memmap(os.path.join(version, f'{field}.npy'), mode='w+', dtype=np.float32,
+                                          shape=(len(axis_dates), len(axis_ins_ids)))
+        array[:] = np.nan
+        array[rows, columns] = df[field].to_numpy(dtype=np.float32, na_value=np.nan)
+        array.flush()
+        del array
+    with open(os.path.join(version, META_FILE), 'w') as f:
+        json.dump({'table': table, 'fields': list(fields), 'source': fingerprint, 'rows': len(df)}, f)
+    current_tmp = os.path.join(path, f'{CURRENT_FILE}.tmp-{name}')
+    with open(current_tmp, 'w') as f:
+        f.write(name)
+    os.replace(current_tmp, os.path.join(path, CURRENT_FILE))
+    # the version before stays for readers that have just looked it up
+    _remove_old_versions(path, {name, os.path.basename(previous or '')})
+    return PricePanel(version)
+
+def load_panel(storage, table='price_data', fields=PANEL_FIELDS, rebuild=False):
+    """
+    Panel of the table, built first if missing, built from other fields or out of date
+    :param storage: SQLiteStorage or ParquetStorage holding the table
+    :param rebuild: Build even if the panel is up to date
+    :return: PricePanel
+    """
+    path = panel_path(storage, table)
+    version = current_version(path)
+    if not rebuild and version is not None:
+        panel = PricePanel(version)
+        if panel.meta['source'] == storage.fingerprint(table) and set(fields) <= set(panel.fields):
+            return panel
+    return build_panel(storage, table, fields, path)
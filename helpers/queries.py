@@ -0,0 +1,152 @@
+import pandas as pd
+from borsdata_api.constants import LEAN_LOADS
+from helpers.db_writer import PRICE_COLUMNS, REPORT_COLUMNS
+from helpers.query_cache import get_query_cache
+from helpers.storage import get_storage
+
+# Typed slices of the price, report and ranking tables. The date range and
+# instrument filters are applied by the storage backend, on SQLite through the
+# primary keys and the secondary indexes of create_db.py / create_db_monthly.py,
+# so only the requested rows and columns are read. Results are cached until the
+# table changes (helpers/query_cache.py). Lean loads downcast every chunk as it is
+# read, so the float64/object frame of the whole result never exists in memory.
+
+PRICE_TABLES = {
+    'day': ('daily', 'price_data'),
+    'week': ('monthly', 'weekly_price_data'),
+    'month': ('monthly', 'monthly_price_data'),
+}
+REPORT_TABLES = {
+    'daily': 'report_data',
+    'monthly': 'monthly_report_data',
+}
+
+DATE_FIELDS = ('date', 'report_start_date', 'report_end_date', 'report_date')
+# Result dtypes, columns not listed keep the dtype of the backend
+DTYPES = {
+    'ins_id': 'int64',
+    **{col: 'float64' for col in PRICE_COLUMNS[1:]},
+    **{col: 'float64' for col in REPORT_COLUMNS if col not in DATE_FIELDS},
+    'year': 'Int64',
+    'period': 'Int64',
+    'broken_fiscal_year': 'boolean',
+    'currency': 'string',
+}
+# Lean loads: float32 figures, prices and ranks, int32 ins_id and categorical period and currency.
+# Volume stays float64, float32 would round it to 7 digits and so its sums over periods
+LEAN_DTYPES = {
+    'ins_id': 'int32',
+    **{col: 'float32' for col, dtype in DTYPES.items() if dtype == 'float64' and col != 'volume'},
+    'year': 'Int16',
+}
+CATEGORY_COLUMNS = ('period', 'currency')
+
+def _columns(keys, columns):
+    # keys first, then the requested columns; None for all columns
+    if columns is None:
+        return None
+    return list(dict.fromkeys([*keys, *columns]))
+
+def _typed(df):
+    for col in df.columns:
+        if col in DATE_FIELDS:
+            df[col] = pd.to_datetime(df[col], format='ISO8601')
+        elif col in ('year', 'period'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+        elif col in DTYPES:
+            df[col] = df[col].astype(DTYPES[col])
+        elif col.endswith('_rank'):
+            df[col] = df[col].astype('float64')
+    return df
+
+def _lean(df):
+    for col in df.columns:
+        if col in LEAN_DTYPES:
+            df[col] = df[col].astype(LEAN_DTYPES[col])
+        elif col.endswith('_rank'):
+            df[col] = df[col].astype('float32')
+    return df
+
+def _read(storage, table, columns, start, end, ins_ids, date_column, lean):
+    if not lean:
+        return _typed(storage.read(table, columns, start, end, ins_ids, date_column))
+    chunks = [_lean(_typed(chunk)) for chunk in storage.read_chunks(table, columns, start, end, ins_ids, date_column)]
+    if not chunks:
+        return _lean(_typed(storage.read(table, columns, start, end, ins_ids, date_column)))
+    df = pd.concat(chunks, ignore_index=True)
+    # after the concat, chunks with different categories would give object columns
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def _load(storage, table, columns, start, end, ins_ids, date_column=None, cache=True, lean=None):
+    lean = LEAN_LOADS if lean is None else lean
+    query_cache = get_query_cache() if cache else None
+    if query_cache is None:
+        return _read(storage, table, columns, start, end, ins_ids, date_column, lean)
+    query = {
+        'columns': columns, 'start': start, 'end': end, 'date_column': date_column, 'lean': lean,
+        'ins_ids': sorted(int(ins_id) for ins_id in ins_ids) if ins_ids is not None else None,
+    }
+    fingerprint = storage.fingerprint(table)
+    df = query_cache.get(storage.location, table, query, fingerprint)
+    if df is None:
+        df = _read(storage, table, columns, start, end, ins_ids, date_column, lean)
+        query_cache.put(storage.location, table, query, fingerprint, df)
+    return df
+
+def memory_mb(df):
+    # Memory footprint of df in MB, strings and categories included
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+def load_prices(ins_ids=None, start=None, end=None, columns=None, period='day', storage=None, cache=True, lean=None):
+    """
+    :param ins_ids: Instruments to load, None for all
+    :param start: First date, e.g. '2010-01-01', None for no lower bound
+    :param end: Last date (inclusive), None for no upper bound
+    :param columns: Columns besides ins_id and date, e.g. ['close'], None for all
+    :param period: 'day' (price_data), 'week' (weekly_price_data) or 'month' (monthly_price_data)
+    :param storage: Storage holding the table, get_storage() of its database by default
+    :param cache: Use the query cache
+    :param lean: Load LEAN_DTYPES (int32 ins_id, float32 prices), defaults to LEAN_LOADS
+    :return: pd.DataFrame with ins_id (int64), date (datetime64) and float64 prices
+    """
+    database, table = PRICE_TABLES[period]
+    storage = storage or get_storage(database, read_only=True)
+    return _load(storage, table, _columns(['ins_id', 'date'], columns), start, end, ins_ids, cache=cache, lean=lean)
+
+def load_reports(ins_ids=None, start=None, end=None, columns=None, date_column='report_end_date', database='daily',
+                 storage=None, cache=True, lean=None):
+    """
+    :param ins_ids: Instruments to load, None for all
+    :param start: First date of date_column, None for no lower bound
+    :param end: Last date of date_column (inclusive), None for no upper bound
+    :param columns: Columns besides ins_id, report_start_date and report_end_date, None for all
+    :param date_column: 'report_end_date' for the reporting periods in the range, 'report_date' for the
+                        reports published in it
+    :param database: 'daily' (report_data) or 'monthly' (monthly_report_data)
+    :param storage: Storage holding the table, get_storage(database) by default
+    :param cache: Use the query cache
+    :param lean: Load LEAN_DTYPES (float32 figures, categorical period and currency), defaults to LEAN_LOADS
+    :return: pd.DataFrame with datetime64 dates, nullable integer year and period and float64 figures
+    """
+    storage = storage or get_storage(database, read_only=True)
+    keys = ['ins_id', 'report_start_date', 'report_end_date']
+    return _load(storage, REPORT_TABLES[database], _columns(keys, columns), start, end, ins_ids, date_column, cache,
+                 lean)
+
+def load_rankings(ins_ids=None, start=None, end=None, columns=None, storage=None, cache=True, lean=None):
+    """
+    :param ins_ids: Instruments to load, None for all
+    :param start: First date, None for no lower bound
+    :param end: Last date (inclusive), None for no upper bound
+    :param columns: Rank columns besides ins_id and date, e.g. ['momentum_rank'], None for all
+    :param storage: Storage holding factor_rankings, get_storage('monthly') by default
+    :param cache: Use the query cache
+    :param lean: Load int32 ins_id and float32 ranks, defaults to LEAN_LOADS
+    :return: pd.DataFrame with ins_id (int64), date (datetime64) and float64 ranks
+    """
+    storage = storage or get_storage('monthly', read_only=True)
+    columns = _columns(['ins_id', 'date'], columns)
+    return _load(storage, 'factor_rankings', columns, start, end, ins_ids, cache=cache, lean=lean)
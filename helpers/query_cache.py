@@ -0,0 +1,114 @@
+import glob
+import hashlib
+import json
+import os
+import uuid
+from borsdata_api.constants import QUERY_CACHE, QUERY_CACHE_MAX_BYTES, QUERY_CACHE_PATH
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # without pyarrow, queries are not cached
+    feather = None
+
+
+class QueryCache:
+    """
+    Typed results of the standard loads (helpers/queries.py) as Feather files,
+    so an unchanged table is read and parsed once instead of on every run.
+    A file is named after the table, a hash of the storage location (backend
+    and database), a hash of the query and a hash of the table's storage
+    fingerprint. Writing to the table changes the fingerprint,
+    so the old file is no longer found and is removed when the new result is
+    stored. The least recently used files are evicted once the cache exceeds
+    max_bytes.
+    """
+    def __init__(self, path=QUERY_CACHE_PATH, max_bytes=QUERY_CACHE_MAX_BYTES):
+        """
+        :param path: Cache directory, created if it does not exist
+        :param max_bytes: Max. total size of the cached files
+        """
+        if feather is None:
+            raise ImportError("The query cache requires pyarrow (pip install pyarrow)")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def _hash(value):
+        return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+    def _prefix(self, location, table, query):
+        # results of the query on the table of one storage, whatever the fingerprint
+        return f'{table}-{self._hash(location)}-{self._hash(query)}'
+
+    def _file(self, location, table, query, fingerprint):
+        return os.path.join(self.path, f'{self._prefix(location, table, query)}-{self._hash(fingerprint)}.feather')
+
+    def get(self, location, table, query, fingerprint):
+        """
+        :param location: storage.location, the backend and database of the table
+        :param table: Table name
+        :param query: Dict of the query arguments
+        :param fingerprint: storage.fingerprint(table)
+        :return: pd.DataFrame, or None if not cached
+        """
+        file = self._file(location, table, query, fingerprint)
+        try:
+            df = feather.read_feather(file)
+        except (FileNotFoundError, OSError):
+            self.misses += 1
+            return None
+        os.utime(file)  # last access, for the eviction order
+        self.hits += 1
+        return df
+
+    def put(self, location, table, query, fingerprint, df):
+        file = self._file(location, table, query, fingerprint)
+        # results of the same query on the same storage from before the table changed
+        for stale in glob.glob(os.path.join(self.path, f'{self._prefix(location, table, query)}-*.feather')):
+            if stale != file:
+                self._remove(stale)
+        tmp_file = f'{file}.{uuid.uuid4().hex}.tmp'
+        feather.write_feather(df.reset_index(drop=True), tmp_file)
+        os.replace(tmp_file, file)
+        self._evict()
+
+    def _evict(self):
+        files = []
+        for file in glob.glob(os.path.join(self.path, '*.feather')):
+            try:
+                stat = os.stat(file)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file))
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, file in sorted(files):
+            if size <= self.max_bytes:
+                break
+            self._remove(file)
+            size -= file_size
+
+    @staticmethod
+    def _remove(file):
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass  # removed by another process
+
+    def clear(self):
+        for file in glob.glob(os.path.join(self.path, '*.feather')):
+            self._remove(file)
+
+
+_cache = None
+
+def get_query_cache():
+    """
+    :return: The shared QueryCache, or None if disabled (BORSDATA_QUERY_CACHE=0) or pyarrow is not installed
+    """
+    global _cache
+    if _cache is None and QUERY_CACHE and feather is not None:
+        _cache = QueryCache()
+    return _cache
@@ -0,0 +1,296 @@
+import hashlib
+import os
+import shutil
+import uuid
+import pandas as pd
+from borsdata_api.constants import DB_FILE, DB_FILE_MONTHLY, PARQUET_PATH, STORAGE_BACKEND
+from helpers.compact_schema import SCALED_COLUMNS, is_compact, read_compact, read_compact_chunks, to_day
+from helpers.db_utils import get_connection
+from helpers.sync_utils import bump_table_version
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:  # only needed for the Parquet backend
+    pa = ds = None
+
+# Date column used for date range filters and the year partitions, 'date' for all other tables
+DATE_COLUMNS = {
+    'report_data': 'report_end_date',
+    'monthly_report_data': 'report_end_date',
+}
+# Parquet tables with an ins_id column are split into ins_id % INS_ID_BUCKETS buckets
+INS_ID_BUCKETS = 16
+BUCKET_COLUMN = 'part_bucket'
+YEAR_COLUMN = 'part_year'
+
+# Secondary indexes of the SQLite tables written with to_sql, recreated by SQLiteStorage.write
+# (the tables of create_db.py and create_db_monthly.py get theirs there)
+SQLITE_INDEXES = {
+    'factor_rankings': [('date', 'ins_id'), ('ins_id', 'date')],
+}
+
+SQLITE_TYPES = {'INTEGER': 'int64', 'REAL': 'float64', 'TEXT': 'string', 'BOOLEAN': 'int64'}
+
+def _day(value, days=0):
+    # 'YYYY-MM-DD' of the date of value plus days
+    return (pd.Timestamp(value).normalize() + pd.Timedelta(days=days)).strftime('%Y-%m-%d')
+
+class SQLiteStorage:
+    """
+    Table storage in a SQLite database, the default backend
+    """
+    def __init__(self, db_file, read_only=False):
+        """
+        :param db_file: SQLite database file
+        :param read_only: Open a read-only connection, for analytics that do not write
+        """
+        self.db_file = db_file
+        self.read_only = read_only
+        # Identifies the database, e.g. for the directory of its price panels
+        self.location = f'sqlite:{os.path.abspath(db_file)}'
+
+    @property
+    def conn(self):
+        return get_connection(self.db_file, self.read_only)
+
+    def read(self, table, columns=None, start_date=None, end_date=None, ins_ids=None, date_column=None):
+        """
+        :param table: Table name, e.g. 'price_data'
+        :param columns: Columns to load, None for all
+        :param start_date: Only rows with date >= start_date, e.g. '2010-01-01'
+        :param end_date: Only rows with date <= end_date
+        :param ins_ids: Only rows of these instruments
+        :param date_column: Column of start_date and end_date, defaults to DATE_COLUMNS or 'date'
+        :return: pd.DataFrame
+        """
+        query, params, compact = self._query(table, columns, start_date, end_date, ins_ids, date_column)
+        if compact:
+            return read_compact(self.conn, query, params)
+        return pd.read_sql_query(query, self.conn, params=params)
+
+    def read_chunks(self, table, columns=None, start_date=None, end_date=None, ins_ids=None, date_column=None,
+                    chunk_rows=100000):
+        """
+        Same as read, but yields the result in frames of up to chunk_rows rows
+        """
+        query, params, compact = self._query(table, columns, start_date, end_date, ins_ids, date_column)
+        if compact:
+            yield from read_compact_chunks(self.conn, query, params, chunk_rows)
+        else:
+            yield from pd.read_sql_query(query, self.conn, params=params, chunksize=chunk_rows)
+
+    def _query(self, table, columns, start_date, end_date, ins_ids, date_column):
+        date_column = date_column or DATE_COLUMNS.get(table, 'date')
+        compact = is_compact(self.conn, table)
+        # dates are stored as 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS' text, or as day numbers in compact
+        # tables; plain comparisons can use an index
+        day = (lambda value, days=0: to_day(value) + days) if compact else _day
+        where, params = [], []
+        if start_date is not None:
+            where.append(f'{date_column} >= ?')
+            params.append(day(start_date))
+        if end_date is not None:
+            where.append(f'{date_column} < ?')
+            params.append(day(end_date, 1))
+        if ins_ids is not None:
+            where.append(f'ins_id IN ({", ".join(["?"] * len(ins_ids))})')
+            params.extend(int(ins_id) for ins_id in ins_ids)
+        query = f'SELECT {", ".join(columns) if columns else "*"} FROM {table}'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        return query, params, compact
+
+    def write(self, table, df, if_exists='replace'):
+        """
+        :param if_exists: 'replace' the table or 'append' to it
+        """
+        df.to_sql(table, self.conn, if_exists=if_exists, index=False)
+        for columns in SQLITE_INDEXES.get(table, []):
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{"_".join(columns)} '
+                              f'ON {table} ({", ".join(columns)})')
+        bump_table_version(self.conn, table)
+        self.conn.commit()
+
+    def schema(self, table):
+        # {column: pandas dtype name} of the frames read, from the declared column types
+        schema = {name: SQLITE_TYPES.get(decl_type.upper(), 'string')
+                  for _, name, decl_type, *_ in self.conn.execute(f'PRAGMA table_info({table})')}
+        if is_compact(self.conn, table):
+            schema.update({col: 'float64' for col in (*SCALED_COLUMNS, 'volume')}, date='datetime64[ns]')
+        return schema
+
+    def ins_ids(self, table):
+        return [row[0] for row in self.conn.execute(f'SELECT DISTINCT ins_id FROM {table} ORDER BY ins_id')]
+
+    def exists(self, table):
+        query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+        return self.conn.execute(query, (table,)).fetchone() is not None
+
+    def fingerprint(self, table):
+        # The version that every write bumps (BulkWriter, write(), migrate_compact.py), which also covers
+        # corrections of existing rows, and MAX(rowid) for rows added by other writers. Both are index
+        # lookups, there is no table scan.
+        version = None
+        if self.exists('sync_state'):
+            version = self.conn.execute('SELECT value FROM sync_state WHERE key = ?', (f'{table}.version',)).fetchone()
+        last_rowid = None
+        if not is_compact(self.conn, table):
+            last_rowid = self.conn.execute(f'SELECT MAX(rowid) FROM {table}').fetchone()[0]
+        return f'sqlite:{os.path.abspath(self.db_file)}:{table}:{version and version[0]}:{last_rowid}'
+
+class ParquetStorage:
+    """
+    Table storage as Parquet datasets, one directory per table, partitioned
+    Hive-style by ins_id bucket (part_bucket = ins_id % 16) and year
+    (part_year). Reads load only the requested columns and skip partitions
+    and row groups outside the requested date range and instruments.
+    Requires pyarrow.
+    """
+    def __init__(self, root, buckets=INS_ID_BUCKETS):
+        """
+        :param root: Directory holding one dataset directory per table
+        :param buckets: Number of ins_id buckets
+        """
+        if ds is None:
+            raise ImportError("The Parquet storage backend requires pyarrow (pip install pyarrow)")
+        self.root = root
+        self.buckets = buckets
+        self.location = f'parquet:{os.path.abspath(root)}'
+
+    def path(self, table):
+        return os.path.join(self.root, table)
+
+    def exists(self, table):
+        return os.path.isdir(self.path(table))
+
+    def fingerprint(self, table):
+        # Changes whenever a file of the dataset is written, replaced or removed
+        files = []
+        for directory, _, names in os.walk(self.path(table)):
+            for name in names:
+                file = os.path.join(directory, name)
+                stat = os.stat(file)
+                files.append((os.path.relpath(file, self.path(table)), stat.st_size, stat.st_mtime_ns))
+        digest = hashlib.sha1(repr(sorted(files)).encode()).hexdigest()
+        return f'parquet:{os.path.abspath(self.path(table))}:{digest}'
+
+    def read(self, table, columns=None, start_date=None, end_date=None, ins_ids=None, date_column=None):
+        """
+        Same arguments as SQLiteStorage.read
+        """
+        dataset, columns, condition = self._scan(table, columns, start_date, end_date, ins_ids, date_column)
+        return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+    def read_chunks(self, table, columns=None, start_date=None, end_date=None, ins_ids=None, date_column=None,
+                    chunk_rows=100000):
+        """
+        Same as read, but yields the result in frames of up to chunk_rows rows
+        """
+        dataset, columns, condition = self._scan(table, columns, start_date, end_date, ins_ids, date_column)
+        # the scan yields at least one batch per file, which are combined up to chunk_rows
+        batches, rows = [], 0
+        for batch in dataset.to_batches(columns=columns, filter=condition, batch_size=chunk_rows):
+            batches.append(batch)
+            rows += batch.num_rows
+            if rows >= chunk_rows:
+                yield pa.Table.from_batches(batches).to_pandas()
+                batches, rows = [], 0
+        if rows:
+            yield pa.Table.from_batches(batches).to_pandas()
+
+    def _scan(self, table, columns, start_date, end_date, ins_ids, date_column):
+        dataset = ds.dataset(self.path(table), format='parquet', partitioning='hive')
+        names = [name for name in dataset.schema.names if name not in (BUCKET_COLUMN, YEAR_COLUMN)]
+        partition_date_column = DATE_COLUMNS.get(table, 'date')
+        date_column = date_column or partition_date_column
+        # the year partitions can only be pruned when filtering on the column they were built from
+        prune_years = date_column == partition_date_column and YEAR_COLUMN in dataset.schema.names
+        conditions = []
+        if start_date is not None:
+            conditions.append(ds.field(date_column) >= self._date_value(dataset, date_column, start_date))
+            if prune_years:
+                conditions.append(ds.field(YEAR_COLUMN) >= pd.Timestamp(start_date).year)
+        if end_date is not None:
+            conditions.append(ds.field(date_column) < self._date_value(dataset, date_column, end_date, 1))
+            if prune_years:
+                conditions.append(ds.field(YEAR_COLUMN) <= pd.Timestamp(end_date).year)
+        if ins_ids is not None:
+            ins_ids = [int(ins_id) for ins_id in ins_ids]
+            conditions.append(ds.field('ins_id').isin(ins_ids))
+            if BUCKET_COLUMN in dataset.schema.names:
+                conditions.append(ds.field(BUCKET_COLUMN).isin(sorted({i % self.buckets for i in ins_ids})))
+        condition = None
+        for c in conditions:
+            condition = c if condition is None else condition & c
+        return dataset, list(columns) if columns else names, condition
+
+    @staticmethod
+    def _date_value(dataset, column, value, days=0):
+        if pa.types.is_timestamp(dataset.schema.field(column).type):
+            value = pd.Timestamp(value).normalize() + pd.Timedelta(days=days)
+            return pa.scalar(value, type=dataset.schema.field(column).type)
+        return _day(value, days)
+
+    def write(self, table, df, if_exists='replace', schema=None):
+        """
+        :param if_exists: 'replace' the table or 'append' to it
+        :param schema: Optional {column: pandas dtype name}, keeps types stable across appended chunks
+        """
+        path = self.path(table)
+        if if_exists == 'replace' and os.path.exists(path):
+            shutil.rmtree(path)
+        date_column = DATE_COLUMNS.get(table, 'date')
+        df = df.copy()
+        partition_columns = []
+        if 'ins_id' in df.columns:
+            df[BUCKET_COLUMN] = (df['ins_id'] % self.buckets).astype('int64')
+            partition_columns.append(BUCKET_COLUMN)
+        if date_column in df.columns:
+            df[YEAR_COLUMN] = pd.to_datetime(df[date_column]).dt.year.fillna(0).astype('int64')
+            partition_columns.append(YEAR_COLUMN)
+        arrow_schema = None
+        if schema is not None:
+            arrow_schema = pa.schema([(name, pa.from_numpy_dtype(pd.api.types.pandas_dtype(dtype))
+                                       if dtype != 'string' else pa.string()) for name, dtype in schema.items()]
+                                     + [(name, pa.int64()) for name in partition_columns])
+        data = pa.Table.from_pandas(df, schema=arrow_schema, preserve_index=False)
+        ds.write_dataset(data, path, format='parquet',
+                         partitioning=ds.partitioning(pa.schema([(name, pa.int64()) for name in partition_columns]),
+                                                      flavor='hive') if partition_columns else None,
+                         basename_template=f'part-{uuid.uuid4().hex}-{{i}}.parquet',
+                         existing_data_behavior='overwrite_or_ignore')
+
+def get_storage(database='daily', backend=None, read_only=False):
+    """
+    Storage of the daily or monthly database for the configured backend
+    :param database: 'daily' (DB_FILE) or 'monthly' (DB_FILE_MONTHLY)
+    :param backend: 'sqlite' or 'parquet', defaults to STORAGE_BACKEND (env BORSDATA_STORAGE)
+    :param read_only: For SQLite, open a read-only connection
+    """
+    backend = backend or STORAGE_BACKEND
+    if backend == 'parquet':
+        return ParquetStorage(os.path.join(PARQUET_PATH, database))
+    if backend == 'sqlite':
+        return SQLiteStorage(DB_FILE if database == 'daily' else DB_FILE_MONTHLY, read_only)
+    raise ValueError(f"Unknown storage backend {backend!r}, expected 'sqlite' or 'parquet'")
+
+def export_table(source, target, table, chunk_size=500):
+    """
+    Copy a table from SQLite to Parquet, chunk_size instruments at a time
+    :param source: SQLiteStorage
+    :param target: ParquetStorage
+    :return: Number of rows copied
+    """
+    schema = source.schema(table)
+    if 'ins_id' not in schema:
+        df = source.read(table)
+        target.write(table, df, schema=schema)
+        return len(df)
+    ins_ids = source.ins_ids(table)
+    rows = 0
+    for i in range(0, len(ins_ids), chunk_size):
+        df = source.read(table, ins_ids=ins_ids[i:i + chunk_size])
+        target.write(table, df, if_exists='replace' if i == 0 else 'append', schema=schema)
+        rows += len(df)
+    return rows
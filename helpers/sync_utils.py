@@ -0,0 +1,51 @@
+import datetime as dt
+import uuid
+import pandas as pd
+from helpers.compact_schema import from_day, is_compact
+
+SYNC_STATE_SQL = '''
+    CREATE TABLE IF NOT EXISTS sync_state (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at TEXT
+    )
+'''
+
+def create_sync_state_table(conn):
+    conn.execute(SYNC_STATE_SQL)
+    conn.commit()
+
+def get_sync_state(conn, key, default=None):
+    create_sync_state_table(conn)
+    row = conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+    return row[0] if row is not None else default
+
+def set_sync_state(conn, key, value):
+    create_sync_state_table(conn)
+    conn.execute('INSERT OR REPLACE INTO sync_state (key, value, updated_at) VALUES (?, ?, ?)',
+                 (key, str(value), dt.datetime.now().isoformat(timespec='seconds')))
+    conn.commit()
+
+def bump_table_version(conn, table):
+    # Record a write to table for SQLiteStorage.fingerprint, in the transaction of the write
+    conn.execute(SYNC_STATE_SQL)
+    conn.execute('INSERT OR REPLACE INTO sync_state (key, value, updated_at) VALUES (?, ?, ?)',
+                 (f'{table}.version', uuid.uuid4().hex, dt.datetime.now().isoformat(timespec='seconds')))
+
+def get_high_water_marks(conn, table='price_data'):
+    # Last stored date per instrument, {ins_id: 'YYYY-MM-DD'}
+    rows = conn.execute(f'SELECT ins_id, MAX(date) FROM {table} GROUP BY ins_id').fetchall()
+    if is_compact(conn, table):
+        return {ins_id: from_day(last_day) for ins_id, last_day in rows}
+    return {ins_id: last_date for ins_id, last_date in rows}
+
+def get_instruments_with_reports(conn, table='report_data'):
+    return {row[0] for row in conn.execute(f'SELECT DISTINCT ins_id FROM {table}')}
+
+def business_days_after(after, until):
+    # Weekdays in (after, until] as 'YYYY-MM-DD', holidays are not excluded
+    start = pd.Timestamp(after) + pd.Timedelta(days=1)
+    return pd.bdate_range(start, pd.Timestamp(until)).strftime('%Y-%m-%d').tolist()
+
+def next_day(date):
+    return (pd.Timestamp(date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
@@ -1,88 +1,328 @@
+import argparse
+import asyncio
 import pandas as pd
-import sqlite3
 from borsdata_api.borsdata_api import BorsdataAPI
-from borsdata_api.constants import API_KEY, DB_FILE
+from borsdata_api.async_api import AsyncBorsdataAPI
+from borsdata_api.cache import ResponseCache
+from helpers.checkpoint_utils import clear_checkpoints, get_failures, mark_done, mark_failed, pending_instruments
+from helpers.data_utils import report_columns_to_camel_case
+from helpers.db_writer import BulkWriter
+from helpers.ingest_pipeline import IngestPipeline
+from helpers.sync_utils import (get_high_water_marks, get_instruments_with_reports, get_sync_state, set_sync_state,
+                                business_days_after, next_day)
+from borsdata_api.constants import API_KEY, CACHE_FILE, CACHE_MAX_BYTES, DB_FILE
 
 # Initialize Borsdata API
 api = BorsdataAPI(API_KEY)
 
-# Connect to the SQLite database
-def connect_db():
-    return sqlite3.connect(DB_FILE)
+# Long-lived connection that all fetch functions write through
+db = BulkWriter(DB_FILE)
 
 # Function to save price data to the database
-def save_price_data_to_db(df, ins_id):
-    conn = connect_db()
-    cursor = conn.cursor()
-    for index, row in df.iterrows():
-        cursor.execute('''
-            INSERT OR REPLACE INTO price_data (ins_id, date, open, high, low, close, volume)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (ins_id, row['date'], row['open'], row['high'], row['low'], row['close'], row['volume']))
-    conn.commit()
-    conn.close()
-    print(f"Price data for ins_id {ins_id} saved to database.")
+def save_price_data_to_db(df, ins_id=None):
+    rows = db.write_prices(df, ins_id)
+    if ins_id is None:
+        print(f"Price data for {df['ins_id'].nunique()} instruments ({rows} rows) saved to database.")
+    else:
+        print(f"Price data for ins_id {ins_id} saved to database.")
 
 # Function to save report data to the database
-def save_report_data_to_db(df, ins_id):
-    conn = connect_db()
-    cursor = conn.cursor()
-    for index, row in df.iterrows():
-        cursor.execute('''
-            INSERT OR REPLACE INTO report_data (
-                ins_id, year, period, revenues, gross_income, operating_income, profit_before_tax, profit_to_equity_holders,
-                earnings_per_share, number_of_shares, dividend, intangible_assets, tangible_assets, financial_assets,
-                non_current_assets, cash_and_equivalents, current_assets, total_assets, total_equity, non_current_liabilities,
-                current_liabilities, total_liabilities_and_equity, net_debt, cash_flow_from_operating_activities,
-                cash_flow_from_investing_activities, cash_flow_from_financing_activities, cash_flow_for_the_year,
-                free_cash_flow, stock_price_average, stock_price_high, stock_price_low, report_start_date,
-                report_end_date, broken_fiscal_year, currency, currency_ratio, net_sales, report_date
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            ins_id, row.get('year', None), row.get('period', None), row.get('revenues', None), row.get('grossIncome', None), row.get('operatingIncome', None),
-            row.get('profitBeforeTax', None), row.get('profitToEquityHolders', None), row.get('earningsPerShare', None), row.get('numberOfShares', None),
-            row.get('dividend', None), row.get('intangibleAssets', None), row.get('tangibleAssets', None), row.get('financialAssets', None), row.get('nonCurrentAssets', None),
-            row.get('cashAndEquivalents', None), row.get('currentAssets', None), row.get('totalAssets', None), row.get('totalEquity', None), row.get('nonCurrentLiabilities', None),
-            row.get('currentLiabilities', None), row.get('totalLiabilitiesAndEquity', None), row.get('netDebt', None), row.get('cashFlowFromOperatingActivities', None),
-            row.get('cashFlowFromInvestingActivities', None), row.get('cashFlowFromFinancingActivities', None), row.get('cashFlowForTheYear', None),
-            row.get('freeCashFlow', None), row.get('stockPriceAverage', None), row.get('stockPriceHigh', None), row.get('stockPriceLow', None),
-            row.get('reportStartDate', None), row.get('reportEndDate', None),
-            row.get('brokenFiscalYear', None), row.get('currency', None), row.get('currencyRatio', None), row.get('netSales', None), row.get('reportDate', None)
-        ))
-    conn.commit()
-    conn.close()
-    print(f"Report data for ins_id {ins_id} saved to database.")
+def save_report_data_to_db(df, ins_id=None):
+    rows = db.write_reports(df, ins_id)
+    if ins_id is None:
+        print(f"Report data for {df['ins_id'].nunique()} instruments ({rows} rows) saved to database.")
+    else:
+        print(f"Report data for ins_id {ins_id} saved to database.")
 
-# Function to fetch and save price data
-def fetch_and_save_price_data(ins_id, start_date=None, end_date=None):
-    df = api.get_instrument_stock_prices(ins_id, from_date=start_date, to_date=end_date)
+# Function to turn an API price frame into rows for price_data
+def prepare_price_data(df):
     df.reset_index(inplace=True)
     df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
     print(df.head())  # Debug: Print the DataFrame
     print(df.columns)  # Debug: Print the DataFrame columns
-    save_price_data_to_db(df, ins_id)
+    return df
+
+# Function to turn an API report frame into rows for report_data
+def prepare_report_data(df):
+    df.reset_index(inplace=True)  # Ensure the index is reset
+    for date_col in ['reportStartDate', 'reportEndDate', 'reportDate']:
+        if date_col in df.columns:
+            df[date_col] = pd.to_datetime(df[date_col]).dt.strftime('%Y-%m-%d')
+    print(df.head())  # Debug: Print the DataFrame
+    print(df.columns)  # Debug: Print the DataFrame columns
+    return df
+
+# Function to fetch and save price data
+def fetch_and_save_price_data(ins_id, start_date=None, end_date=None):
+    df = api.get_instrument_stock_prices(ins_id, from_date=start_date, to_date=end_date)
+    save_price_data_to_db(prepare_price_data(df), ins_id)
 
 # Function to fetch and save report data
 def fetch_and_save_report_data(ins_id):
     quarters, years = api.get_instrument_reports(ins_id)[:2]  # Only fetch quarters and years
     for df in [quarters, years]:
-        df.reset_index(inplace=True)  # Ensure the index is reset
-        for date_col in ['reportStartDate', 'reportEndDate', 'reportDate']:
-            if date_col in df.columns:
-                df[date_col] = pd.to_datetime(df[date_col]).dt.strftime('%Y-%m-%d')
-        print(df.head())  # Debug: Print the DataFrame
-        print(df.columns)  # Debug: Print the DataFrame columns
-        save_report_data_to_db(df, ins_id)
+        save_report_data_to_db(prepare_report_data(df), ins_id)
+
+# Function to run one fetch-and-save step and commit its data together with its checkpoint
+def run_checkpointed(ins_ids, dataset, func, *args):
+    try:
+        func(*args)
+    except Exception as e:
+        db.conn.rollback()  # drop the partly written step
+        mark_failed(db.conn, ins_ids, dataset, e)
+        print(f"{dataset.capitalize()} for ins_id {', '.join(map(str, ins_ids))} failed: {e}")
+        return False
+    mark_done(db.conn, ins_ids, dataset)
+    db.commit()
+    return True
+
+# Function to fetch price and report data one instrument at a time
+def fetch_and_save_serial(price_ids, report_ids, start_date=None, end_date=None):
+    price_set, report_set = set(price_ids), set(report_ids)
+    for ins_id in dict.fromkeys(price_ids + report_ids):
+        if ins_id in price_set:
+            run_checkpointed([ins_id], 'prices', fetch_and_save_price_data, ins_id, start_date, end_date)
+        if ins_id in report_set:
+            run_checkpointed([ins_id], 'reports', fetch_and_save_report_data, ins_id)
+
+# Function to save an API result that may be an exception returned by gather
+def save_price_result(ins_id, df):
+    if isinstance(df, Exception):
+        raise df
+    save_price_data_to_db(prepare_price_data(df), ins_id)
+
+def save_report_result(ins_id, reports):
+    if isinstance(reports, Exception):
+        raise reports
+    for df in reports[:2]:  # Only save quarters and years
+        save_report_data_to_db(prepare_report_data(df), ins_id)
+
+# Function to fetch price and report data for many instruments concurrently and save them
+async def fetch_and_save_all_async(price_ids, report_ids, start_date=None, end_date=None, max_in_flight=8,
+                                   cache=None):
+    async with AsyncBorsdataAPI(API_KEY, max_in_flight=max_in_flight, cache=cache,
+                                metrics=api.metrics) as async_api:
+        prices = await async_api.get_instruments_stock_prices(price_ids, from_date=start_date,
+                                                              to_date=end_date, return_exceptions=True)
+        reports = await async_api.get_instruments_reports(report_ids, return_exceptions=True)
+    for ins_id, df in prices.items():
+        run_checkpointed([ins_id], 'prices', save_price_result, ins_id, df)
+    for ins_id, result in reports.items():
+        run_checkpointed([ins_id], 'reports', save_report_result, ins_id, result)
+
+# Function to fetch and transform the pending datasets of one instrument on a pipeline fetch worker
+def fetch_instrument_data(ins_id, datasets, start_date=None, end_date=None):
+    data = {}
+    if 'prices' in datasets:
+        try:
+            df = api.get_instrument_stock_prices(ins_id, from_date=start_date, to_date=end_date)
+            data['prices'] = [prepare_price_data(df)]
+        except Exception as e:
+            data['prices'] = e
+    if 'reports' in datasets:
+        try:
+            quarters, years = api.get_instrument_reports(ins_id)[:2]  # Only fetch quarters and years
+            data['reports'] = [prepare_report_data(quarters), prepare_report_data(years)]
+        except Exception as e:
+            data['reports'] = e
+    return data
+
+# Function to save the result of fetch_instrument_data on the pipeline writer thread
+def save_instrument_data(ins_id, data):
+    for dataset, frames in data.items():
+        if isinstance(frames, Exception):
+            mark_failed(db.conn, [ins_id], dataset, frames)
+            print(f"{dataset.capitalize()} for ins_id {ins_id} failed: {frames}")
+            continue
+        for df in frames:
+            if dataset == 'prices':
+                save_price_data_to_db(df, ins_id)
+            else:
+                save_report_data_to_db(df, ins_id)
+        mark_done(db.conn, [ins_id], dataset)  # committed by the pipeline together with the data
+
+# Function to fetch with parallel workers while a single writer thread saves to the database
+def fetch_and_save_pipelined(price_ids, report_ids, start_date=None, end_date=None, workers=8, commit_every=50):
+    datasets = {}
+    for dataset, ins_ids in [('prices', price_ids), ('reports', report_ids)]:
+        for ins_id in ins_ids:
+            datasets.setdefault(ins_id, []).append(dataset)
+    pipeline = IngestPipeline(lambda ins_id: fetch_instrument_data(ins_id, datasets[ins_id], start_date, end_date),
+                              save_instrument_data, commit=db.commit, close=db.close, workers=workers,
+                              commit_every=commit_every)
+    failed = pipeline.run(list(datasets))
+    for ins_id, error in failed.items():
+        mark_failed(db.conn, [ins_id], 'prices', error)
+        mark_failed(db.conn, [ins_id], 'reports', error)
+        print(f"Data for ins_id {ins_id} failed: {error}")
+
+# Function to fetch and save price data for one batch of instruments through the instList endpoint
+def fetch_and_save_price_batch(batch, start_date=None, end_date=None):
+    prices = api.get_instrument_stock_prices_list(batch, from_date=start_date, to_date=end_date, fill_na=False)
+    if len(prices):
+        save_price_data_to_db(prepare_price_data(prices.rename(columns={'stock_id': 'ins_id'})))
+
+# Function to fetch and save report data for one batch of instruments through the instList endpoint
+def fetch_and_save_report_batch(batch):
+    quarters, years = api.get_instrument_report_list(batch, fill_na=False)[:2]  # Only fetch quarters and years
+    for reports in [quarters, years]:
+        if len(reports):
+            df = report_columns_to_camel_case(reports).rename(columns={'stockId': 'ins_id'})
+            save_report_data_to_db(prepare_report_data(df))
+
+# Function to fetch price and report data through the instList endpoints, batch_size instruments per call
+def fetch_and_save_batched(price_ids, report_ids, start_date=None, end_date=None, batch_size=50):
+    for i in range(0, len(price_ids), batch_size):
+        batch = price_ids[i:i + batch_size]
+        if run_checkpointed(batch, 'prices', fetch_and_save_price_batch, batch, start_date, end_date):
+            print(f"Price batch {i // batch_size + 1}: {len(batch)} instruments saved.")
+    for i in range(0, len(report_ids), batch_size):
+        batch = report_ids[i:i + batch_size]
+        if run_checkpointed(batch, 'reports', fetch_and_save_report_batch, batch):
+            print(f"Report batch {i // batch_size + 1}: {len(batch)} instruments saved.")
+
+# Function to fetch the price bars of every date after the high-water marks of instruments a few days behind
+def fetch_and_save_price_dates(recent, last, latest):
+    for date in business_days_after(min(recent.values()), latest):
+        if date == latest:
+            prices = last[last['date'].dt.strftime('%Y-%m-%d') == date]
+        else:
+            prices = api.get_stock_prices_date(date).reset_index()
+        if prices.empty:
+            continue  # exchange holiday, the date endpoint returns no prices and no columns
+        prices = prices[prices['insId'].map(recent) < date]
+        if len(prices):
+            save_price_data_to_db(prepare_price_data(prices.rename(columns={'insId': 'ins_id'})))
+
+# Function to fetch only the price bars missing since the last stored date of every instrument
+def sync_price_data(instrument_ids, start_date=None, max_gap_days=5, batch_size=50):
+    high_water_marks = get_high_water_marks(db.conn)
+
+    last = api.get_instruments_stock_prices_last().reset_index()
+    last = last[last['insId'].isin(instrument_ids)]
+    last_dates = dict(zip(last['insId'], last['date'].dt.strftime('%Y-%m-%d')))
+
+    new_ids = [ins_id for ins_id in instrument_ids if ins_id not in high_water_marks]
+    stale = {ins_id: high_water_marks[ins_id] for ins_id in instrument_ids
+             if ins_id in high_water_marks and last_dates.get(ins_id, '') > high_water_marks[ins_id]}
+    # instruments a few days behind: one stockprices/date call per missing day covers all of them
+    recent = {ins_id: hwm for ins_id, hwm in stale.items()
+              if len(business_days_after(hwm, last_dates[ins_id])) <= max_gap_days}
+    behind = sorted(ins_id for ins_id in stale if ins_id not in recent)
+    print(f"Price sync: {len(new_ids)} new, {len(recent)} recent, {len(behind)} behind, "
+          f"{len(instrument_ids) - len(new_ids) - len(stale)} up to date.")
+
+    if recent:
+        latest = max(last_dates[ins_id] for ins_id in recent)
+        run_checkpointed(sorted(recent), 'prices', fetch_and_save_price_dates, recent, last, latest)
+
+    # a failed batch keeps its high-water marks, so the next sync fetches it again
+    for i in range(0, len(behind), batch_size):
+        batch = behind[i:i + batch_size]
+        run_checkpointed(batch, 'prices', fetch_and_save_price_batch, batch,
+                         next_day(min(stale[ins_id] for ins_id in batch)))
+
+    for i in range(0, len(new_ids), batch_size):
+        batch = new_ids[i:i + batch_size]
+        run_checkpointed(batch, 'prices', fetch_and_save_price_batch, batch, start_date)
+
+# Function to fetch reports only for instruments updated since the last sync
+def sync_report_data(instrument_ids, batch_size=50):
+    last_sync = get_sync_state(db.conn, 'report_data.instruments_updated_at')
+    last_kpis_updated = get_sync_state(db.conn, 'kpis_updated')
+    with_reports = get_instruments_with_reports(db.conn)
+
+    missing = [ins_id for ins_id in instrument_ids if ins_id not in with_reports]
+    kpis_updated = api.get_updated_kpis()
+    # Borsdata recalculates KPIs after new reports, so an unchanged timestamp means no new reports
+    if last_kpis_updated is not None and pd.Timestamp(last_kpis_updated) >= kpis_updated:
+        print(f"Report sync: KPIs not recalculated since {last_kpis_updated}.")
+        updated = pd.DataFrame(columns=['insId', 'updatedAt'])
+    else:
+        updated = api.get_instruments_updated().reset_index()
+        if last_sync is not None:
+            updated = updated[updated['updatedAt'] > pd.Timestamp(last_sync)]
+    changed = set(updated['insId'])
+    ins_ids = [ins_id for ins_id in instrument_ids if ins_id in changed or ins_id in missing]
+    print(f"Report sync: {len(ins_ids)} of {len(instrument_ids)} instruments updated.")
+    for i in range(0, len(ins_ids), batch_size):
+        fetch_and_save_report_batch(ins_ids[i:i + batch_size])
+
+    if len(updated):
+        set_sync_state(db.conn, 'report_data.instruments_updated_at', updated['updatedAt'].max().isoformat())
+    set_sync_state(db.conn, 'kpis_updated', kpis_updated.isoformat())
 
 # Function to fetch instrument list
 def fetch_instrument_list():
     df = api.get_instruments()
     return df.index.tolist()  # Assuming the instrument IDs are in the index
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fetch Borsdata price and report data into the daily database.")
+    parser.add_argument('--mode', choices=['serial', 'async', 'pipelined', 'batched', 'sync'], default='serial',
+                        help="serial: one instrument at a time, async: concurrent requests, "
+                             "pipelined: concurrent requests overlapped with database writes, "
+                             "batched: instList endpoints with --batch-size instruments per call, "
+                             "sync: only fetch prices and reports added since the last run")
+    parser.add_argument('--limit', type=int, default=5,
+                        help="Number of instruments to fetch, 0 for all (default 5)")
+    parser.add_argument('--start-date', default="2000-01-01")
+    parser.add_argument('--end-date', default="2024-07-01")
+    parser.add_argument('--max-in-flight', type=int, default=8,
+                        help="Max. concurrent requests in async and pipelined mode")
+    parser.add_argument('--batch-size', type=int, default=50,
+                        help="Instruments per call in batched mode (default 50)")
+    parser.add_argument('--cache', action='store_true',
+                        help="Serve unchanged API responses from the on-disk cache (CACHE_FILE)")
+    parser.add_argument('--metrics', default=None,
+                        help="Write per-endpoint API metrics to this file (Prometheus text for *.prom, else JSON)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue the previous run: skip instruments already saved and retry failed ones")
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help="With --resume, give up on an instrument after this many failed attempts (default 3)")
+    return parser.parse_args()
+
 # Example usage
 if __name__ == "__main__":
-    instrument_ids = fetch_instrument_list()[:5]  # Fetch data for the first 5 instruments by default
-    for ins_id in instrument_ids:
-        fetch_and_save_price_data(ins_id, start_date="2000-01-01", end_date="2024-07-01")
-        fetch_and_save_report_data(ins_id)
+    args = parse_args()
+    cache = None
+    if args.cache:
+        cache = ResponseCache(CACHE_FILE, max_bytes=CACHE_MAX_BYTES)
+        api = BorsdataAPI(API_KEY, cache=cache)
+    instrument_ids = fetch_instrument_list()
+    if args.limit:
+        instrument_ids = instrument_ids[:args.limit]  # Fetch data for the first 5 instruments by default
+    # progress per (ins_id, dataset) is kept in ingest_checkpoint, a new run starts it over
+    if not args.resume or args.mode == 'sync':
+        clear_checkpoints(db.conn, ['prices', 'reports'])
+    if args.mode != 'sync':
+        price_ids = pending_instruments(db.conn, instrument_ids, 'prices', args.max_attempts)
+        report_ids = pending_instruments(db.conn, instrument_ids, 'reports', args.max_attempts)
+        if args.resume:
+            print(f"Resuming: {len(price_ids)} of {len(instrument_ids)} instruments left for prices, "
+                  f"{len(report_ids)} for reports.")
+    if args.mode == 'sync':
+        sync_price_data(instrument_ids, args.start_date, batch_size=args.batch_size)
+        sync_report_data(instrument_ids, args.batch_size)
+    elif args.mode == 'batched':
+        fetch_and_save_batched(price_ids, report_ids, args.start_date, args.end_date, args.batch_size)
+    elif args.mode == 'pipelined':
+        fetch_and_save_pipelined(price_ids, report_ids, args.start_date, args.end_date, args.max_in_flight)
+    elif args.mode == 'async':
+        asyncio.run(fetch_and_save_all_async(price_ids, report_ids, args.start_date, args.end_date,
+                                             args.max_in_flight, cache))
+    else:
+        fetch_and_save_serial(price_ids, report_ids, args.start_date, args.end_date)
+    failures = get_failures(db.conn)
+    if failures:
+        retry = "run sync again" if args.mode == 'sync' else "run again with --resume"
+        print(f"{len(failures)} instrument datasets failed, {retry} to retry:")
+        for ins_id, dataset, attempts, error in failures:
+            print(f"  ins_id {ins_id} {dataset}: {attempts} attempt(s), {error}")
+    db.close()
+    api.metrics.print_summary()
+    if args.metrics:
+        api.metrics.dump(args.metrics)
+    if cache is not None:
+        print(f"API cache: {cache.stats()}")
     print("Data fetched and saved to database for all instruments.")
@@ -1,61 +1,41 @@
+import argparse
+import asyncio
 import pandas as pd
-import sqlite3
 from borsdata_api.borsdata_api import BorsdataAPI
-from borsdata_api.constants import API_KEY, DB_FILE_MONTHLY
+from borsdata_api.async_api import AsyncBorsdataAPI
+from borsdata_api.cache import ResponseCache
+from helpers.data_utils import report_columns_to_camel_case
+from helpers.db_utils import get_connection
+from helpers.db_writer import BulkWriter
+from helpers.derive_utils import derive_prices, derive_reports
+from helpers.ingest_pipeline import IngestPipeline
+from borsdata_api.constants import API_KEY, CACHE_FILE, CACHE_MAX_BYTES, DB_FILE, DB_FILE_MONTHLY
+from create_db_monthly import create_tables
 
 # Initialize Borsdata API
 api = BorsdataAPI(API_KEY)
 
-# Connect to the SQLite database
-def connect_db():
-    return sqlite3.connect(DB_FILE_MONTHLY)
+# Long-lived connection that all fetch functions write through
+db = BulkWriter(DB_FILE_MONTHLY, price_table='monthly_price_data', report_table='monthly_report_data')
 
 # Function to save price data to the database
-def save_price_data_to_db(df, ins_id):
-    conn = connect_db()
-    cursor = conn.cursor()
-    for index, row in df.iterrows():
-        cursor.execute('''
-            INSERT OR REPLACE INTO monthly_price_data (ins_id, date, open, high, low, close, volume)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (ins_id, row['date'], row['open'], row['high'], row['low'], row['close'], row['volume']))
-    conn.commit()
-    conn.close()
-    print(f"Monthly price data for ins_id {ins_id} saved to database.")
+def save_price_data_to_db(df, ins_id=None):
+    rows = db.write_prices(df, ins_id)
+    if ins_id is None:
+        print(f"Monthly price data for {df['ins_id'].nunique()} instruments ({rows} rows) saved to database.")
+    else:
+        print(f"Monthly price data for ins_id {ins_id} saved to database.")
 
 # Function to save report data to the database
-def save_report_data_to_db(df, ins_id):
-    conn = connect_db()
-    cursor = conn.cursor()
-    for index, row in df.iterrows():
-        cursor.execute('''
-            INSERT OR REPLACE INTO monthly_report_data (
-                ins_id, year, period, revenues, gross_income, operating_income, profit_before_tax, profit_to_equity_holders,
-                earnings_per_share, number_of_shares, dividend, intangible_assets, tangible_assets, financial_assets,
-                non_current_assets, cash_and_equivalents, current_assets, total_assets, total_equity, non_current_liabilities,
-                current_liabilities, total_liabilities_and_equity, net_debt, cash_flow_from_operating_activities,
-                cash_flow_from_investing_activities, cash_flow_from_financing_activities, cash_flow_for_the_year,
-                free_cash_flow, stock_price_average, stock_price_high, stock_price_low, report_start_date,
-                report_end_date, broken_fiscal_year, currency, currency_ratio, net_sales, report_date
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            ins_id, row.get('year', None), row.get('period', None), row.get('revenues', None), row.get('grossIncome', None), row.get('operatingIncome', None),
-            row.get('profitBeforeTax', None), row.get('profitToEquityHolders', None), row.get('earningsPerShare', None), row.get('numberOfShares', None),
-            row.get('dividend', None), row.get('intangibleAssets', None), row.get('tangibleAssets', None), row.get('financialAssets', None), row.get('nonCurrentAssets', None),
-            row.get('cashAndEquivalents', None), row.get('currentAssets', None), row.get('totalAssets', None), row.get('totalEquity', None), row.get('nonCurrentLiabilities', None),
-            row.get('currentLiabilities', None), row.get('totalLiabilitiesAndEquity', None), row.get('netDebt', None), row.get('cashFlowFromOperatingActivities', None),
-            row.get('cashFlowFromInvestingActivities', None), row.get('cashFlowFromFinancingActivities', None), row.get('cashFlowForTheYear', None),
-            row.get('freeCashFlow', None), row.get('stockPriceAverage', None), row.get('stockPriceHigh', None), row.get('stockPriceLow', None),
-            row.get('reportStartDate', None), row.get('reportEndDate', None),
-            row.get('brokenFiscalYear', None), row.get('currency', None), row.get('currencyRatio', None), row.get('netSales', None), row.get('reportDate', None)
-        ))
-    conn.commit()
-    conn.close()
-    print(f"Report data for ins_id {ins_id} saved to database.")
+def save_report_data_to_db(df, ins_id=None):
+    rows = db.write_reports(df, ins_id)
+    if ins_id is None:
+        print(f"Report data for {df['ins_id'].nunique()} instruments ({rows} rows) saved to database.")
+    else:
+        print(f"Report data for ins_id {ins_id} saved to database.")
 
-# Function to fetch and save monthly price data
-def fetch_and_save_monthly_price_data(ins_id, start_date=None, end_date=None):
-    df = api.get_instrument_stock_prices(ins_id, from_date=start_date, to_date=end_date)
+# Function to aggregate an API price frame to monthly rows for monthly_price_data
+def prepare_monthly_price_data(df):
     df.reset_index(inplace=True)
     df['date'] = pd.to_datetime(df['date'])
     
@@ -69,29 +49,158 @@ def fetch_and_save_monthly_price_data(ins_id, start_date=None, end_date=None):
     }).reset_index()
     
     monthly_df['date'] = monthly_df['date'].dt.strftime('%Y-%m-%d')
-    save_price_data_to_db(monthly_df, ins_id)
+    return monthly_df
+
+# Function to turn an API report frame into rows for monthly_report_data
+def prepare_report_data(df):
+    df.reset_index(inplace=True)  # Ensure the index is reset
+    for date_col in ['reportStartDate', 'reportEndDate', 'reportDate']:
+        if date_col in df.columns:
+            df[date_col] = pd.to_datetime(df[date_col]).dt.strftime('%Y-%m-%d')
+    print(df.head())  # Debug: Print the DataFrame
+    print(df.columns)  # Debug: Print the DataFrame columns
+    return df
+
+# Function to fetch and save monthly price data
+def fetch_and_save_monthly_price_data(ins_id, start_date=None, end_date=None):
+    df = api.get_instrument_stock_prices(ins_id, from_date=start_date, to_date=end_date)
+    save_price_data_to_db(prepare_monthly_price_data(df), ins_id)
 
 # Function to fetch and save report data
 def fetch_and_save_report_data(ins_id):
     quarters, years = api.get_instrument_reports(ins_id)[:2]  # Only fetch quarters and years
     for df in [quarters, years]:
-        df.reset_index(inplace=True)  # Ensure the index is reset
-        for date_col in ['reportStartDate', 'reportEndDate', 'reportDate']:
-            if date_col in df.columns:
-                df[date_col] = pd.to_datetime(df[date_col]).dt.strftime('%Y-%m-%d')
-        print(df.head())  # Debug: Print the DataFrame
-        print(df.columns)  # Debug: Print the DataFrame columns
+        save_report_data_to_db(prepare_report_data(df), ins_id)
+
+# Function to fetch price and report data for many instruments concurrently and save them
+async def fetch_and_save_all_async(instrument_ids, start_date=None, end_date=None, max_in_flight=8, cache=None):
+    async with AsyncBorsdataAPI(API_KEY, max_in_flight=max_in_flight, cache=cache,
+                                metrics=api.metrics) as async_api:
+        prices = await async_api.get_instruments_stock_prices(instrument_ids, from_date=start_date,
+                                                              to_date=end_date, return_exceptions=True)
+        reports = await async_api.get_instruments_reports(instrument_ids, return_exceptions=True)
+    for ins_id in instrument_ids:
+        if isinstance(prices[ins_id], Exception):
+            print(f"Price data for ins_id {ins_id} failed: {prices[ins_id]}")
+        else:
+            save_price_data_to_db(prepare_monthly_price_data(prices[ins_id]), ins_id)
+        if isinstance(reports[ins_id], Exception):
+            print(f"Report data for ins_id {ins_id} failed: {reports[ins_id]}")
+        else:
+            for df in reports[ins_id][:2]:  # Only save quarters and years
+                save_report_data_to_db(prepare_report_data(df), ins_id)
+    db.commit()
+
+# Function to fetch and transform price and report data on pipeline fetch workers
+def fetch_instrument_data(ins_id, start_date=None, end_date=None):
+    df = api.get_instrument_stock_prices(ins_id, from_date=start_date, to_date=end_date)
+    quarters, years = api.get_instrument_reports(ins_id)[:2]  # Only fetch quarters and years
+    return prepare_monthly_price_data(df), [prepare_report_data(quarters), prepare_report_data(years)]
+
+# Function to save the result of fetch_instrument_data on the pipeline writer thread
+def save_instrument_data(ins_id, data):
+    prices, reports = data
+    save_price_data_to_db(prices, ins_id)
+    for df in reports:
         save_report_data_to_db(df, ins_id)
 
+# Function to fetch with parallel workers while a single writer thread saves to the database
+def fetch_and_save_pipelined(instrument_ids, start_date=None, end_date=None, workers=8, commit_every=50):
+    pipeline = IngestPipeline(lambda ins_id: fetch_instrument_data(ins_id, start_date, end_date),
+                              save_instrument_data, commit=db.commit, close=db.close, workers=workers,
+                              commit_every=commit_every)
+    failed = pipeline.run(instrument_ids)
+    for ins_id, error in failed.items():
+        print(f"Data for ins_id {ins_id} failed: {error}")
+
+# Function to fetch price and report data through the instList endpoints, batch_size instruments per call
+def fetch_and_save_batched(instrument_ids, start_date=None, end_date=None, batch_size=50):
+    for i in range(0, len(instrument_ids), batch_size):
+        batch = instrument_ids[i:i + batch_size]
+        prices = api.get_instrument_stock_prices_list(batch, from_date=start_date, to_date=end_date, fill_na=False)
+        for ins_id, df in prices.groupby('stock_id'):
+            save_price_data_to_db(prepare_monthly_price_data(df.drop(columns='stock_id')), ins_id)
+        quarters, years = api.get_instrument_report_list(batch, fill_na=False)[:2]  # Only fetch quarters and years
+        for reports in [quarters, years]:
+            if len(reports):
+                df = report_columns_to_camel_case(reports).rename(columns={'stockId': 'ins_id'})
+                save_report_data_to_db(prepare_report_data(df))
+        db.commit()
+        print(f"Batch {i // batch_size + 1}: {len(batch)} instruments saved.")
+
+# Function to build the monthly (and weekly) tables from the daily database filled by main.py, without the API
+def derive_from_daily_db(weekly=False):
+    create_tables()
+    daily_conn = get_connection(DB_FILE, read_only=True)
+    rows = derive_prices(daily_conn, db, 'month')
+    print(f"Monthly price data: {rows} rows derived from the daily database.")
+    if weekly:
+        weekly_db = BulkWriter(DB_FILE_MONTHLY, price_table='weekly_price_data')
+        rows = derive_prices(daily_conn, weekly_db, 'week')
+        print(f"Weekly price data: {rows} rows derived from the daily database.")
+    rows = derive_reports(daily_conn, db)
+    print(f"Report data: {rows} rows copied from the daily database.")
+
 # Function to fetch instrument list
 def fetch_instrument_list():
     df = api.get_instruments()
     return df.index.tolist()  # Assuming the instrument IDs are in the index
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fetch Borsdata data aggregated to months into the monthly database.")
+    parser.add_argument('--mode', choices=['serial', 'async', 'pipelined', 'batched', 'derive'], default='serial',
+                        help="derive: build the monthly tables from the daily database filled by main.py, "
+                             "without API calls (only new months are rebuilt), "
+                             "serial: one instrument at a time, async: concurrent requests, "
+                             "pipelined: concurrent requests overlapped with database writes, "
+                             "batched: instList endpoints with --batch-size instruments per call")
+    parser.add_argument('--limit', type=int, default=40,
+                        help="Number of instruments to fetch, 0 for all (default 40)")
+    parser.add_argument('--start-date', default="2000-01-01")
+    parser.add_argument('--end-date', default="2024-07-01")
+    parser.add_argument('--max-in-flight', type=int, default=8,
+                        help="Max. concurrent requests in async and pipelined mode")
+    parser.add_argument('--batch-size', type=int, default=50,
+                        help="Instruments per call in batched mode (default 50)")
+    parser.add_argument('--cache', action='store_true',
+                        help="Serve unchanged API responses from the on-disk cache (CACHE_FILE)")
+    parser.add_argument('--metrics', default=None,
+                        help="Write per-endpoint API metrics to this file (Prometheus text for *.prom, else JSON)")
+    parser.add_argument('--weekly', action='store_true',
+                        help="In derive mode, also build weekly_price_data")
+    return parser.parse_args()
+
 # Example usage
 if __name__ == "__main__":
-    instrument_ids = fetch_instrument_list()[:40]  # Fetch data for the first 5 instruments by default
-    for ins_id in instrument_ids:
-        fetch_and_save_monthly_price_data(ins_id, start_date="2000-01-01", end_date="2024-07-01")
-        fetch_and_save_report_data(ins_id)
-    print("Monthly data fetched and saved to database for all instruments.")
+    args = parse_args()
+    if args.mode == 'derive':
+        derive_from_daily_db(args.weekly)
+        db.close()
+        print("Monthly data derived from the daily database.")
+    else:
+        cache = None
+        if args.cache:
+            cache = ResponseCache(CACHE_FILE, max_bytes=CACHE_MAX_BYTES)
+            api = BorsdataAPI(API_KEY, cache=cache)
+        instrument_ids = fetch_instrument_list()
+        if args.limit:
+            instrument_ids = instrument_ids[:args.limit]  # Fetch data for the first 40 instruments by default
+        if args.mode == 'batched':
+            fetch_and_save_batched(instrument_ids, args.start_date, args.end_date, args.batch_size)
+        elif args.mode == 'pipelined':
+            fetch_and_save_pipelined(instrument_ids, args.start_date, args.end_date, args.max_in_flight)
+        elif args.mode == 'async':
+            asyncio.run(fetch_and_save_all_async(instrument_ids, args.start_date, args.end_date, args.max_in_flight,
+                                                 cache))
+        else:
+            for ins_id in instrument_ids:
+                fetch_and_save_monthly_price_data(ins_id, start_date=args.start_date, end_date=args.end_date)
+                fetch_and_save_report_data(ins_id)
+                db.commit()
+        db.close()
+        api.metrics.print_summary()
+        if args.metrics:
+            api.metrics.dump(args.metrics)
+        if cache is not None:
+            print(f"API cache: {cache.stats()}")
+        print("Monthly data fetched and saved to database for all instruments.")
@@ -0,0 +1,69 @@
+import argparse
+import os
+import time
+from borsdata_api.constants import DB_FILE, DB_FILE_MONTHLY
+from helpers.compact_schema import PRICE_SCALE, SCALED_COLUMNS, compact_price_table_sql, is_compact
+from helpers.db_utils import backup_db, open_connection
+from helpers.sync_utils import bump_table_version
+
+# Price tables per database
+TABLES = {
+    'daily': (DB_FILE, ['price_data']),
+    'monthly': (DB_FILE_MONTHLY, ['monthly_price_data', 'weekly_price_data']),
+}
+
+def migrate_table(conn, table):
+    """
+    Rewrite a price table in the compact layout of helpers/compact_schema.py, in one transaction
+    :return: Number of rows migrated
+    """
+    compact_table = f'{table}_compact'
+    scaled = ', '.join(f'CAST(ROUND({col} * {PRICE_SCALE}) AS INTEGER)' for col in SCALED_COLUMNS)
+    conn.execute('BEGIN')
+    conn.execute(f'DROP TABLE IF EXISTS {compact_table}')
+    conn.execute(compact_price_table_sql(compact_table))
+    # julianday() of 1970-01-01 is 2440587.5, so this is the day number of the date
+    rows = conn.execute(f'''
+        INSERT INTO {compact_table} (ins_id, date, open, high, low, close, volume)
+        SELECT ins_id, CAST(julianday(substr(date, 1, 10)) - 2440587.5 AS INTEGER), {scaled},
+               CAST(ROUND(volume) AS INTEGER)
+        FROM {table} ORDER BY ins_id, date
+    ''').rowcount
+    conn.execute(f'DROP TABLE {table}')
+    conn.execute(f'ALTER TABLE {compact_table} RENAME TO {table}')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_date ON {table} (date, ins_id)')
+    bump_table_version(conn, table)
+    conn.commit()
+    return rows
+
+def migrate_database(db_file, tables, backup=True):
+    if not os.path.exists(db_file):
+        print(f"Skipping {db_file}, not found")
+        return
+    conn = open_connection(db_file)
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    tables = [table for table in tables if table in existing and not is_compact(conn, table)]
+    if not tables:
+        print(f"{db_file}: nothing to migrate")
+        conn.close()
+        return
+    if backup:
+        backup_db(db_file)
+    size = os.path.getsize(db_file)
+    for table in tables:
+        start = time.time()
+        rows = migrate_table(conn, table)
+        print(f"Migrated {rows} rows of {table} in {time.time() - start:.1f}s")
+    # give the pages of the old tables back to the file system
+    conn.execute('VACUUM')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    print(f"{db_file}: {size / 1024 ** 2:.1f} MB -> {os.path.getsize(db_file) / 1024 ** 2:.1f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate the price tables to the compact layout.")
+    parser.add_argument('--database', choices=['daily', 'monthly', 'all'], default='all')
+    parser.add_argument('--no-backup', action='store_true', help="Do not back the databases up first")
+    args = parser.parse_args()
+    for database in (['daily', 'monthly'] if args.database == 'all' else [args.database]):
+        migrate_database(*TABLES[database], backup=not args.no_backup)
@@ -1,9 +1,9 @@
 import pandas as pd
 import numpy as np
-import sqlite3
 import matplotlib.pyplot as plt
 import seaborn as sns
-from borsdata_api.constants import DB_FILE_MONTHLY
+from helpers.queries import load_prices, load_rankings, memory_mb
+from helpers.storage import get_storage
 import openpyxl
 from openpyxl import Workbook
 from openpyxl.drawing.image import Image
@@ -12,9 +12,9 @@ import statsmodels.api as sm
 import shutil
 from datetime import datetime
 
-# Connect to the SQLite database for monthly data
+# Connect read-only to the SQLite database for monthly data
 def connect_db():
-    return sqlite3.connect(DB_FILE_MONTHLY)
+    return get_storage('monthly', read_only=True)
 
 def calculate_portfolio_returns(df, factor, holding_period='quarterly'):
     if factor not in df.columns:
@@ -177,11 +177,11 @@ def save_results_to_excel(factor, period, metrics, df_with_portfolio, writer, ex
         worksheet[f'A{161 + i}'] = f"Quartile {portfolio}: {count}"
 
 def main():
-    conn = connect_db()
+    storage = connect_db()
 
-    # Read factor rankings and price data from the database
-    factor_df = pd.read_sql_query("SELECT * FROM factor_rankings", conn)
-    price_df = pd.read_sql_query("SELECT ins_id, date, close FROM monthly_price_data", conn)
+    # Read factor rankings and price data
+    factor_df = load_rankings(storage=storage)
+    price_df = load_prices(columns=['close'], period='month', storage=storage)
 
     # Ensure date is in datetime format
     factor_df['date'] = pd.to_datetime(factor_df['date'])
@@ -189,6 +189,7 @@ def main():
 
     # Merge factor rankings with price data
     df = pd.merge(factor_df, price_df, on=['ins_id', 'date'])
+    print(f"Backtest frame: {len(df)} rows, {memory_mb(df):.1f} MB")
 
     output_dir = 'output'
     os.makedirs(output_dir, exist_ok=True)
@@ -230,7 +231,6 @@ def main():
 
     writer.book.save(output_file)
     writer.close()
-    conn.close()
 
 if __name__ == "__main__":
     try: